@@ -0,0 +1,216 @@
+"""
+Async variants of the read heavy views, routed instead of their ``APIView``
+counterparts in ``marketplace.views`` when ``settings.ASYNC_VIEWS`` is set,
+which is how the project runs under ASGI (uvicorn). They use Django's async
+ORM, so a worker keeps serving other requests while one waits on the
+database.
+
+DRF views are synchronous. ``AsyncAPIView`` implements the part of them these
+GET endpoints use: authentication, permissions, DRF's exception handling and
+JSON rendering, so the responses are the same as the sync views'.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import prefetch_related_objects
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from . import views
+from .authentication import CachedJWTAuthentication
+from .cache import (
+    anot_modified,
+    cache_catalog_response,
+    detail_cache_key,
+    image_cache_key,
+    list_cache_key,
+    textbook_etag,
+)
+from .fieldsets import LIST_COLUMNS, get_fieldset, list_rows
+from .filters import LiveTextbookFilter, TextbookFilter, afacet_counts
+from .live import Subscriber, get_broker
+from .metrics import timer
+from .models import Textbook, User
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .seller_stats import aget_seller_stats
+from .serializers import SellerStatsSerializer, TextbookSerializer, UserSerializer
+
+
+class AsyncAPIView(View):
+    http_method_names = ['get', 'head']
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = []
+    renderer = FastJSONRenderer()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like DRF's APIView, CSRF is the authentication classes' concern:
+        # session authentication enforces it, bearer tokens don't need it.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        # DRF's request wrapper, for query_params and request.user/auth.
+        self.request = request = Request(request)
+        try:
+            await self.initial(request)
+            if request.method.lower() not in self.http_method_names:
+                raise exceptions.MethodNotAllowed(request.method)
+            response = await getattr(self, request.method.lower())(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        return response
+
+    async def initial(self, request):
+        # Like DRF, authenticate every request up front, so a bad token
+        # fails even on public endpoints.
+        user, auth = AnonymousUser(), None
+        for authentication_class in self.authentication_classes:
+            authenticator = authentication_class()
+            result = await authenticator.aauthenticate(request)
+            if result is not None:
+                (user, auth), self.authenticator = result, authenticator
+                break
+        request.user, request.auth = user, auth
+
+        for permission_class in self.permission_classes:
+            permission = permission_class()
+            if not permission.has_permission(request, self):
+                if auth is None:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            exc.auth_header = self.authentication_classes[0]().authenticate_header(self.request)
+        response = exception_handler(exc, {'view': self, 'request': self.request})
+        if response is None:
+            raise exc
+        headers = {name: value for name, value in response.items() if name != 'Content-Type'}
+        return self.render(response.data, status=response.status_code, headers=headers)
+
+    def render(self, data, status=status.HTTP_200_OK, headers=None):
+        with timer('render'):
+            content = self.renderer.render(data)
+        return HttpResponse(content, status=status, headers=headers, content_type=self.renderer.media_type)
+
+
+class AsyncTextbookListView(AsyncAPIView):
+    http_method_names = ['get', 'head', 'post']
+    pagination_class = KeysetPagination
+    filterset_class = TextbookFilter
+    # Listings are created by the sync view, with DRF's parsers and
+    # serializer validation.
+    create_view = staticmethod(views.TextbookListView.as_view())
+
+    @cache_catalog_response(list_cache_key)
+    async def get(self, request):
+        serializer_class, fields = get_fieldset(request)
+        queryset = Textbook.objects.select_related('seller')
+        filterset = self.filterset_class(request.query_params, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            return self.render(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        textbooks = filterset.qs
+
+        paginator = self.pagination_class()
+        rows, serialize = list_rows(textbooks, serializer_class, fields, keep=LIST_COLUMNS)
+        page = await paginator.apaginate_queryset(rows, request, view=self)
+        with timer('serialize'):
+            data = serialize(page)
+        data = paginator.get_paginated_data(data)
+        if paginator.cursor is None:
+            data['facets'] = await afacet_counts(textbooks)
+            username = filterset.form.cleaned_data['username']
+            if username:
+                stats = await aget_seller_stats(username)
+                data['seller'] = SellerStatsSerializer(stats).data if stats is not None else None
+        return self.render(data)
+
+    async def post(self, request):
+        response = await sync_to_async(self.create_view)(request._request)
+        return await sync_to_async(response.render)()
+
+
+class AsyncTextbookDetailView(AsyncAPIView):
+
+    @cache_catalog_response(lambda request, pk: detail_cache_key(pk))
+    async def get(self, request, pk):
+        textbook = await aget_object_or_404(Textbook.objects.select_related('seller'), pk=pk)
+        etag = textbook_etag(textbook)
+        last_modified = int(textbook.updated_at.timestamp())
+        response = await anot_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        with timer('serialize'):
+            data = TextbookSerializer(textbook).data
+        response = self.render(data, headers={'ETag': etag})
+        response.last_modified = last_modified
+        return response
+
+
+class AsyncSellerDetailView(AsyncAPIView):
+
+    async def get(self, request, username):
+        stats = await aget_seller_stats(username)
+        if stats is None:
+            raise Http404
+        return self.render(SellerStatsSerializer(stats).data)
+
+
+class AsyncTextbookImageView(AsyncAPIView):
+
+    @cache_catalog_response(lambda request, pk: image_cache_key(pk))
+    async def get(self, request, pk):
+        image = await aget_object_or_404(Textbook.objects.values_list('image', flat=True), pk=pk)
+        with timer('images'):
+            url = Textbook(image=image).image.url if image else None
+        return self.render({'image': url})
+
+
+class AsyncUserDetailView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        user = request.user
+        if user.get_deferred_fields():
+            # Built from the token claims, the serializer needs the whole row.
+            user = await User.objects.aget(pk=user.pk)
+        # The serializer lists the user's groups and permissions.
+        await sync_to_async(prefetch_related_objects)([user], 'groups', 'user_permissions')
+        with timer('serialize'):
+            data = UserSerializer(user).data
+        return self.render(data)
+
+
+class AsyncTextbookLiveView(AsyncAPIView):
+    """Server-Sent Events of the listings matching the filters, see ``marketplace.live``."""
+    filterset_class = LiveTextbookFilter
+
+    async def get(self, request):
+        filterset = self.filterset_class(request.query_params, queryset=Textbook.objects.none(), request=request)
+        if not filterset.is_valid():
+            return self.render(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        interests = filterset.form.cleaned_data
+        subscriber = Subscriber(interests['school_class'], interests['price_min'], interests['price_max'])
+        broker = get_broker()
+        broker.subscribe(subscriber)
+        response = StreamingHttpResponse(self.stream(broker, subscriber), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Or nginx holds the events back in its buffer.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, broker, subscriber):
+        try:
+            # EventSource's reconnection delay, and the headers go out now.
+            yield b'retry: 5000\n\n'
+            async for data in subscriber.frames(settings.LIVE_HEARTBEAT_SECONDS):
+                yield data
+        finally:
+            broker.unsubscribe(subscriber)
@@ -0,0 +1,182 @@
+"""
+JWT authentication for the API.
+
+``CachedJWTAuthentication`` keeps the users it resolves for
+``JWT_USER_CACHE_TIMEOUT`` seconds, so authenticated requests don't load the
+user row every time. ``JWT_USER_CACHE`` selects where:
+
+* ``shared`` (the default): the ``JWT_USER_CACHE_ALIAS`` Django cache. Saves
+  and deletes evict the user for every process sharing it, so a deactivated
+  or deleted user is refused right away. Like the catalog cache, that takes
+  a backend shared by the workers (``CACHE_BACKEND``), LocMem is per process.
+* ``local``: an LRU of ``JWT_USER_CACHE_SIZE`` users per process, no cache
+  round trip. Saves and deletes evict the user in the process making them,
+  other processes may use the old row, of a deactivated user too, until it
+  expires: for a single process, or when that delay is acceptable.
+* ``stateless``: no lookup, the user is built from the claims of the token
+  (``get_token_claims``) with the other fields deferred. Refreshed access
+  tokens keep the claims of the login, so changes, deactivation included,
+  only apply once the user logs in again. Tokens issued without the claims
+  fall back to ``local``.
+* ``off``: load the user on every request like simplejwt does.
+
+Writes that bypass ``User.save()`` (``QuerySet.update``) must call
+``invalidate_user``.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .metrics import timer
+
+# Copied into tokens so the ``stateless`` mode can build users from them.
+TOKEN_USER_CLAIMS = ('username', 'is_active', 'is_staff', 'is_superuser', 'is_seller')
+
+
+class LocalUserCache:
+    """Thread safe LRU of user instances with a time to live."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+        # Requests may modify request.user, never hand out the cached instance.
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + settings.JWT_USER_CACHE_TIMEOUT, copy.copy(user))
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > settings.JWT_USER_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_user_cache = LocalUserCache()
+
+
+def _shared_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def get_cached_user(user_id):
+    if settings.JWT_USER_CACHE == 'shared':
+        return caches[settings.JWT_USER_CACHE_ALIAS].get(_shared_key(user_id))
+    return local_user_cache.get(str(user_id))
+
+
+def cache_user(user):
+    if settings.JWT_USER_CACHE == 'shared':
+        caches[settings.JWT_USER_CACHE_ALIAS].set(_shared_key(user.pk), user, settings.JWT_USER_CACHE_TIMEOUT)
+    else:
+        local_user_cache.set(str(user.pk), user)
+
+
+def invalidate_user(user_id):
+    local_user_cache.delete(str(user_id))
+    if settings.JWT_USER_CACHE == 'shared':
+        caches[settings.JWT_USER_CACHE_ALIAS].delete(_shared_key(user_id))
+
+
+def get_token_claims(user):
+    return {claim: getattr(user, claim) for claim in TOKEN_USER_CLAIMS}
+
+
+def user_from_claims(validated_token):
+    """A ``User`` with the fields carried by the token, ``None`` for tokens without them."""
+    from .models import User
+
+    if any(claim not in validated_token for claim in TOKEN_USER_CLAIMS):
+        return None
+    values = {claim: validated_token[claim] for claim in TOKEN_USER_CLAIMS}
+    values[api_settings.USER_ID_FIELD] = validated_token[api_settings.USER_ID_CLAIM]
+    # from_db() wants the values in field order and defers the missing ones,
+    # code needing e.g. the email loads it on access.
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` reporting its time as the ``auth`` request phase."""
+
+    def authenticate(self, request):
+        with timer('auth'):
+            return super().authenticate(request)
+
+    async def aauthenticate(self, request):
+        if self.get_header(request) is None:
+            return None
+        # Loading the user is a query, it has to run outside the event loop.
+        return await sync_to_async(self.authenticate)(request)
+
+
+class CachedJWTAuthentication(TimedJWTAuthentication):
+    """Resolves token users from a cache instead of the database, see the module docstring."""
+
+    def get_user(self, validated_token):
+        user = self.get_user_without_query(validated_token)
+        if user is not None:
+            return user
+        user = super().get_user(validated_token)
+        if settings.JWT_USER_CACHE != 'off':
+            cache_user(user)
+        return user
+
+    def get_user_without_query(self, validated_token):
+        """The user from the token or the cache, ``None`` when it has to be loaded."""
+        mode = settings.JWT_USER_CACHE
+        if mode == 'off' or api_settings.USER_ID_CLAIM not in validated_token:
+            return None
+        if mode == 'stateless':
+            user = user_from_claims(validated_token)
+            if user is not None:
+                return user
+        user = get_cached_user(validated_token[api_settings.USER_ID_CLAIM])
+        if user is not None and api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None or settings.JWT_USER_CACHE not in ('local', 'stateless'):
+            return await super().aauthenticate(request)
+        # Token checks are CPU only and these caches are in memory, so only a
+        # cache miss needs a thread.
+        with timer('auth'):
+            raw_token = self.get_raw_token(header)
+            if raw_token is None:
+                return None
+            validated_token = self.get_validated_token(raw_token)
+            user = self.get_user_without_query(validated_token)
+        if user is None:
+            return await super().aauthenticate(request)
+        return user, validated_token
@@ -0,0 +1,288 @@
+"""
+Building blocks of the ``benchmark_*`` management commands: latency
+percentiles, concurrent HTTP load and a throwaway gunicorn server.
+"""
+import http.client
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from .bulk import close_db_connections
+
+SERVER_TIMING_QUERIES_RE = re.compile(r'\bdb;[^,]*desc="(\d+) queries"')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(latencies_ms, elapsed_s, errors=0):
+    if not latencies_ms:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies_ms),
+        'errors': errors,
+        'mean_ms': round(statistics.fmean(latencies_ms), 3),
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p95_ms': round(percentile(latencies_ms, 95), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+        'throughput_rps': round(len(latencies_ms) / elapsed_s, 1) if elapsed_s else None,
+    }
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                # The process name may contain spaces, the ppid follows it.
+                if int(stat.read().rsplit(')', 1)[1].split()[1]) == pid:
+                    children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+def _process_status_mb(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith(f'{field}:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def process_peak_rss_mb(pid):
+    """``VmHWM`` of a process from ``/proc``, ``None`` where that isn't available."""
+    return _process_status_mb(pid, 'VmHWM')
+
+
+def process_rss_mb(pid):
+    """Current ``VmRSS`` of a process, ``None`` where that isn't available."""
+    return _process_status_mb(pid, 'VmRSS')
+
+
+def reset_peak_rss(pid):
+    """Restart the ``VmHWM`` of a process from its current RSS, ``False`` where that isn't possible."""
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    return True
+
+
+@contextmanager
+def measure_memory(pids):
+    """
+    Memory of the processes ``pids`` during the block, in the yielded dict
+    once it ends: ``peak_rss_mb``, the highest RSS of any of them, and
+    ``rss_growth_mb``, the most one of them grew above its RSS at the start.
+    Where peaks can't be reset they are the processes' lifetime peaks and the
+    growth is ``None``.
+    """
+    reset = all([reset_peak_rss(pid) for pid in pids])
+    before = {pid: process_rss_mb(pid) for pid in pids}
+    memory = {}
+    yield memory
+    peaks = {pid: process_peak_rss_mb(pid) for pid in pids}
+    known = [pid for pid in pids if peaks[pid] is not None and before[pid] is not None]
+    memory['peak_rss_mb'] = max((peaks[pid] for pid in known), default=None)
+    memory['rss_growth_mb'] = round(max(peaks[pid] - before[pid] for pid in known), 1) if reset and known else None
+
+
+def server_timing_queries(headers):
+    """The query count ``MetricsMiddleware`` put in a response's ``Server-Timing``, ``None`` without one."""
+    for name, value in headers.items():
+        if name.lower() == 'server-timing':
+            match = SERVER_TIMING_QUERIES_RE.search(value)
+            return int(match.group(1)) if match else None
+    return None
+
+
+def process_cpu_seconds(pid):
+    """User and system CPU time a process used so far, ``None`` where that isn't available."""
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            # Fields after the process name, utime and stime are the 14th and 15th.
+            fields = stat.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class GunicornServer:
+    """
+    Runs the project under gunicorn on a free local port for the duration of
+    a ``with`` block. ``env`` is merged into the environment, so settings read
+    through ``decouple.config`` (e.g. ``DB_NAME``) can be overridden.
+    """
+
+    def __init__(self, workers=2, worker_class='sync', threads=1, env=None, app='textbook_marketplace.wsgi:application'):
+        self.workers = workers
+        self.worker_class = worker_class
+        self.threads = threads
+        self.env = env or {}
+        self.app = app
+        self.port = free_port()
+        self.process = None
+
+    def __enter__(self):
+        command = [
+            sys.executable, '-m', 'gunicorn', self.app,
+            '--bind', f'127.0.0.1:{self.port}',
+            '--workers', str(self.workers),
+            '--worker-class', self.worker_class,
+            '--threads', str(self.threads),
+            '--log-level', 'warning',
+        ]
+        self.process = subprocess.Popen(command, cwd=settings.BASE_DIR, env={**os.environ, **self.env})
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with code {self.process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.2).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError('gunicorn did not start listening within 30s')
+
+    def __exit__(self, *exc_info):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def worker_pids(self, timeout=10):
+        """The pids of the workers, once all of them are forked."""
+        deadline = time.monotonic() + timeout
+        while True:
+            pids = child_pids(self.process.pid)
+            if len(pids) >= self.workers or time.monotonic() > deadline:
+                return pids
+            time.sleep(0.1)
+
+    def worker_peak_rss_mb(self):
+        peaks = [process_peak_rss_mb(pid) for pid in child_pids(self.process.pid)]
+        peaks = [peak for peak in peaks if peak is not None]
+        return max(peaks) if peaks else None
+
+    def total_peak_rss_mb(self):
+        """Summed peak RSS of the arbiter and all workers, the server's memory footprint."""
+        peaks = [process_peak_rss_mb(pid) for pid in [self.process.pid] + child_pids(self.process.pid)]
+        peaks = [peak for peak in peaks if peak is not None]
+        return round(sum(peaks), 1) if peaks else None
+
+
+def http_request(connection, method, path, body=None, headers=None):
+    """Send a request over a kept-alive ``http.client`` connection, return ``(status, headers, body)``."""
+    headers = dict(headers or {})
+    if body is not None and not isinstance(body, (bytes, str)):
+        body = json.dumps(body)
+        headers.setdefault('Content-Type', 'application/json')
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, dict(response.getheaders()), response.read()
+
+
+def run_concurrent(port, build_request, total, concurrency):
+    """
+    Fire ``total`` requests at ``127.0.0.1:port`` from ``concurrency`` threads,
+    each on its own kept-alive connection. ``build_request(i)`` returns
+    ``(method, path, body, headers)``.
+
+    Returns ``(latencies_ms, errors, elapsed_s, responses)`` where
+    ``responses`` holds ``(status, headers)`` of every request.
+    """
+    latencies, responses = [], []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local_latencies, local_responses, local_errors = [], [], 0
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            method, path, body, headers = build_request(i)
+            started = time.perf_counter()
+            try:
+                status, response_headers, _ = http_request(connection, method, path, body, headers)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                local_errors += 1
+                continue
+            local_latencies.append((time.perf_counter() - started) * 1000)
+            local_responses.append((status, response_headers))
+            if status >= 400:
+                local_errors += 1
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            responses.extend(local_responses)
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started, responses
+
+
+@contextmanager
+def benchmark_database(keepdb=True, verbosity=0):
+    """
+    Create (or reuse with ``keepdb``) the ``test_<name>`` database and point
+    this process, its forked workers and spawned servers at it.
+    """
+    original_name = connection.settings_dict['NAME']
+    original_env = os.environ.get('DB_NAME')
+    test_name = connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False, keepdb=keepdb,
+    )
+    os.environ['DB_NAME'] = test_name
+    try:
+        yield test_name
+    finally:
+        if original_env is None:
+            os.environ.pop('DB_NAME', None)
+        else:
+            os.environ['DB_NAME'] = original_env
+        if keepdb:
+            close_db_connections()
+            settings.DATABASES[connection.alias]['NAME'] = original_name
+            connection.settings_dict['NAME'] = original_name
+        else:
+            connection.creation.destroy_test_db(original_name, verbosity=verbosity)
@@ -0,0 +1,79 @@
+"""
+Helpers for management commands that write rows in bulk across processes.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.db import connections
+
+
+def init_worker():
+    # Processes started with "spawn" (macOS, Windows) don't inherit the
+    # configured app registry, forked ones make this a no-op.
+    django.setup()
+
+
+def close_db_connections():
+    """Close all connections and connection pools, forked workers must not share their sockets."""
+    for connection in connections.all():
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+
+
+def iter_chunks(count, batch_size):
+    """Yield ``(chunk_index, start, size)`` covering ``range(count)``."""
+    for index, start in enumerate(range(0, count, batch_size)):
+        yield index, start, min(batch_size, count - start)
+
+
+def run_chunks(task, count, batch_size, workers, *args):
+    """
+    Call ``task(chunk_index, start, size, *args)`` for every chunk of
+    ``count`` rows, on ``workers`` processes (inline when ``workers`` is 1),
+    and yield each task's result as it completes.
+
+    Tasks should derive any randomness from ``chunk_index`` so the output
+    does not depend on the number of workers or on scheduling.
+    """
+    chunks = list(iter_chunks(count, batch_size))
+    if workers == 1:
+        for chunk in chunks:
+            yield task(*chunk, *args)
+        return
+    close_db_connections()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(task, *chunk, *args) for chunk in chunks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+class Progress:
+    """Prints ``done/total`` and the throughput every ``every`` seconds."""
+
+    def __init__(self, stdout, total, unit='rows', every=2.0):
+        self.stdout = stdout
+        self.total = total
+        self.unit = unit
+        self.every = every
+        self.done = 0
+        self.started = self.last_report = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+    def advance(self, amount):
+        self.done += amount
+        now = time.perf_counter()
+        if now - self.last_report >= self.every or self.done >= self.total:
+            self.last_report = now
+            self.stdout.write(f'{self.done}/{self.total} {self.unit}, {self.rate:,.0f} {self.unit}/s')
+
+    def summary(self):
+        return f'{self.done} {self.unit} in {self.elapsed:.1f}s ({self.rate:,.0f} {self.unit}/s)'
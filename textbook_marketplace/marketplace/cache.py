@@ -0,0 +1,241 @@
+"""
+Response cache for the read heavy catalog endpoints.
+
+Entries are keyed by a catalog version: a global one for the whole catalog
+and one per seller id for ``?username=`` listings, the username resolved to
+the id through the cache. ``post_save``/``post_delete`` of ``Textbook`` bump
+those versions (see ``marketplace.signals``), which
+orphans every entry built from the old data instead of hunting for keys to
+delete. Cached entries keep their rendered JSON body together with a strong
+``ETag`` (and ``Last-Modified`` for a single listing), so both hits and
+conditional requests skip the database and serialization entirely.
+
+Lists have no ``Last-Modified``: the newest ``updated_at`` of a page doesn't
+change when one of its rows is deleted or another one enters it, and a client
+revalidating with ``If-Modified-Since`` would keep a stale page. Their
+``ETag`` is the hash of the body. Their ``next``/``previous`` links are
+absolute, so they are cached per host.
+
+Works with any Django cache backend. LocMem is per process, so use a shared
+backend (file, database, memcached, redis) when running several workers.
+With read replicas, misses are built from the primary so replica lag never
+gets cached (see ``marketplace.routers``).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .metrics import timer
+from .models import User
+from .routers import use_primary
+
+STATS = ('hits', 'misses', 'invalidations', 'not_modified')
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def record(stat, delta=1):
+    cache = get_cache()
+    key = f'catalog:stats:{stat}'
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def cache_stats():
+    cache = get_cache()
+    values = cache.get_many([f'catalog:stats:{stat}' for stat in STATS])
+    return {stat: values.get(f'catalog:stats:{stat}', 0) for stat in STATS}
+
+
+def _version_key(seller_id=None):
+    if seller_id is None:
+        return 'catalog:version'
+    return f'catalog:version:seller:{seller_id}'
+
+
+def _seller_key(username):
+    # Usernames come straight from the query string, keep keys backend safe.
+    return f'catalog:seller:{hashlib.md5(username.encode("utf-8")).hexdigest()}'
+
+
+def seller_id_for(username):
+    """The id of the user ``username``, ``None`` if there is none, cached."""
+    cache = get_cache()
+    key = _seller_key(username)
+    seller_id = cache.get(key)
+    if seller_id is None:
+        # 0 remembers that there is no such user.
+        seller_id = User.objects.filter(username=username).values_list('pk', flat=True).first() or 0
+        cache.set(key, seller_id, settings.CATALOG_CACHE_TIMEOUT)
+    return seller_id or None
+
+
+def forget_seller(username):
+    """Drop the cached id of ``username``, after the user is saved or deleted."""
+    get_cache().delete(_seller_key(username))
+
+
+def catalog_version(seller_id=None):
+    cache = get_cache()
+    key = _version_key(seller_id)
+    version = cache.get(key)
+    if version is None:
+        # Never restart from a small number after an eviction, that could
+        # bring entries of an older catalog state back to life.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_catalog_version(seller_id=None):
+    """
+    Invalidate every cached listing, and the listings of the seller
+    ``seller_id`` when given. Call it after writes that bypass model signals,
+    e.g. ``bulk_create`` or ``QuerySet.update``.
+    """
+    cache = get_cache()
+    for key in [_version_key()] + ([_version_key(seller_id)] if seller_id is not None else []):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+    record('invalidations')
+
+
+def invalidate_textbook(pk):
+    get_cache().delete_many([detail_cache_key(pk), image_cache_key(pk)])
+
+
+def list_cache_key(request):
+    # A listing restricted to one seller only depends on that seller's rows;
+    # one of a user that doesn't exist (yet) on the whole catalog's.
+    username = request.query_params.get('username')
+    seller_id = seller_id_for(username) if username else None
+    # The body links to the next and previous pages on the request's host.
+    digest = hashlib.md5(f'{request.get_host()}{request.get_full_path()}'.encode('utf-8')).hexdigest()
+    return f'catalog:list:{catalog_version(seller_id)}:{digest}'
+
+
+def detail_cache_key(pk):
+    return f'catalog:textbook:{pk}'
+
+
+def image_cache_key(pk):
+    return f'catalog:textbook:{pk}:image'
+
+
+def textbook_etag(textbook):
+    return quote_etag(f'{textbook.pk}-{textbook.updated_at.timestamp():.6f}')
+
+
+def _build_response(entry):
+    response = HttpResponse(entry['body'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    if entry['last_modified'] is not None:
+        response['Last-Modified'] = http_date(entry['last_modified'])
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """``304`` response for a conditional GET that matches, otherwise ``None``."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        record('not_modified')
+    return response
+
+
+async def anot_modified(request, etag, last_modified=None):
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        await sync_to_async(record)('not_modified')
+    return response
+
+
+def _cached_response(request, key):
+    """The response for a cached ``key``, ``None`` on a miss."""
+    entry = get_cache().get(key)
+    if entry is None:
+        record('misses')
+        return None
+    record('hits')
+    return not_modified(request, entry['etag'], entry['last_modified']) or _build_response(entry)
+
+
+def _store_response(request, key, response):
+    """Cache a rendered ``response`` and return what to send."""
+    last_modified = getattr(response, 'last_modified', None)
+    entry = {
+        'body': response.content,
+        'content_type': response['Content-Type'],
+        'etag': response.get('ETag') or quote_etag(hashlib.sha256(response.content).hexdigest()),
+        'last_modified': last_modified,
+    }
+    get_cache().set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+    response['ETag'] = entry['etag']
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return not_modified(request, entry['etag'], last_modified) or response
+
+
+def cache_catalog_response(key_func):
+    """
+    Cache the rendered ``200`` JSON responses of an ``APIView.get``, or of
+    an async view's ``get`` returning rendered responses.
+
+    The wrapped method may set ``response.last_modified`` (epoch seconds) and
+    an ``ETag`` header; without an ``ETag`` one is derived from the rendered
+    body.
+    """
+    def decorator(method):
+        if iscoroutinefunction(method):
+            def lookup(request, *args, **kwargs):
+                key = key_func(request, *args, **kwargs)
+                return key, _cached_response(request, key)
+
+            @wraps(method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                if not settings.CATALOG_CACHE_ENABLED:
+                    return await method(self, request, *args, **kwargs)
+                # Cache backends are synchronous, keep them off the event loop.
+                key, response = await sync_to_async(lookup)(request, *args, **kwargs)
+                if response is not None:
+                    return response
+                with use_primary():
+                    response = await method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                return await sync_to_async(_store_response)(request, key, response)
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if not settings.CATALOG_CACHE_ENABLED or request.accepted_renderer.format != 'json':
+                return method(self, request, *args, **kwargs)
+
+            key = key_func(request, *args, **kwargs)
+            response = _cached_response(request, key)
+            if response is not None:
+                return response
+
+            with use_primary():
+                response = method(self, request, *args, **kwargs)
+            if response.status_code != 200 or not hasattr(response, 'render'):
+                return response
+            response = self.finalize_response(request, response, *args, **kwargs)
+            with timer('render'):
+                response.render()
+            return _store_response(request, key, response)
+        return wrapper
+    return decorator
@@ -0,0 +1,235 @@
+"""
+Bulk import of a seller's listings from CSV or NDJSON.
+
+Rows are decoded and validated one at a time as the file is read
+(``TextbookImportSerializer``) and written ``IMPORT_BATCH_SIZE`` at a time
+with ``bulk_create``, or ``bulk_update`` for rows whose ``id`` is one of the
+seller's listings, so an export can be edited and imported back. Invalid rows
+are skipped and reported by row number, the others are imported.
+
+Cover images come in an optional ZIP archive, the ``image`` column names the
+file in it; without an archive the column is ignored and updated listings
+keep their images. Images are stored as they are read; those no listing
+references at the end, of rows rejected later on or of a failed batch, are
+released again. Their renditions are not created here, the caller queues
+them (see ``CatalogImporter.images``).
+
+Bulk writes skip model signals, so the catalog cache, the seller's
+statistics, the suggestions, the change feed and live updates are kept up
+to date here.
+"""
+import csv
+import io
+import json
+import posixpath
+import zipfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from .cache import bump_catalog_version, invalidate_textbook
+from .changes import textbooks_changed
+from .live import publish_saved
+from .models import Textbook
+from .seller_stats import listings_added, recompute_seller_stats
+from .serializers import TextbookImportSerializer
+from .storage import lock_image, release_image
+from .suggest import terms_changed
+
+FORMATS = ('csv', 'ndjson')
+# Postgres compares every row with every WHEN of bulk_update()'s CASEs, keep
+# them short.
+BULK_UPDATE_BATCH_SIZE = 100
+
+
+def import_format(filename):
+    """``csv`` or ``ndjson`` after the extension of ``filename``, ``None`` if it is neither."""
+    extension = posixpath.splitext(filename or '')[1].lower()
+    return {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}.get(extension)
+
+
+def read_rows(binary_file, file_format):
+    """
+    Yield ``(row number, row)`` from a CSV or NDJSON file opened in binary
+    mode. Rows that can't be decoded are yielded as ``ValidationError``.
+    """
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            # Empty cells are missing values, a column the export leaves
+            # empty (e.g. id) must not fail validation.
+            yield number, {key: value for key, value in row.items() if key and value not in ('', None)}
+        return
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield number, ValidationError({'non_field_errors': [f'Invalid JSON: {exc}']})
+            continue
+        if not isinstance(row, dict):
+            row = ValidationError({'non_field_errors': ['Expected a JSON object.']})
+        yield number, row
+
+
+class CatalogImporter:
+    """Imports rows as listings of ``seller``, see the module docstring."""
+
+    def __init__(self, seller, images=None, batch_size=None):
+        self.seller = seller
+        self.archive = zipfile.ZipFile(images) if images is not None else None
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.serializer = TextbookImportSerializer()
+        self.storage = Textbook._meta.get_field('image').storage
+        self.stored_images = {}
+        # Stored names of the imported images, to create renditions for.
+        self.images = set()
+        self.report = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+
+    def run(self, rows):
+        batch = []
+        try:
+            try:
+                for number, row in rows:
+                    data = self.validate(number, row)
+                    if data is None:
+                        continue
+                    batch.append((number, data))
+                    if len(batch) == self.batch_size:
+                        self.write(batch)
+                        batch = []
+            except (UnicodeDecodeError, csv.Error) as exc:
+                self.report['errors'].append(
+                    {'row': None, 'errors': {'non_field_errors': [f'Unreadable file: {exc}']}},
+                )
+            if batch:
+                self.write(batch)
+        finally:
+            self.release_unused_images()
+            if self.report['created'] or self.report['updated']:
+                bump_catalog_version(seller_id=self.seller.pk)
+        return self.report
+
+    def error(self, number, errors):
+        self.report['errors'].append({'row': number, 'errors': errors})
+
+    def validate(self, number, row):
+        """The model field values of a valid row, ``None`` after reporting an invalid one."""
+        if isinstance(row, ValidationError):
+            self.error(number, row.detail)
+            return None
+        try:
+            data = self.serializer.run_validation(row)
+        except ValidationError as exc:
+            self.error(number, exc.detail)
+            return None
+        image = data.pop('image', None)
+        if image and self.archive is not None:
+            try:
+                data['image'] = self.store_image(image)
+            except ValueError as exc:
+                self.error(number, {'image': [str(exc)]})
+                return None
+        return data
+
+    def store_image(self, member):
+        if member in self.stored_images:
+            return self.stored_images[member]
+        try:
+            info = self.archive.getinfo(member)
+        except KeyError:
+            raise ValueError(f'{member} is not in the images archive.')
+        if info.file_size > settings.IMPORT_MAX_IMAGE_SIZE:
+            raise ValueError(f'{member} is larger than {settings.IMPORT_MAX_IMAGE_SIZE} bytes.')
+        content = self.archive.read(info)
+        try:
+            Image.open(io.BytesIO(content)).verify()
+        except Exception:
+            raise ValueError(f'{member} is not a valid image.')
+        # Content addressed, a cover shared by many listings is stored once.
+        name = self.storage.save(posixpath.basename(member), ContentFile(content))
+        self.stored_images[member] = name
+        self.images.add(name)
+        return name
+
+    def keep_images(self, names):
+        """
+        Lock the stored images of a batch until it commits, storing again
+        those a release deleted since they were stored, see marketplace.storage.
+        """
+        members = {name: member for member, name in self.stored_images.items()}
+        for name in sorted(names & set(members)):
+            lock_image(name)
+            if not self.storage.exists(name):
+                self.storage.save(members[name], ContentFile(self.archive.read(members[name])))
+
+    def release_unused_images(self):
+        """
+        Release the stored images no listing references: those of rows
+        rejected after their image was stored, or of a batch that failed.
+        """
+        referenced = set(
+            Textbook.objects.filter(image__in=self.images).order_by().values_list('image', flat=True).distinct()
+        )
+        for name in self.images - referenced:
+            # Checks the references again, under the image's lock.
+            if release_image(Textbook(image=name).image):
+                self.images.discard(name)
+
+    def write(self, batch):
+        ids = [data['id'] for _, data in batch if data.get('id') is not None]
+        existing = Textbook.objects.filter(seller=self.seller).in_bulk(ids) if ids else {}
+        creates, updates, fields, unchanged = [], {}, {'updated_at'}, 0
+        # bulk_update() doesn't apply auto_now.
+        now = timezone.now()
+        for number, data in batch:
+            pk = data.pop('id', None)
+            if pk is None:
+                creates.append(Textbook(seller=self.seller, **data))
+                continue
+            textbook = existing.get(pk)
+            if textbook is None:
+                self.error(number, {'id': [f'You have no listing with id {pk}.']})
+                continue
+            # Re-imported exports mostly repeat the stored values, only write
+            # what changed: bulk_update() builds a CASE per field and row.
+            changed = {field for field, value in data.items() if getattr(textbook, field) != value}
+            if not changed:
+                unchanged += 1
+                continue
+            for field in changed:
+                setattr(textbook, field, data[field])
+            textbook.updated_at = now
+            fields.update(changed)
+            updates[pk] = textbook
+        with transaction.atomic():
+            self.keep_images({textbook.image.name for textbook in creates + list(updates.values())})
+            Textbook.objects.bulk_create(creates)
+            if updates:
+                Textbook.objects.bulk_update(
+                    updates.values(), sorted(fields), batch_size=BULK_UPDATE_BATCH_SIZE,
+                )
+            textbooks_changed([textbook.pk for textbook in creates] + list(updates))
+            publish_saved([textbook.pk for textbook in creates], created=True)
+            publish_saved(updates)
+            listings_added(self.seller.pk, creates)
+            # One rebuild of the seller's row rather than an update per repriced listing.
+            if 'price' in fields:
+                recompute_seller_stats([self.seller.pk])
+            # Unchanged terms of updated listings cancel out.
+            terms_changed(
+                added=[textbook.__dict__ for textbook in creates + list(updates.values())],
+                removed=[textbook._loaded_values for textbook in updates.values()],
+            )
+        for pk in updates:
+            invalidate_textbook(pk)
+        self.report['created'] += len(creates)
+        self.report['updated'] += len(updates)
+        self.report['unchanged'] += unchanged
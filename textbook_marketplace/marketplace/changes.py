@@ -0,0 +1,68 @@
+"""
+Delta feed of the catalog for clients that keep a copy of it.
+
+``TextbookChange`` has a row per listing, upserted whenever the listing is
+saved or deleted with the id of the writing transaction. The feed walks the
+rows in ``(transaction_id, textbook_id)`` order from the client's token, so a
+poll reads the changes since the last one from the index instead of the
+whole catalog, and a listing changed many times in between is sent once.
+
+Transaction ids are assigned when a transaction starts writing, not when it
+commits, so a row with a lower id can become visible after the client read
+past it. The feed therefore stops below the oldest transaction still running
+(``pg_snapshot_xmin``): every row it has not returned yet, committed or not,
+sorts after the token. A long running transaction holds the feed back until
+it ends.
+
+Listing saves and deletes record themselves (``marketplace.signals``), bulk
+writes call ``textbooks_changed``.
+"""
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from .models import TextbookChange
+
+
+def textbooks_changed(ids, deleted=False):
+    """Record that the listings ``ids`` were saved, or ``deleted``."""
+    TextbookChange.objects.bulk_create(
+        # Sorted, so concurrent writers lock the rows in the same order.
+        [TextbookChange(textbook_id=pk, deleted=deleted) for pk in sorted(ids)],
+        batch_size=1000, update_conflicts=True, unique_fields=['textbook_id'],
+        update_fields=['transaction_id', 'deleted'],
+    )
+
+
+def encode_token(change):
+    payload = json.dumps({'x': change.transaction_id, 'id': change.textbook_id}, separators=(',', ':'))
+    return urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+
+def decode_token(token):
+    """``(transaction_id, textbook_id)`` of a token, ``ValueError`` if it isn't one."""
+    try:
+        payload = json.loads(urlsafe_b64decode(token.encode('ascii')))
+        return int(payload['x']), int(payload['id'])
+    except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+        raise ValueError(f'Invalid change token: {token!r}')
+
+
+def changes_since(since, limit):
+    """
+    Up to ``limit`` changes after ``since``, a decoded token or ``None`` for
+    all of them, in feed order.
+    """
+    changes = TextbookChange.objects.filter(
+        transaction_id__lt=RawSQL('pg_snapshot_xmin(pg_current_snapshot())::text::bigint', ()),
+    )
+    if since is not None:
+        # A row comparison is a range of the index, also within the one
+        # transaction of a backfill or bulk import.
+        changes = changes.filter(
+            RawSQL('(transaction_id, textbook_id) > (%s, %s)', since, output_field=BooleanField()),
+        )
+    return list(changes.order_by('transaction_id', 'textbook_id')[:limit])
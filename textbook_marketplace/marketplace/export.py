@@ -0,0 +1,128 @@
+"""
+Streaming export of the catalog as NDJSON or CSV.
+
+Rows are read ``EXPORT_CHUNK_SIZE`` at a time from a server-side cursor
+(``QuerySet.iterator``) and encoded chunk by chunk, so memory use does not
+grow with the catalog. Rows are ordered by ``updated_at``, an incremental
+export can continue from the last ``updated_at`` it saw. Serves the
+``textbooks/export.<format>`` endpoint and the ``export_textbooks`` command.
+"""
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Textbook
+
+# (column, lookup)
+EXPORT_FIELDS = (
+    ('id', 'id'),
+    ('title', 'title'),
+    ('author', 'author'),
+    ('school_class', 'school_class'),
+    ('publisher', 'publisher'),
+    ('price', 'price'),
+    ('stock', 'stock'),
+    ('condition', 'condition'),
+    ('description', 'description'),
+    ('seller', 'seller__username'),
+    ('whatsapp_contact', 'whatsapp_contact'),
+    ('viber_contact', 'viber_contact'),
+    ('telegram_contact', 'telegram_contact'),
+    ('phone_contact', 'phone_contact'),
+    ('image', 'image'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+COLUMNS = [column for column, _ in EXPORT_FIELDS]
+PRICE, IMAGE, CREATED_AT, UPDATED_AT = (
+    COLUMNS.index(column) for column in ('price', 'image', 'created_at', 'updated_at')
+)
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def export_queryset(queryset):
+    return queryset.order_by('updated_at', 'id').values_list(*[lookup for _, lookup in EXPORT_FIELDS])
+
+
+def _isoformat(value):
+    # Like DRF's DateTimeField.
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class RowFormatter:
+    """
+    Turns ``export_queryset`` rows into the values the serializers would
+    output, image URLs absolute like theirs when there is a ``request``.
+    """
+
+    def __init__(self, request=None):
+        self.storage = Textbook._meta.get_field('image').storage
+        # The scheme and host, built once rather than per row.
+        self.base_url = request.build_absolute_uri('/')[:-1] if request is not None else ''
+
+    def image_url(self, name):
+        url = self.storage.url(name)
+        return self.base_url + url if url.startswith('/') else url
+
+    def __call__(self, row):
+        values = list(row)
+        values[PRICE] = str(values[PRICE])
+        values[IMAGE] = self.image_url(values[IMAGE]) if values[IMAGE] else None
+        values[CREATED_AT] = _isoformat(values[CREATED_AT])
+        values[UPDATED_AT] = _isoformat(values[UPDATED_AT])
+        return values
+
+
+def encode_ndjson(rows):
+    return ''.join(
+        json.dumps(dict(zip(COLUMNS, values)), ensure_ascii=False) + '\n' for values in rows
+    ).encode('utf-8')
+
+
+def encode_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+ENCODERS = {
+    'ndjson': encode_ndjson,
+    'csv': encode_csv,
+}
+
+
+def iter_export(queryset, export_format, chunk_size=None, request=None):
+    """Yield the export of ``queryset`` as ``bytes``, a chunk of rows at a time."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    encode, format_row = ENCODERS[export_format], RowFormatter(request)
+    if export_format == 'csv':
+        yield encode([COLUMNS])
+    chunk = []
+    for row in export_queryset(queryset).iterator(chunk_size=chunk_size):
+        chunk.append(format_row(row))
+        if len(chunk) == chunk_size:
+            yield encode(chunk)
+            chunk = []
+    if chunk:
+        yield encode(chunk)
+
+
+async def aiter_export(queryset, export_format, chunk_size=None, request=None):
+    """``iter_export`` for ASGI, where a sync iterator would be read into memory first."""
+    # Fetching and encoding run on the request's sync thread, which also owns
+    # the cursor. (QuerySet.aiterator() runs values_list() queries on the
+    # event loop.)
+    chunks = iter_export(queryset, export_format, chunk_size, request)
+    try:
+        while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
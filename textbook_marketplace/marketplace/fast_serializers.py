@@ -0,0 +1,239 @@
+"""
+``values()`` based serialization of list pages.
+
+A DRF serializer builds every row from a model instance, through every
+field's ``get_attribute()`` and ``to_representation()``, and the image field
+through a ``VersatileImageFieldFile`` and its sizers. ``RowSerializer``
+compiles a serializer's fields once into ``values()`` lookups and plain
+converters, and builds rendition URLs from templates computed once per image
+directory and extension. The output is the serializer's, byte for byte
+(``marketplace.tests.test_fast_serializers`` compares them); a serializer
+with a field it doesn't know how to compile stays on DRF.
+
+Renditions are not created on demand on this path, saved images are warmed
+in the background (``RENDITION_WARM_ON_SAVE``) and older ones with
+``manage.py warm_renditions``. ``FAST_SERIALIZERS`` turns the path on once
+the stored images are warmed, a missing rendition would be a 404.
+"""
+import functools
+import posixpath
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.encoding import filepath_to_uri
+from rest_framework import fields as drf_fields
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+from versatileimagefield.fields import VersatileImageField
+from versatileimagefield.serializers import VersatileImageFieldSerializer
+from versatileimagefield.utils import build_versatileimagefield_url_set
+
+from .serializers import TimedVersatileImageFieldSerializer
+
+# Stands in for the file name when rendering the URL templates.
+STEM_MARKER = 'renditionstem0'
+
+# Fields whose representation only depends on the column value, and the
+# converter for it.
+CONVERTERS = {
+    drf_fields.ReadOnlyField: None,
+    drf_fields.IntegerField: int,
+    drf_fields.FloatField: float,
+    drf_fields.BooleanField: bool,
+    drf_fields.CharField: str,
+    drf_fields.EmailField: str,
+    drf_fields.SlugField: str,
+    drf_fields.URLField: str,
+    PrimaryKeyRelatedField: None,
+}
+IMAGE_SERIALIZERS = (VersatileImageFieldSerializer, TimedVersatileImageFieldSerializer)
+
+
+class Unsupported(Exception):
+    """The serializer has a field ``RowSerializer`` can't compile."""
+
+
+def _decimal(value):
+    return format(value, 'f')
+
+
+def _isoformat(value, tz):
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class RenditionURLs:
+    """
+    The ``VersatileImageFieldSerializer`` representation of stored image
+    names. Rendition paths only depend on the name's directory, extension and
+    stem, so each ``(directory, extension)`` gets its URLs rendered once for
+    a marker stem, and the names of the other images are substituted for it.
+    """
+
+    def __init__(self, model_field, sizes):
+        self.model_field = model_field
+        self.sizes = sizes
+        self.templates = {}
+        self.empty = self.render(None)
+
+    def render(self, name):
+        """The URLs as the serializer builds them, without creating renditions."""
+        field_file = getattr(self.model_field.model(**{self.model_field.attname: name}), self.model_field.name)
+        field_file.create_on_demand = False
+        return build_versatileimagefield_url_set(field_file, self.sizes)
+
+    def template(self, directory, extension):
+        probe = posixpath.join(directory, STEM_MARKER + (f'.{extension}' if extension is not None else ''))
+        template = []
+        for key, url in self.render(probe).items():
+            parts = url.split(STEM_MARKER)
+            if len(parts) != 2:
+                return None
+            image_key = dict(self.sizes)[key]
+            # Rendition paths are stripped of spaces, the original's URL is not.
+            template.append((key, parts[0], parts[1], image_key != 'url'))
+        return template
+
+    def __call__(self, name):
+        if not name:
+            return dict(self.empty)
+        directory, filename = posixpath.split(name)
+        stem, dot, extension = filename.rpartition('.')
+        if not dot:
+            stem, extension = filename, None
+        try:
+            template = self.templates[directory, extension]
+        except KeyError:
+            template = self.templates[directory, extension] = self.template(directory, extension)
+        if template is None:
+            return self.render(name)
+        quoted, stripped = filepath_to_uri(stem), None
+        urls = {}
+        for key, prefix, suffix, strip in template:
+            if strip:
+                if stripped is None:
+                    stripped = filepath_to_uri(stem.replace(' ', ''))
+                urls[key] = prefix + stripped + suffix
+            else:
+                urls[key] = prefix + quoted + suffix
+        return urls
+
+
+class RowSerializer:
+    """
+    ``serializer``'s representation of ``values()`` rows, see the module
+    docstring. Raises ``Unsupported`` for serializers it can't compile.
+    """
+
+    def __init__(self, serializer):
+        model = serializer.Meta.model
+        self.fields = []
+        self.datetime_fields = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            lookup, model_field = self.resolve(model, field)
+            self.fields.append((name, lookup, *self.converter(field, model_field)))
+        self.lookups = list(dict.fromkeys(lookup for _, lookup, _, _ in self.fields))
+
+    @staticmethod
+    def resolve(model, field):
+        """``values()`` lookup and model field of the column ``field`` reads."""
+        if field.source == '*' or not field.source_attrs:
+            raise Unsupported(f'{field.field_name} reads the whole instance')
+        model_field = None
+        for attr in field.source_attrs:
+            if model_field is not None:
+                if not model_field.many_to_one and not model_field.one_to_one:
+                    raise Unsupported(f'{field.field_name} follows a multi-valued relation')
+                # A null relation makes DRF skip the field, not output null.
+                if model_field.null:
+                    raise Unsupported(f'{field.field_name} follows a nullable relation')
+                model = model_field.related_model
+            try:
+                model_field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                raise Unsupported(f'{field.field_name} reads {attr}, which is not a field')
+            if not model_field.concrete:
+                raise Unsupported(f'{field.field_name} reads a reverse relation')
+        return '__'.join(field.source_attrs), model_field
+
+    def converter(self, field, model_field):
+        """``(converter, convert None)``, a ``None`` converter passes values through."""
+        field_class = type(field)
+        if field_class in CONVERTERS:
+            if model_field.is_relation and field_class is not PrimaryKeyRelatedField:
+                raise Unsupported(f'{field.field_name} reads a relation')
+            if field_class is PrimaryKeyRelatedField and field.pk_field is not None:
+                raise Unsupported(f'{field.field_name} has a pk_field')
+            return CONVERTERS[field_class], False
+        if field_class is drf_fields.ChoiceField:
+            if any(key != value for key, value in field.choice_strings_to_values.items()):
+                raise Unsupported(f'{field.field_name} has choices that are not strings')
+            return str, False
+        if field_class is drf_fields.DecimalField:
+            coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            if (not coerce_to_string or field.localize or field.normalize_output
+                    or getattr(model_field, 'decimal_places', None) != field.decimal_places):
+                raise Unsupported(f'{field.field_name} is not the plain string of its column')
+            # The column's values already have the field's decimal places,
+            # DRF's quantize() doesn't change them.
+            return _decimal, False
+        if field_class is drf_fields.DateTimeField:
+            output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+            if output_format is None or output_format.lower() != drf_fields.ISO_8601 or not settings.USE_TZ:
+                raise Unsupported(f'{field.field_name} has a custom format')
+            self.datetime_fields.append(field)
+            return _isoformat, False
+        if field_class in IMAGE_SERIALIZERS:
+            if not isinstance(model_field, VersatileImageField) or model_field.ppoi_field:
+                raise Unsupported(f'{field.field_name} is not a VersatileImageField without a ppoi field')
+            # The image field's representation is a dict, also for no image.
+            return RenditionURLs(model_field, field.sizes), True
+        raise Unsupported(f'{field.field_name} is a {field_class.__name__}')
+
+    def values(self, queryset, keep=()):
+        """``queryset`` as the ``values()`` rows ``serialize`` takes, also with the ``keep`` fields."""
+        return queryset.values(*dict.fromkeys([*self.lookups, *keep]))
+
+    def serialize(self, rows):
+        # Like DateTimeField.enforce_timezone(), per request.
+        timezones = {
+            field.field_name: field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+            for field in self.datetime_fields
+        }
+        fields = [
+            (name, lookup, functools.partial(convert, tz=timezones[name]) if name in timezones else convert,
+             convert_none)
+            for name, lookup, convert, convert_none in self.fields
+        ]
+        data = []
+        for row in rows:
+            item = {}
+            for name, lookup, convert, convert_none in fields:
+                value = row[lookup]
+                if convert is None or (value is None and not convert_none):
+                    item[name] = value
+                else:
+                    item[name] = convert(value)
+            data.append(item)
+        return data
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(serializer_class, fields):
+    serializer = serializer_class(fields=list(fields)) if fields is not None else serializer_class()
+    try:
+        return RowSerializer(serializer)
+    except Unsupported:
+        return None
+
+
+def get_row_serializer(serializer_class, fields=None):
+    """
+    The ``RowSerializer`` of ``serializer_class``, narrowed to the ``fields``
+    names of a sparse fieldset, or ``None`` to serialize with DRF.
+    """
+    if not settings.FAST_SERIALIZERS:
+        return None
+    return _compile(serializer_class, tuple(fields) if fields is not None else None)
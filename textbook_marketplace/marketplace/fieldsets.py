@@ -0,0 +1,97 @@
+"""
+Sparse fieldsets of the textbook list endpoints.
+
+``?fields=id,title,price`` returns only the listed fields and
+``?omit=description,phone_contact`` all but the listed ones. ``?representation=card``
+switches to the compact rows of the catalog grid (``TextbookCardSerializer``),
+which the other two parameters then narrow further. The query only loads the
+columns the chosen fields read, and joins the seller only when one of them
+needs it; fieldsets ``RowSerializer`` compiles are fetched as ``values()`` rows
+(see ``marketplace.fast_serializers``).
+"""
+from collections.abc import Mapping
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import ListSerializer
+
+from .fast_serializers import get_row_serializer
+from .serializers import TextbookCardSerializer, TextbookSerializer
+
+# Read by list views besides the serializer, for the keyset pagination cursors.
+LIST_COLUMNS = ('id', 'created_at', 'price')
+
+REPRESENTATIONS = {
+    'full': TextbookSerializer,
+    'card': TextbookCardSerializer,
+}
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def get_fieldset(request):
+    """
+    ``(serializer class, field names)`` requested by ``request``, the names
+    are ``None`` for all fields of the representation.
+    """
+    representation = request.query_params.get('representation', 'full')
+    if representation not in REPRESENTATIONS:
+        raise ValidationError({'representation': [f'Choose one of {", ".join(REPRESENTATIONS)}.']})
+    serializer_class = REPRESENTATIONS[representation]
+    fields, omit = _names(request, 'fields'), _names(request, 'omit')
+    if fields is None and omit is None:
+        return serializer_class, None
+
+    available = list(serializer_class().fields)
+    for param, names in (('fields', fields), ('omit', omit)):
+        unknown = [name for name in names or () if name not in available]
+        if unknown:
+            raise ValidationError({param: [
+                f'Unknown fields {", ".join(unknown)}, choose from {", ".join(available)}.'
+            ]})
+    selected = [name for name in available if (fields is None or name in fields) and name not in (omit or ())]
+    return serializer_class, selected
+
+
+def load_only(queryset, serializer, keep=()):
+    """
+    ``queryset`` loading the columns ``serializer`` reads and the ``keep``
+    fields (e.g. the ordering of the pagination), unchanged when a field
+    reads the whole instance.
+    """
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    columns = []
+    for field in serializer.fields.values():
+        if field.source == '*':
+            return queryset
+        columns.append('__'.join(field.source_attrs))
+    related = {column.split('__')[0] for column in columns if '__' in column}
+    # select_related() of a deferred relation is an error.
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns, *keep)
+
+
+def list_rows(queryset, serializer_class, fields, keep=()):
+    """
+    ``(rows, serialize)`` of a list endpoint: ``values()`` rows and their
+    ``RowSerializer`` if the fieldset compiles, else instances of
+    ``load_only(queryset)`` and the DRF serializer.
+    """
+    row_serializer = get_row_serializer(serializer_class, fields)
+    if row_serializer is not None:
+        return row_serializer.values(queryset, keep), row_serializer.serialize
+    kwargs = {'fields': fields} if fields is not None else {}
+    rows = load_only(queryset, serializer_class(**kwargs), keep=keep)
+    return rows, lambda page: serializer_class(page, many=True, **kwargs).data
+
+
+def row_value(row, name):
+    """Field ``name`` of a ``list_rows`` row."""
+    return row[name] if isinstance(row, Mapping) else getattr(row, name)
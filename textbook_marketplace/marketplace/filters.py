@@ -0,0 +1,112 @@
+import django_filters
+from django.db.models import Case, CharField, Count, Value, When
+
+from .models import Textbook
+
+# Upper bounds of the price facet buckets, the last bucket is open ended.
+PRICE_BUCKETS = (10, 20, 50, 100)
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class TextbookFilter(django_filters.FilterSet):
+    """
+    ``?school_class=5,6&condition=New&publisher=Klett&price_min=10&price_max=40``
+
+    ``school_class`` and ``condition`` take comma separated values.
+    """
+    username = django_filters.CharFilter(field_name='seller__username')
+    school_class = CharInFilter(field_name='school_class')
+    condition = CharInFilter(field_name='condition')
+    publisher = django_filters.CharFilter(field_name='publisher')
+    price_min = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+
+    class Meta:
+        model = Textbook
+        fields = ['username', 'school_class', 'condition', 'publisher', 'price_min', 'price_max']
+
+
+class LiveTextbookFilter(django_filters.FilterSet):
+    """The interests of a live updates subscriber, ``?school_class=5,6&price_min=10&price_max=40``"""
+    school_class = CharInFilter(field_name='school_class')
+    price_min = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+
+    class Meta:
+        model = Textbook
+        fields = ['school_class', 'price_min', 'price_max']
+
+
+class TextbookExportFilter(django_filters.FilterSet):
+    """``?seller=ana&updated_since=2025-01-01T00:00:00Z&updated_before=2025-02-01T00:00:00Z``"""
+    seller = django_filters.CharFilter(field_name='seller__username')
+    updated_since = django_filters.IsoDateTimeFilter(field_name='updated_at', lookup_expr='gte')
+    updated_before = django_filters.IsoDateTimeFilter(field_name='updated_at', lookup_expr='lt')
+
+    class Meta:
+        model = Textbook
+        fields = ['seller', 'updated_since', 'updated_before']
+
+
+def price_bucket_labels():
+    edges = (0,) + PRICE_BUCKETS
+    labels = [f'{low}-{high}' for low, high in zip(edges, edges[1:])]
+    return labels + [f'{PRICE_BUCKETS[-1]}+']
+
+
+def price_bucket_expression():
+    labels = price_bucket_labels()
+    return Case(
+        *[When(price__lt=bound, then=Value(label)) for bound, label in zip(PRICE_BUCKETS, labels)],
+        default=Value(labels[-1]),
+        output_field=CharField(),
+    )
+
+
+def facet_counts(queryset):
+    """
+    Counts per school class, condition and price bucket for ``queryset``.
+
+    All three facets come from one ``GROUP BY school_class, condition, bucket``
+    query; its at most classes x conditions x buckets rows are rolled up per
+    dimension here instead of issuing a ``COUNT`` per facet value.
+    """
+    return build_facets(facet_queryset(queryset))
+
+
+async def afacet_counts(queryset):
+    return build_facets([row async for row in facet_queryset(queryset)])
+
+
+def facet_queryset(queryset):
+    return (
+        queryset
+        .order_by()
+        .annotate(price_bucket=price_bucket_expression())
+        .values('school_class', 'condition', 'price_bucket')
+        .annotate(count=Count('*'))
+    )
+
+
+def build_facets(rows):
+    conditions = {value: 0 for value, _ in Textbook._meta.get_field('condition').choices}
+    buckets = {label: 0 for label in price_bucket_labels()}
+    classes = {}
+    for row in rows:
+        classes[row['school_class']] = classes.get(row['school_class'], 0) + row['count']
+        conditions[row['condition']] = conditions.get(row['condition'], 0) + row['count']
+        buckets[row['price_bucket']] += row['count']
+
+    def as_list(counts):
+        return [{'value': value, 'count': count} for value, count in counts.items()]
+
+    return {
+        'school_class': as_list(dict(sorted(
+            classes.items(), key=lambda item: (not item[0].isdigit(), item[0].zfill(3)),
+        ))),
+        'condition': as_list(conditions),
+        'price': as_list(buckets),
+    }
@@ -0,0 +1,267 @@
+"""
+Live listing updates for open catalog pages, as Server-Sent Events.
+
+``/api/textbooks/live/?school_class=5,6&price_min=10&price_max=40`` (served
+under ASGI, see ``marketplace.async_views``) streams ``created``, ``updated``,
+``sold`` and ``deleted`` events of the listings matching the filters, with
+the listing's card (``TextbookCardSerializer``) as data, just its id for
+``deleted``. Listings are matched by their current class and price, a
+subscriber isn't told about a listing that left its filters.
+
+Writes announce the listings they saved or deleted through the transport of
+``LIVE_TRANSPORT``: ``PostgresTransport`` sends them with ``NOTIFY`` in the
+writing transaction, so every worker hears of committed writes only, and
+``LocalTransport`` hands them to the process' own subscribers, for a single
+worker and tests. Every worker has one ``Broker`` listening to the transport
+for all its subscribers. It loads announced listings once, renders each
+event once and offers it to the subscribers whose interests match, indexed
+by class.
+
+The broker never waits for a subscriber. A subscriber's events queue up
+while its stream writes the previous ones, and are written together. When a
+client reads slower than listings change and more than ``LIVE_QUEUE_SIZE``
+events queue up, they are dropped, the client gets a ``resync`` event and
+its stream ends, and it reloads (or catches up with the change feed) before
+reconnecting. Past ``LIVE_MAX_SUBSCRIBERS`` a worker
+turns new subscribers away.
+"""
+import asyncio
+import functools
+import json
+import logging
+import weakref
+from collections import defaultdict
+from decimal import Decimal
+
+import psycopg
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+from rest_framework import exceptions, status
+
+from .fieldsets import list_rows, row_value
+from .models import Textbook
+from .renderers import FastJSONRenderer
+from .serializers import TextbookCardSerializer
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'marketplace_live'
+# NOTIFY payloads are limited to 8000 bytes.
+IDS_PER_MESSAGE = 500
+# Seconds before listening again after the transport failed.
+RECONNECT_DELAY = 1.0
+# A subscriber's queue was dropped, its stream ends with a resync event.
+RESYNC = b'event: resync\ndata: {}\n\n'
+
+renderer = FastJSONRenderer()
+
+
+def frame(event, data):
+    return b'event: ' + event.encode('ascii') + b'\ndata: ' + renderer.render(data) + b'\n\n'
+
+
+class LocalTransport:
+    """Announcements within the process, for a single worker and tests."""
+
+    def __init__(self):
+        self.listeners = set()
+
+    def send(self, message):
+        # Writes run in threads, subscribers in the event loop.
+        transaction.on_commit(lambda: [
+            loop.call_soon_threadsafe(queue.put_nowait, message) for loop, queue in list(self.listeners)
+        ])
+
+    async def listen(self):
+        listener = (asyncio.get_running_loop(), asyncio.Queue())
+        self.listeners.add(listener)
+        try:
+            while True:
+                yield await listener[1].get()
+        finally:
+            self.listeners.discard(listener)
+
+
+class PostgresTransport:
+    """
+    Announcements as ``NOTIFY`` on the default database, delivered to the
+    ``LISTEN`` connection of every worker when the writes commit.
+    """
+
+    def send(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, message])
+
+    async def listen(self):
+        database = settings.DATABASES['default']
+        params = {
+            'dbname': database['NAME'], 'user': database['USER'], 'password': database['PASSWORD'],
+            'host': database['HOST'], 'port': database['PORT'],
+        }
+        async with await psycopg.AsyncConnection.connect(
+            autocommit=True, **{key: value for key, value in params.items() if value},
+        ) as listening:
+            await listening.execute(f'LISTEN {CHANNEL}')
+            async for notify in listening.notifies():
+                yield notify.payload
+
+
+@functools.cache
+def get_transport():
+    """The transport of ``LIVE_TRANSPORT``, ``None`` when live updates are off."""
+    return import_string(settings.LIVE_TRANSPORT)() if settings.LIVE_TRANSPORT else None
+
+
+def _send(message):
+    transport = get_transport()
+    if transport is not None:
+        transport.send(json.dumps(message, separators=(',', ':')))
+
+
+def publish_saved(ids, created=False):
+    """Announce that the listings ``ids`` were created, or updated."""
+    ids = list(ids)
+    for start in range(0, len(ids), IDS_PER_MESSAGE):
+        _send({'event': 'created' if created else 'updated', 'ids': ids[start:start + IDS_PER_MESSAGE]})
+
+
+def publish_deleted(textbooks):
+    """Announce that ``textbooks`` were deleted, their class and price pick the subscribers."""
+    listings = [[textbook.pk, textbook.school_class, str(textbook.price)] for textbook in textbooks]
+    for start in range(0, len(listings), IDS_PER_MESSAGE):
+        _send({'event': 'deleted', 'listings': listings[start:start + IDS_PER_MESSAGE]})
+
+
+class Subscriber:
+    def __init__(self, school_classes=None, price_min=None, price_max=None):
+        self.school_classes = school_classes or None
+        self.price_min = price_min
+        self.price_max = price_max
+        self.pending = []
+        self.ready = asyncio.Event()
+        self.dropped = False
+
+    def wants(self, price):
+        return (self.price_min is None or price >= self.price_min) and (
+            self.price_max is None or price <= self.price_max
+        )
+
+    def offer(self, data):
+        if self.dropped:
+            return
+        if len(self.pending) >= settings.LIVE_QUEUE_SIZE:
+            self.drop()
+            return
+        self.pending.append(data)
+        self.ready.set()
+
+    def drop(self):
+        self.dropped = True
+        self.pending = [RESYNC]
+        self.ready.set()
+
+    async def frames(self, heartbeat):
+        """The frames to stream, all that queued up since the last write at once."""
+        while True:
+            try:
+                await asyncio.wait_for(self.ready.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle stream.
+                yield b': keepalive\n\n'
+                continue
+            frames, self.pending = self.pending, []
+            self.ready.clear()
+            yield b''.join(frames)
+            if frames[-1] is RESYNC:
+                return
+
+
+class LiveUpdatesUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Live updates are turned off.'
+    default_code = 'live_updates_unavailable'
+
+
+class Broker:
+    """The subscribers of a worker and the transport listener feeding them."""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.subscribers = set()
+        # School class, None for any: its subscribers.
+        self.by_class = defaultdict(set)
+        self.listener = None
+
+    def subscribe(self, subscriber):
+        if len(self.subscribers) >= settings.LIVE_MAX_SUBSCRIBERS:
+            raise LiveUpdatesUnavailable('Too many subscribers, try again later.')
+        self.subscribers.add(subscriber)
+        for school_class in subscriber.school_classes or [None]:
+            self.by_class[school_class].add(subscriber)
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self.listen())
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        for school_class in subscriber.school_classes or [None]:
+            subscribers = self.by_class.get(school_class)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.by_class[school_class]
+
+    def interested(self, school_class, price):
+        subscribers = self.by_class.get(None, set()) | self.by_class.get(school_class, set())
+        return [subscriber for subscriber in subscribers if subscriber.wants(price)]
+
+    async def listen(self):
+        while True:
+            try:
+                async for message in self.transport.listen():
+                    await self.dispatch(json.loads(message))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Live updates failed, listening again')
+            # Whatever was announced meanwhile is lost to the subscribers.
+            for subscriber in list(self.subscribers):
+                subscriber.drop()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def dispatch(self, message):
+        if not self.subscribers:
+            return
+        event = message['event']
+        if event == 'deleted':
+            for pk, school_class, price in message['listings']:
+                for subscriber in self.interested(school_class, Decimal(price)):
+                    subscriber.offer(frame(event, {'id': pk}))
+            return
+
+        rows, serialize = list_rows(
+            Textbook.objects.filter(pk__in=message['ids']), TextbookCardSerializer, None,
+            keep=['school_class', 'price', 'stock'],
+        )
+        async for row in rows:
+            price = row_value(row, 'price')
+            interested = self.interested(row_value(row, 'school_class'), price)
+            if interested:
+                sold = event == 'updated' and row_value(row, 'stock') == 0
+                data = frame('sold' if sold else event, serialize([row])[0])
+                for subscriber in interested:
+                    subscriber.offer(data)
+
+
+_brokers = weakref.WeakKeyDictionary()
+
+
+def get_broker():
+    """The broker of the running event loop, every worker has one."""
+    if get_transport() is None:
+        raise LiveUpdatesUnavailable()
+    loop = asyncio.get_running_loop()
+    broker = _brokers.get(loop)
+    if broker is None:
+        broker = _brokers[loop] = Broker(get_transport())
+    return broker
@@ -0,0 +1,254 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from marketplace.benchmarking import (
+    GunicornServer,
+    benchmark_database,
+    measure_memory,
+    run_concurrent,
+    server_timing_queries,
+    summarize,
+)
+from marketplace.models import Textbook, User
+from marketplace.query_budget import count_queries
+
+BENCH_USERNAME = 'benchmark'
+BENCH_PASSWORD = 'benchmark-password'
+BENCH_IMAGE = 'matematika2razred.jpg'
+
+
+def textbook_form(ctx, i):
+    # The serializer requires an image, so listings are created as uploads.
+    return {
+        'title': f'Benchmark {i}', 'author': 'Benchmark', 'school_class': '5',
+        'publisher': 'Benchmark', 'price': '9.99',
+        'image': SimpleUploadedFile(BENCH_IMAGE, ctx['image'], content_type='image/jpeg'),
+    }
+
+
+def encode_body(body):
+    """Return ``(data, content_type)``, dicts holding files go out as multipart."""
+    if body is None:
+        return '', 'application/json'
+    if any(isinstance(value, SimpleUploadedFile) for value in body.values()):
+        return encode_multipart(BOUNDARY, body), MULTIPART_CONTENT
+    return json.dumps(body), 'application/json'
+
+
+# (name, method, weight, build(ctx, i) -> (path, body, auth)). Routes hashing
+# passwords cost ~100x a catalog read, they get a fraction of the requests.
+ROUTES = [
+    ('textbook-list', 'GET', 1, lambda ctx, i: ('/api/textbooks/', None, None)),
+    ('textbook-list-seller', 'GET', 1, lambda ctx, i: (
+        f'/api/textbooks/?username={ctx["usernames"][i % len(ctx["usernames"])]}', None, None)),
+    ('textbook-search', 'GET', 1, lambda ctx, i: (
+        f'/api/textbooks/search/?q={ctx["words"][i % len(ctx["words"])]}', None, None)),
+    ('textbook-detail', 'GET', 1, lambda ctx, i: (
+        f'/api/textbook/{ctx["pks"][i % len(ctx["pks"])]}/', None, None)),
+    ('textbook-image', 'GET', 1, lambda ctx, i: (
+        f'/api/textbook/{ctx["pks"][i % len(ctx["pks"])]}/image/', None, None)),
+    ('textbook-create', 'POST', 1, lambda ctx, i: ('/api/textbook/create/', textbook_form(ctx, i), 'access')),
+    ('token', 'POST', 0.1, lambda ctx, i: (
+        '/api/token/', {'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}, None)),
+    ('token-refresh', 'POST', 1, lambda ctx, i: ('/api/token/refresh/', {'refresh': ctx['refresh']}, None)),
+    ('token-verify', 'POST', 1, lambda ctx, i: ('/api/token/verify/', {'token': ctx['access']}, None)),
+    ('protected', 'GET', 1, lambda ctx, i: ('/api/protected/', None, 'access')),
+    ('signup', 'POST', 0.1, lambda ctx, i: ('/api/signup/', {
+        'username': f'bench_{ctx["run"]}_{i}', 'email': 'bench@example.com', 'password': BENCH_PASSWORD,
+    }, None)),
+    ('users-me', 'GET', 1, lambda ctx, i: ('/api/users/me/', None, 'access')),
+    ('cache-stats', 'GET', 1, lambda ctx, i: ('/api/cache/stats/', None, 'access')),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed datasets of increasing size into the test database and benchmark every API '
+        'route through the Django test client and through gunicorn, writing JSON results'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='Textbook counts to benchmark, seeded incrementally')
+        parser.add_argument('--mode', choices=['client', 'gunicorn', 'both'], default='both')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent gunicorn clients')
+        parser.add_argument('--gunicorn-workers', type=int, default=2)
+        parser.add_argument('--routes', nargs='+', help='Only these routes')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the catalog response cache')
+        parser.add_argument('--seed-workers', type=int, default=os.cpu_count())
+        parser.add_argument('--output', default='bench_results.json', help='JSON results file')
+        parser.add_argument('--fresh', action='store_true', help='Recreate the benchmark database')
+
+    def handle(self, *args, **options):
+        routes = [route for route in ROUTES if not options['routes'] or route[0] in options['routes']]
+        if not routes:
+            raise CommandError(f'No such routes, choose from: {", ".join(route[0] for route in ROUTES)}')
+        modes = ['client', 'gunicorn'] if options['mode'] == 'both' else [options['mode']]
+
+        results = []
+        with benchmark_database(keepdb=not options['fresh']) as database:
+            self.stdout.write(f'Benchmark database: {database}')
+            for size in sorted(options['sizes']):
+                self.seed(size, options['seed_workers'])
+                ctx = self.build_context(size)
+                for mode in modes:
+                    # Signups need usernames that no earlier run has taken.
+                    ctx['run'] = f'{size}_{mode}_{time.time_ns()}'
+                    runner = self.run_client if mode == 'client' else self.run_gunicorn
+                    for result in runner(routes, ctx, options):
+                        result.update(size=size, mode=mode)
+                        results.append(result)
+                        self.report(result)
+
+        payload = {'meta': self.meta(options), 'results': sorted(
+            results, key=lambda result: (result['size'], result['mode'], result['route']),
+        )}
+        with open(options['output'], 'w') as output:
+            json.dump(payload, output, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def seed(self, size, workers):
+        sellers = User.objects.filter(is_seller=True).count()
+        wanted_sellers = max(50, size // 50)
+        if sellers < wanted_sellers:
+            # About half of the generated users are sellers.
+            call_command('generate_fake_users', 2 * (wanted_sellers - sellers), workers=workers, seed=size)
+        missing = size - Textbook.objects.count()
+        if missing > 0:
+            call_command('generate_fake_textbooks', missing, workers=workers, seed=size)
+            # Fresh planner statistics, or the first size runs on guesses.
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def build_context(self, size):
+        user = User.objects.filter(username=BENCH_USERNAME).first()
+        if user is None:
+            user = User.objects.create_user(BENCH_USERNAME, password=BENCH_PASSWORD, is_staff=True)
+        refresh = RefreshToken.for_user(user)
+        rng = random.Random(size)
+        max_id = Textbook.objects.order_by('-id').values_list('id', flat=True).first()
+        pks = list(Textbook.objects.filter(id__in=[rng.randint(1, max_id) for _ in range(500)])
+                   .values_list('id', flat=True))
+        titles = Textbook.objects.filter(id__in=pks[:50]).values_list('title', flat=True)
+        with open(os.path.join(settings.BASE_DIR, 'marketplace', 'sample_images', BENCH_IMAGE), 'rb') as image:
+            image_bytes = image.read()
+        return {
+            'image': image_bytes,
+            'pks': pks,
+            'usernames': list(User.objects.filter(is_seller=True).values_list('username', flat=True)[:100]),
+            'words': [title.split()[0] for title in titles],
+            'access': str(refresh.access_token),
+            'refresh': str(refresh),
+        }
+
+    def route_requests(self, weight, options):
+        return max(5, int(options['requests'] * weight))
+
+    def run_client(self, routes, ctx, options):
+        client = Client(HTTP_HOST='localhost')
+        overrides = {'CATALOG_CACHE_ENABLED': False} if options['no_cache'] else {}
+        with override_settings(**overrides):
+            for name, method, weight, build in routes:
+                total = self.route_requests(weight, options)
+                latencies, queries, errors = [], 0, 0
+                started = time.perf_counter()
+                with measure_memory([os.getpid()]) as memory:
+                    for i in range(total):
+                        path, body, auth = build(ctx, i)
+                        data, content_type = encode_body(body)
+                        extra = {'HTTP_AUTHORIZATION': f'Bearer {ctx[auth]}'} if auth else {}
+                        request_started = time.perf_counter()
+                        with count_queries() as counter:
+                            response = client.generic(method, path, data, content_type=content_type, **extra)
+                        latencies.append((time.perf_counter() - request_started) * 1000)
+                        queries += counter.count
+                        errors += response.status_code >= 400
+                result = summarize(latencies, time.perf_counter() - started, errors)
+                result.update(route=name, method=method, queries_per_request=round(queries / total, 2), **memory)
+                yield result
+
+    def request_builder(self, ctx, method, build):
+        """``build_request(i)`` for ``run_concurrent`` from a route's ``build``."""
+        def build_request(i):
+            path, body, auth = build(ctx, i)
+            data, content_type = encode_body(body)
+            headers = {'Host': 'localhost', 'Content-Type': content_type}
+            if auth:
+                headers['Authorization'] = f'Bearer {ctx[auth]}'
+            return method, path, data or None, headers
+        return build_request
+
+    def run_gunicorn(self, routes, ctx, options):
+        metrics_dir = tempfile.TemporaryDirectory()
+        # The workers report the queries of every request in Server-Timing.
+        env = {'METRICS_ENABLED': 'True', 'METRICS_DIR': metrics_dir.name}
+        if options['no_cache']:
+            env['CATALOG_CACHE_ENABLED'] = 'False'
+        with metrics_dir, GunicornServer(workers=options['gunicorn_workers'], env=env) as server:
+            workers = server.worker_pids()
+            for name, method, weight, build in routes:
+                total = self.route_requests(weight, options)
+                with measure_memory(workers) as memory:
+                    latencies, errors, elapsed, responses = run_concurrent(
+                        server.port, self.request_builder(ctx, method, build), total, options['concurrency'],
+                    )
+                queries = [server_timing_queries(headers) for _, headers in responses]
+                queries = [count for count in queries if count is not None]
+                result = summarize(latencies, elapsed, errors)
+                result.update(
+                    route=name, method=method,
+                    queries_per_request=round(sum(queries) / len(queries), 2) if queries else None,
+                    **memory,
+                )
+                yield result
+
+    def report(self, result):
+        style = self.style.ERROR if result['errors'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f'{result["size"]:>8} {result["mode"]:<8} {result["route"]:<22} '
+            f'p50={result.get("p50_ms", 0):8.2f}ms p95={result.get("p95_ms", 0):8.2f}ms '
+            f'p99={result.get("p99_ms", 0):8.2f}ms {result.get("throughput_rps") or 0:8.1f} req/s '
+            f'queries={result["queries_per_request"]} rss={result["peak_rss_mb"]}MB '
+            f'(+{result["rss_growth_mb"]}MB) errors={result["errors"]}'
+        ))
+
+    def meta(self, options):
+        return {
+            **self.environment(),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'gunicorn_workers': options['gunicorn_workers'],
+            'cache': not options['no_cache'],
+        }
+
+    def environment(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'cpu_count': os.cpu_count(),
+        }
@@ -0,0 +1,120 @@
+import json
+import os
+
+from django.core.management.base import CommandError
+
+from marketplace.benchmarking import GunicornServer, benchmark_database, run_concurrent, summarize
+
+from .benchmark_api import ROUTES, Command as ApiBenchmarkCommand
+
+# The endpoints that have async variants, see marketplace.async_views.
+ASYNC_ROUTES = ('textbook-list', 'textbook-detail', 'textbook-image', 'users-me')
+
+SERVERS = {
+    'wsgi': {
+        'app': 'textbook_marketplace.wsgi:application',
+        'worker_class': 'sync',
+        'env': {},
+    },
+    'asgi': {
+        'app': 'textbook_marketplace.asgi:application',
+        'worker_class': 'uvicorn.workers.UvicornWorker',
+        'env': {'ASYNC_VIEWS': 'True'},
+    },
+}
+
+
+class Command(ApiBenchmarkCommand):
+    help = (
+        'Compare concurrent throughput of the WSGI deployment (gunicorn sync workers) with '
+        'the ASGI one (uvicorn workers, async views) and report the memory each one used'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10_000, help='Textbooks to seed')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64],
+                            help='Concurrent client connections, one run per level')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per route and level')
+        parser.add_argument('--workers', type=int, default=2, help='Workers of both servers')
+        parser.add_argument('--wsgi-workers', type=int, help='Override --workers to match memory')
+        parser.add_argument('--asgi-workers', type=int, help='Override --workers to match memory')
+        parser.add_argument('--routes', nargs='+', default=list(ASYNC_ROUTES), choices=ASYNC_ROUTES)
+        parser.add_argument('--no-cache', action='store_true', help='Disable the catalog response cache')
+        parser.add_argument('--seed-workers', type=int, default=os.cpu_count())
+        parser.add_argument('--output', default='bench_asgi.json', help='JSON results file')
+        parser.add_argument('--fresh', action='store_true', help='Recreate the benchmark database')
+
+    def handle(self, *args, **options):
+        routes = [route for route in ROUTES if route[0] in options['routes']]
+        if not routes:
+            raise CommandError('No routes to benchmark')
+        workers = {
+            'wsgi': options['wsgi_workers'] or options['workers'],
+            'asgi': options['asgi_workers'] or options['workers'],
+        }
+
+        results = []
+        with benchmark_database(keepdb=not options['fresh']) as database:
+            self.stdout.write(f'Benchmark database: {database}')
+            self.seed(options['size'], options['seed_workers'])
+            ctx = self.build_context(options['size'])
+            for server_name, server in SERVERS.items():
+                env = dict(server['env'])
+                if options['no_cache']:
+                    env['CATALOG_CACHE_ENABLED'] = 'False'
+                with GunicornServer(
+                    workers=workers[server_name], worker_class=server['worker_class'],
+                    env=env, app=server['app'],
+                ) as running:
+                    results += self.run_server(running, server_name, routes, ctx, options)
+                    memory = running.total_peak_rss_mb()
+                for result in results:
+                    if result['server'] == server_name:
+                        result['server_peak_rss_mb'] = memory
+
+        self.report_comparison(results)
+        payload = {
+            'meta': {
+                **self.environment(),
+                'size': options['size'],
+                'requests': options['requests'],
+                'workers': workers,
+                'cache': not options['no_cache'],
+            },
+            'results': sorted(results, key=lambda result: (
+                result['route'], result['concurrency'], result['server'],
+            )),
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(payload, output, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def run_server(self, server, server_name, routes, ctx, options):
+        results = []
+        for name, method, weight, build in routes:
+            build_request = self.request_builder(ctx, method, build)
+            # Warm up connections, caches and lazily imported code first.
+            run_concurrent(server.port, build_request, 20, 4)
+            for concurrency in options['concurrency']:
+                latencies, errors, elapsed, _ = run_concurrent(
+                    server.port, build_request, options['requests'], concurrency,
+                )
+                result = summarize(latencies, elapsed, errors)
+                result.update(server=server_name, route=name, concurrency=concurrency)
+                results.append(result)
+                self.stdout.write(
+                    f'{server_name} {name:<16} c={concurrency:<4} '
+                    f'{result.get("throughput_rps") or 0:8.1f} req/s '
+                    f'p95={result.get("p95_ms", 0):8.2f}ms errors={errors}'
+                )
+        return results
+
+    def report_comparison(self, results):
+        by_key = {(result['route'], result['concurrency'], result['server']): result for result in results}
+        memory = {result['server']: result['server_peak_rss_mb'] for result in results}
+        self.stdout.write(f'Peak server memory: wsgi {memory.get("wsgi")}MB, asgi {memory.get("asgi")}MB')
+        for route, concurrency in sorted({(result['route'], result['concurrency']) for result in results}):
+            wsgi = by_key.get((route, concurrency, 'wsgi'), {}).get('throughput_rps')
+            asgi = by_key.get((route, concurrency, 'asgi'), {}).get('throughput_rps')
+            ratio = f'{asgi / wsgi:5.2f}x' if wsgi and asgi else '    -'
+            self.stdout.write(f'{route:<16} c={concurrency:<4} wsgi {wsgi or 0:8.1f} req/s  asgi {asgi or 0:8.1f} req/s  {ratio}')
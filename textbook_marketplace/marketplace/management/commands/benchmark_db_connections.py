@@ -0,0 +1,91 @@
+import json
+import os
+
+from django.core.management.base import CommandError
+from django.db import connection
+
+from marketplace.benchmarking import GunicornServer, benchmark_database, run_concurrent, summarize
+
+from .benchmark_api import ROUTES, Command as ApiBenchmarkCommand
+
+CONNECTION_MODES = ('request', 'persistent', 'pool')
+
+
+class Command(ApiBenchmarkCommand):
+    help = (
+        'Benchmark request latency under gunicorn with each DB_CONNECTION_MODE: a connection '
+        'per request, persistent connections and a connection pool'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=list(CONNECTION_MODES), choices=CONNECTION_MODES)
+        parser.add_argument('--routes', nargs='+', default=['textbook-image', 'textbook-detail'],
+                            choices=[route[0] for route in ROUTES])
+        parser.add_argument('--size', type=int, default=10_000, help='Textbooks to seed')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per route')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent client connections')
+        parser.add_argument('--workers', type=int, default=2, help='Server workers')
+        parser.add_argument('--asgi', action='store_true', help='Serve with uvicorn workers and async views')
+        parser.add_argument('--seed-workers', type=int, default=os.cpu_count())
+        parser.add_argument('--output', default='bench_db_connections.json', help='JSON results file')
+        parser.add_argument('--fresh', action='store_true', help='Recreate the benchmark database')
+
+    def handle(self, *args, **options):
+        routes = [route for route in ROUTES if route[0] in options['routes']]
+        if not routes:
+            raise CommandError('No routes to benchmark')
+        server_options = {'workers': options['workers']}
+        if options['asgi']:
+            server_options.update(
+                worker_class='uvicorn.workers.UvicornWorker', app='textbook_marketplace.asgi:application',
+            )
+
+        results = []
+        with benchmark_database(keepdb=not options['fresh']) as database:
+            self.stdout.write(f'Benchmark database: {database}')
+            self.seed(options['size'], options['seed_workers'])
+            ctx = self.build_context(options['size'])
+            for mode in options['modes']:
+                # Cached responses never touch the database.
+                env = {'DB_CONNECTION_MODE': mode, 'CATALOG_CACHE_ENABLED': 'False'}
+                if options['asgi']:
+                    env['ASYNC_VIEWS'] = 'True'
+                with GunicornServer(env=env, **server_options) as server:
+                    for name, method, weight, build in routes:
+                        build_request = self.request_builder(ctx, method, build)
+                        latencies, errors, elapsed, _ = run_concurrent(
+                            server.port, build_request, options['requests'], options['concurrency'],
+                        )
+                        result = summarize(latencies, elapsed, errors)
+                        result.update(mode=mode, route=name, server_connections=self.server_connections(database))
+                        results.append(result)
+                        self.stdout.write(
+                            f'{mode:<10} {name:<16} p50={result.get("p50_ms", 0):7.2f}ms '
+                            f'p95={result.get("p95_ms", 0):7.2f}ms p99={result.get("p99_ms", 0):7.2f}ms '
+                            f'{result.get("throughput_rps") or 0:8.1f} req/s '
+                            f'open connections={result["server_connections"]} errors={errors}'
+                        )
+
+        payload = {
+            'meta': {
+                **self.environment(),
+                'size': options['size'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'workers': options['workers'],
+                'server': 'asgi' if options['asgi'] else 'wsgi',
+            },
+            'results': sorted(results, key=lambda result: (result['route'], result['mode'])),
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(payload, output, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def server_connections(self, database):
+        """Connections the server holds open to the benchmark database, this one excluded."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT count(*) FROM pg_stat_activity WHERE datname = %s AND pid <> pg_backend_pid()',
+                [database],
+            )
+            return cursor.fetchone()[0]
@@ -0,0 +1,76 @@
+import gzip
+import json
+import statistics
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from marketplace.benchmarking import percentile
+from marketplace.models import Textbook
+from marketplace.pagination import KeysetPagination
+from marketplace.query_budget import count_queries
+
+# (name, query parameters)
+VARIANTS = [
+    ('full', {}),
+    ('card', {'representation': 'card'}),
+    ('fields', {'fields': 'id,title,price,condition,image'}),
+    ('omit', {'omit': 'description,whatsapp_contact,viber_contact,telegram_contact,phone_contact'}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare payload size and latency of /api/textbooks/ pages in the full representation, '
+        'the card representation and with ?fields= / ?omit='
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=1000, help='Rows per page')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per variant')
+        parser.add_argument('--output', default='bench_fieldsets.json', help='JSON results file')
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        self.stdout.write(f'Catalog size: {Textbook.objects.count()} textbooks, page size {page_size}')
+        client = APIClient(HTTP_HOST='localhost')
+        results = []
+        # The endpoint caps pages at max_page_size, lift it for the comparison.
+        with override_settings(CATALOG_CACHE_ENABLED=False), \
+                mock.patch.object(KeysetPagination, 'max_page_size', page_size):
+            for name, params in VARIANTS:
+                params = {**params, 'page_size': page_size}
+                client.get('/api/textbooks/', params)
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    with count_queries() as queries:
+                        response = client.get('/api/textbooks/', params)
+                    timings.append((time.perf_counter() - started) * 1000)
+                body = response.content
+                result = {
+                    'variant': name,
+                    'params': params,
+                    'rows': len(json.loads(body)['results']),
+                    'bytes': len(body),
+                    'gzip_bytes': len(gzip.compress(body)),
+                    'queries': queries.count,
+                    'p50_ms': round(statistics.median(timings), 2),
+                    'p95_ms': round(percentile(timings, 95), 2),
+                }
+                results.append(result)
+
+        full = results[0]
+        for result in results:
+            self.stdout.write(
+                f'{result["variant"]:<7} {result["rows"]:>5} rows {result["bytes"]:>9} B '
+                f'({result["bytes"] / full["bytes"]:4.0%}) gzip {result["gzip_bytes"]:>8} B '
+                f'p50={result["p50_ms"]:8.2f}ms ({result["p50_ms"] / full["p50_ms"]:4.0%}) '
+                f'p95={result["p95_ms"]:8.2f}ms'
+            )
+        with open(options['output'], 'w') as output:
+            json.dump({'page_size': page_size, 'results': results}, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
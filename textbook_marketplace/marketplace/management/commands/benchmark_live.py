@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+import orjson
+from django.db import transaction
+
+from marketplace.benchmarking import (
+    GunicornServer, benchmark_database, child_pids, process_peak_rss_mb, process_rss_mb, summarize,
+)
+from marketplace.models import Textbook
+
+from .benchmark_api import Command as ApiBenchmarkCommand
+
+SCHOOL_CLASSES = [str(school_class) for school_class in range(1, 12)]
+# Connections opened at a time, below the listen backlog.
+CONNECT_CONCURRENCY = 100
+
+
+class Subscribers:
+    """
+    Live update clients in an event loop of their own thread, a school class
+    each, noting when every ``updated`` event arrived.
+    """
+
+    def __init__(self, port, school_classes):
+        self.port = port
+        self.school_classes = school_classes
+        self.arrivals = []
+        self.resyncs = 0
+        self.errors = 0
+        self.connected = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_until_complete, args=(self.run(),))
+        self.tasks = []
+
+    def __enter__(self):
+        self.thread.start()
+        self.connected.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        for task in self.tasks:
+            self.loop.call_soon_threadsafe(task.cancel)
+        self.thread.join()
+        self.loop.close()
+
+    async def run(self):
+        pending = len(self.school_classes)
+        semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+        def opened(_):
+            nonlocal pending
+            pending -= 1
+            if not pending:
+                self.connected.set()
+
+        for school_class in self.school_classes:
+            connect = asyncio.get_running_loop().create_future()
+            connect.add_done_callback(opened)
+            self.tasks.append(asyncio.create_task(self.subscribe(school_class, semaphore, connect)))
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def subscribe(self, school_class, semaphore, connect):
+        writer = None
+        try:
+            async with semaphore:
+                reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+                writer.write(
+                    f'GET /api/textbooks/live/?school_class={school_class} HTTP/1.1\r\n'
+                    f'Host: localhost\r\n\r\n'.encode('ascii')
+                )
+                head = await reader.readuntil(b'\r\n\r\n')
+            if not head.startswith(b'HTTP/1.1 200'):
+                self.errors += 1
+                return
+            connect.set_result(None)
+            event = None
+            # Events are written whole, so chunk sizes are lines of their own.
+            while line := await reader.readline():
+                if line.startswith(b'event: '):
+                    event = line[7:].rstrip()
+                elif line.startswith(b'data: '):
+                    if event == b'updated':
+                        self.arrivals.append((orjson.loads(line[6:])['id'], time.perf_counter()))
+                    elif event == b'resync':
+                        self.resyncs += 1
+        except OSError:
+            self.errors += 1
+        finally:
+            if not connect.done():
+                connect.set_result(None)
+            if writer is not None:
+                writer.close()
+
+
+class Command(ApiBenchmarkCommand):
+    help = (
+        'Hold increasing numbers of live update subscribers on one ASGI worker, change listings '
+        'and report how long their events took to arrive and the worker memory per subscriber'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10_000, help='Textbooks to seed')
+        parser.add_argument('--subscribers', type=int, nargs='+', default=[100, 500, 1000, 2000],
+                            help='Concurrent subscribers, one run per level')
+        parser.add_argument('--updates', type=int, default=100, help='Listings changed per level')
+        parser.add_argument('--interval', type=float, default=0.05, help='Seconds between changes')
+        parser.add_argument('--seed-workers', type=int, default=os.cpu_count())
+        parser.add_argument('--output', default='bench_live.json', help='JSON results file')
+        parser.add_argument('--fresh', action='store_true', help='Recreate the benchmark database')
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database(keepdb=not options['fresh']) as database:
+            self.stdout.write(f'Benchmark database: {database}')
+            self.seed(options['size'], options['seed_workers'])
+            pks = list(Textbook.objects.values_list('pk', flat=True))
+            rng = random.Random(options['size'])
+            for count in options['subscribers']:
+                # A server per level, so its peak memory is the level's.
+                with GunicornServer(
+                    workers=1, worker_class='uvicorn.workers.UvicornWorker',
+                    env={'ASYNC_VIEWS': 'True'}, app='textbook_marketplace.asgi:application',
+                ) as server:
+                    textbooks = Textbook.objects.in_bulk(rng.sample(pks, options['updates']))
+                    result = self.run_level(server, count, list(textbooks.values()), options)
+                results.append(result)
+                self.stdout.write(
+                    f'subscribers={count:<5} connect={result["connect_s"]:6.2f}s '
+                    f'p50={result.get("p50_ms", 0):8.2f}ms p99={result.get("p99_ms", 0):8.2f}ms '
+                    f'delivered={result["delivered"]}/{result["expected"]} resyncs={result["resyncs"]} '
+                    f'errors={result["errors"]} {result["rss_per_subscriber_kb"]}KiB/subscriber'
+                )
+
+        payload = {
+            'meta': {
+                **self.environment(),
+                'size': options['size'],
+                'updates': options['updates'],
+                'interval_s': options['interval'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(payload, output, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def run_level(self, server, count, textbooks, options):
+        # Loads the views and starts the broker's listener before measuring.
+        with Subscribers(server.port, SCHOOL_CLASSES[:1]):
+            pass
+        worker = child_pids(server.process.pid)[0]
+        idle_rss = process_rss_mb(worker)
+
+        school_classes = [SCHOOL_CLASSES[i % len(SCHOOL_CLASSES)] for i in range(count)]
+        started = time.perf_counter()
+        with Subscribers(server.port, school_classes) as subscribers:
+            connect_s = time.perf_counter() - started
+            subscribed_rss = process_rss_mb(worker)
+            per_class = Counter(school_classes)
+            expected = sum(per_class[textbook.school_class] for textbook in textbooks)
+            changed = {}
+            for textbook in textbooks:
+                # Announced when the transaction commits, timed from just before.
+                with transaction.atomic():
+                    textbook.price += 1
+                    textbook.save(update_fields=['price'])
+                    changed[textbook.pk] = time.perf_counter()
+                time.sleep(options['interval'])
+            deadline = time.monotonic() + 10
+            while len(subscribers.arrivals) < expected and time.monotonic() < deadline:
+                time.sleep(0.1)
+            arrivals = list(subscribers.arrivals)
+
+        latencies = [(arrived - changed[pk]) * 1000 for pk, arrived in arrivals if pk in changed]
+        result = summarize(latencies, 0, subscribers.errors)
+        result.pop('throughput_rps', None)
+        result.update(
+            subscribers=count,
+            connect_s=round(connect_s, 3),
+            expected=expected,
+            delivered=len(latencies),
+            resyncs=subscribers.resyncs,
+            worker_idle_rss_mb=idle_rss,
+            worker_rss_mb=subscribed_rss,
+            worker_peak_rss_mb=process_peak_rss_mb(worker),
+            rss_per_subscriber_kb=round((subscribed_rss - idle_rss) * 1024 / count, 1),
+        )
+        return result
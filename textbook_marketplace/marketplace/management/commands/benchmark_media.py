@@ -0,0 +1,145 @@
+import json
+import os
+
+from django.conf import settings
+from versatileimagefield.utils import build_versatileimagefield_url_set
+
+from marketplace.benchmarking import (
+    GunicornServer, benchmark_database, child_pids, process_cpu_seconds, run_concurrent, summarize,
+)
+from marketplace.media import file_etag
+from marketplace.models import Textbook
+from marketplace.renditions import rendition_size_keys
+
+from .benchmark_api import Command as ApiBenchmarkCommand
+from .benchmark_asgi import SERVERS
+
+# Media sent by the worker and image URLs read from the database on every
+# request, against media sent by the proxy and cached image URLs.
+SETUPS = {
+    'before': {'MEDIA_DELIVERY': 'django', 'CATALOG_CACHE_ENABLED': 'False'},
+    'after': {'MEDIA_DELIVERY': 'x-accel-redirect', 'CATALOG_CACHE_ENABLED': 'True'},
+}
+# Listings asked for their image URL, their entries fit the default LocMem
+# cache (300 entries).
+HOT_LISTINGS = 100
+
+
+def media_request(key, headers=None):
+    """``build(ctx, i)`` of the ``i``-th URL of ``ctx[key]``, with ``headers(ctx, i)``."""
+    def build(ctx, i):
+        urls = ctx[key]
+        return urls[i % len(urls)], headers(ctx, i) if headers else {}
+    return build
+
+
+ROUTES = [
+    ('original', media_request('originals')),
+    ('rendition', media_request('renditions')),
+    ('range', media_request('originals', lambda ctx, i: {'Range': 'bytes=0-16383'})),
+    ('conditional', media_request(
+        'originals', lambda ctx, i: {'If-None-Match': ctx['etags'][i % len(ctx['etags'])]},
+    )),
+    ('textbook-image', lambda ctx, i: (f'/api/textbook/{ctx["pks"][i % HOT_LISTINGS]}/image/', {})),
+]
+
+
+class Command(ApiBenchmarkCommand):
+    help = (
+        'Measure the worker CPU time per image request with media sent by the worker and '
+        'image URLs read per request, and with X-Accel-Redirect and cached image URLs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10_000, help='Textbooks to seed')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per route')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent client connections')
+        parser.add_argument('--seed-workers', type=int, default=os.cpu_count())
+        parser.add_argument('--output', default='bench_media.json', help='JSON results file')
+        parser.add_argument('--fresh', action='store_true', help='Recreate the benchmark database')
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database(keepdb=not options['fresh']) as database:
+            self.stdout.write(f'Benchmark database: {database}')
+            self.seed(options['size'], options['seed_workers'])
+            ctx = self.media_context(options['size'])
+            for server_name, server in SERVERS.items():
+                for setup, env in SETUPS.items():
+                    # One worker, so its CPU time is all the requests'.
+                    with GunicornServer(
+                        workers=1, worker_class=server['worker_class'],
+                        env={**server['env'], **env}, app=server['app'],
+                    ) as running:
+                        results += self.run_server(running, server_name, setup, ctx, options)
+
+        self.report_comparison(results)
+        payload = {
+            'meta': {
+                **self.environment(),
+                'size': options['size'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(payload, output, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def media_context(self, size):
+        names = list(
+            Textbook.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        storage = Textbook._meta.get_field('image').storage
+        preview = [('preview', rendition_size_keys()[0])]
+        return {
+            'originals': [storage.url(name) for name in names],
+            # Creates the renditions that are still missing.
+            'renditions': [
+                build_versatileimagefield_url_set(Textbook(image=name).image, preview)['preview'] for name in names
+            ],
+            'etags': [file_etag(os.stat(os.path.join(settings.MEDIA_ROOT, name))) for name in names],
+            'pks': self.build_context(size)['pks'],
+        }
+
+    def run_server(self, server, server_name, setup, ctx, options):
+        results = []
+        for name, build in ROUTES:
+            def build_request(i):
+                path, headers = build(ctx, i)
+                return 'GET', path, None, {'Host': 'localhost', **headers}
+
+            run_concurrent(server.port, build_request, 50, options['concurrency'])
+            # gunicorn listens before its worker is forked, it is up now.
+            worker = child_pids(server.process.pid)[0]
+            cpu_before = process_cpu_seconds(worker)
+            latencies, errors, elapsed, responses = run_concurrent(
+                server.port, build_request, options['requests'], options['concurrency'],
+            )
+            cpu = process_cpu_seconds(worker) - cpu_before
+            result = summarize(latencies, elapsed, errors)
+            result.update(
+                server=server_name, setup=setup, route=name,
+                worker_cpu_ms_per_request=round(cpu * 1000 / options['requests'], 3),
+                statuses=sorted({status for status, _ in responses}),
+            )
+            results.append(result)
+            self.stdout.write(
+                f'{server_name} {setup:<6} {name:<14} {result["worker_cpu_ms_per_request"]:7.3f}ms CPU/request '
+                f'{result.get("throughput_rps") or 0:8.1f} req/s p95={result.get("p95_ms", 0):7.2f}ms '
+                f'statuses={result["statuses"]} errors={errors}'
+            )
+        return results
+
+    def report_comparison(self, results):
+        by_key = {(result['server'], result['route'], result['setup']): result for result in results}
+        for server_name in SERVERS:
+            for name, _ in ROUTES:
+                before = by_key.get((server_name, name, 'before'), {}).get('worker_cpu_ms_per_request')
+                after = by_key.get((server_name, name, 'after'), {}).get('worker_cpu_ms_per_request')
+                ratio = f'{before / after:5.1f}x' if before and after else '    -'
+                self.stdout.write(
+                    f'{server_name} {name:<14} before {before or 0:7.3f}ms  after {after or 0:7.3f}ms  {ratio}'
+                )
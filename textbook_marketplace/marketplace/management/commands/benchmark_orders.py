@@ -0,0 +1,146 @@
+import json
+import os
+import random
+import uuid
+from collections import Counter
+
+from django.core.management.base import CommandError
+from django.db.models import Count, Sum
+from rest_framework_simplejwt.tokens import AccessToken
+
+from marketplace.benchmarking import GunicornServer, benchmark_database, run_concurrent, summarize
+from marketplace.models import Order, Textbook, User
+
+from .benchmark_api import Command as ApiBenchmarkCommand
+
+BUYER_PREFIX = 'order-buyer-'
+
+
+class Command(ApiBenchmarkCommand):
+    help = (
+        'Place concurrent orders of one hot textbook, and of carts sharing textbooks, through '
+        'gunicorn, check nothing was oversold or ordered twice and report the order throughput'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10_000, help='Textbooks to seed')
+        parser.add_argument('--stock', type=int, default=500, help='Copies of the hot textbook')
+        parser.add_argument('--requests', type=int, default=1000, help='Order requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections')
+        parser.add_argument('--workers', type=int, default=4, help='Server workers')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per server worker')
+        parser.add_argument('--buyers', type=int, default=50, help='Distinct buyers placing orders')
+        parser.add_argument('--retry-every', type=int, default=10,
+                            help='Every n-th request repeats the previous Idempotency-Key (0: never)')
+        parser.add_argument('--cart-textbooks', type=int, default=20, help='Textbooks the carts draw from')
+        parser.add_argument('--seed-workers', type=int, default=os.cpu_count())
+        parser.add_argument('--output', default='bench_orders.json', help='JSON results file')
+        parser.add_argument('--fresh', action='store_true', help='Recreate the benchmark database')
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database(keepdb=not options['fresh']) as database:
+            self.stdout.write(f'Benchmark database: {database}')
+            self.seed(options['size'], options['seed_workers'])
+            tokens = self.buyer_tokens(options['buyers'])
+            textbooks = list(Textbook.objects.order_by('id').values_list('id', flat=True)[:options['cart_textbooks'] + 1])
+            hot, cart_textbooks = textbooks[0], textbooks[1:]
+            Order.objects.filter(textbook__in=textbooks).delete()
+
+            server = GunicornServer(workers=options['workers'], worker_class='gthread', threads=options['threads'])
+            with server:
+                Textbook.objects.filter(pk=hot).update(stock=options['stock'])
+                results.append(self.run_scenario(
+                    'hot-row', server.port, tokens, {hot: options['stock']}, options,
+                    lambda rng: [(hot, 1)],
+                ))
+                Textbook.objects.filter(pk__in=cart_textbooks).update(stock=options['stock'])
+                results.append(self.run_scenario(
+                    'checkout', server.port, tokens, dict.fromkeys(cart_textbooks, options['stock']), options,
+                    lambda rng: [(pk, rng.randint(1, 2)) for pk in rng.sample(cart_textbooks, 3)],
+                ))
+
+        with open(options['output'], 'w') as output:
+            json.dump({'options': {key: options[key] for key in (
+                'stock', 'requests', 'concurrency', 'workers', 'threads', 'buyers', 'retry_every',
+            )}, 'results': results}, output, indent=2)
+        failed = [result['scenario'] for result in results if result['problems']]
+        if failed:
+            raise CommandError(f'Consistency checks failed: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def buyer_tokens(self, count):
+        usernames = [f'{BUYER_PREFIX}{i}' for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=username, password='!') for username in usernames if username not in existing
+        ])
+        return [
+            (user.pk, str(AccessToken.for_user(user)))
+            for user in User.objects.filter(username__in=usernames).order_by('id')
+        ]
+
+    def run_scenario(self, name, port, tokens, stock, options, build_items):
+        run = uuid.uuid4().hex[:8]
+        retry_every = options['retry_every']
+        requests = []
+        for i in range(options['requests']):
+            # A retry repeats the request before it, buyer and items included.
+            if retry_every and i and i % retry_every == 0:
+                requests.append(requests[-1])
+                continue
+            rng = random.Random(f'{run}-{i}')
+            requests.append((tokens[i % len(tokens)], f'{run}-{i}', build_items(rng)))
+
+        def build_request(i):
+            (buyer, token), key, items = requests[i]
+            if len(items) == 1:
+                path, body = '/api/orders/', {'textbook': items[0][0], 'quantity': items[0][1]}
+            else:
+                path, body = '/api/orders/checkout/', {
+                    'items': [{'textbook': pk, 'quantity': quantity} for pk, quantity in items],
+                }
+            headers = {
+                'Host': 'localhost', 'Content-Type': 'application/json',
+                'Authorization': f'Bearer {token}', 'Idempotency-Key': key,
+            }
+            return 'POST', path, json.dumps(body), headers
+
+        latencies, errors, elapsed, responses = run_concurrent(
+            port, build_request, len(requests), options['concurrency'],
+        )
+        statuses = Counter(status for status, _ in responses)
+        result = summarize(latencies, elapsed, errors)
+        result.update(scenario=name, statuses={str(status): count for status, count in sorted(statuses.items())})
+        result['problems'] = problems = self.check_consistency(run, stock, statuses)
+        result['orders_per_second'] = round(statuses[201] / elapsed, 1)
+
+        self.stdout.write(
+            f'{name:<9} {len(requests)} requests in {elapsed:.2f}s: {result["throughput_rps"]} req/s, '
+            f'{result["orders_per_second"]} placed/s, p50={result.get("p50_ms", 0):.1f}ms '
+            f'p95={result.get("p95_ms", 0):.1f}ms, statuses {result["statuses"]}'
+        )
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(f'  {problem}'))
+        if not problems:
+            self.stdout.write(self.style.SUCCESS('  no overselling, no duplicate orders'))
+        return result
+
+    def check_consistency(self, run, initial_stock, statuses):
+        problems = []
+        orders = Order.objects.filter(idempotency_key__startswith=f'{run}-')
+        sold = dict(orders.values('textbook').annotate(quantity=Sum('quantity')).values_list('textbook', 'quantity'))
+        remaining = dict(Textbook.objects.filter(pk__in=initial_stock).values_list('pk', 'stock'))
+        for pk, stock in initial_stock.items():
+            if remaining[pk] + sold.get(pk, 0) != stock:
+                problems.append(f'textbook {pk}: {sold.get(pk, 0)} sold + {remaining[pk]} left != {stock}')
+        duplicates = orders.values('buyer', 'idempotency_key', 'textbook').annotate(n=Count('id')).filter(n__gt=1)
+        if duplicates.exists():
+            problems.append(f'{duplicates.count()} idempotency keys ordered twice')
+        placed = orders.values('buyer', 'idempotency_key').distinct().count()
+        if placed != statuses[201]:
+            problems.append(f'{statuses[201]} orders answered 201 but {placed} were placed')
+        unexpected = {status: count for status, count in statuses.items() if status not in (200, 201, 409)}
+        if unexpected:
+            problems.append(f'unexpected statuses {unexpected}')
+        return problems
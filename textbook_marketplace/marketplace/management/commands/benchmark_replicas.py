@@ -0,0 +1,171 @@
+import http.client
+import json
+import os
+import re
+import tempfile
+
+from django.core.management.base import CommandError
+from django.db import connection
+
+from marketplace.benchmarking import GunicornServer, benchmark_database, http_request, run_concurrent, summarize
+from marketplace.bulk import close_db_connections
+
+from .benchmark_api import ROUTES, Command as ApiBenchmarkCommand, encode_body, textbook_form
+
+READ_ROUTES = ('textbook-list', 'textbook-detail', 'textbook-image', 'users-me')
+QUERY_COUNTER = re.compile(r'^db_queries_total\{alias="([^"]+)"\} (\d+)$', re.MULTILINE)
+
+
+class Command(ApiBenchmarkCommand):
+    help = (
+        'Serve the API from the benchmark database and a replica snapshot of it, report how '
+        'the queries split between them and check that clients read their own writes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', nargs='+', default=list(READ_ROUTES),
+                            choices=[route[0] for route in ROUTES])
+        parser.add_argument('--size', type=int, default=10_000, help='Textbooks to seed')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per route')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent client connections')
+        parser.add_argument('--workers', type=int, default=2, help='Server workers')
+        parser.add_argument('--writes', type=int, default=20, help='Listings created by the consistency check')
+        parser.add_argument('--sticky-seconds', type=int, default=10, help='REPLICA_STICKY_SECONDS of the server')
+        parser.add_argument('--seed-workers', type=int, default=os.cpu_count())
+        parser.add_argument('--output', default='bench_replicas.json', help='JSON results file')
+        parser.add_argument('--fresh', action='store_true', help='Recreate the benchmark database')
+
+    def handle(self, *args, **options):
+        routes = [route for route in ROUTES if route[0] in options['routes']]
+        if not routes:
+            raise CommandError('No routes to benchmark')
+
+        results = []
+        with benchmark_database(keepdb=not options['fresh']) as database, \
+                tempfile.TemporaryDirectory() as shared_dir:
+            self.stdout.write(f'Benchmark database: {database}')
+            self.seed(options['size'], options['seed_workers'])
+            ctx = self.build_context(options['size'])
+            replica = self.create_replica(database)
+            env = {
+                'DB_REPLICAS': replica,
+                'REPLICA_STICKY_SECONDS': str(options['sticky_seconds']),
+                # Queries of cached responses would not show up, and cache
+                # misses are read from the primary anyway.
+                'CATALOG_CACHE_ENABLED': 'False',
+                # Workers share the user marks of REPLICA_STICKY_CACHE_ALIAS.
+                'CACHE_BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'CACHE_LOCATION': os.path.join(shared_dir, 'cache'),
+                'METRICS_ENABLED': 'True',
+                'METRICS_DIR': os.path.join(shared_dir, 'metrics'),
+                'METRICS_FLUSH_INTERVAL': '0',
+            }
+            try:
+                with GunicornServer(workers=options['workers'], env=env) as server:
+                    for name, method, weight, build in routes:
+                        before = self.queries_by_alias(server.port)
+                        latencies, errors, elapsed, _ = run_concurrent(
+                            server.port, self.request_builder(ctx, method, build),
+                            options['requests'], options['concurrency'],
+                        )
+                        after = self.queries_by_alias(server.port)
+                        result = summarize(latencies, elapsed, errors)
+                        result.update(route=name, queries={
+                            alias: count - before.get(alias, 0) for alias, count in after.items()
+                        })
+                        results.append(result)
+                        self.stdout.write(
+                            f'{name:<16} p50={result.get("p50_ms", 0):7.2f}ms '
+                            f'{result.get("throughput_rps") or 0:8.1f} req/s '
+                            f'queries {self.format_queries(result["queries"])} errors={errors}'
+                        )
+                    consistency = self.check_read_your_writes(server.port, ctx, options['writes'])
+            finally:
+                self.drop_replica(replica)
+
+        self.stdout.write(
+            f'After writing ({consistency["writes"]} listings): '
+            f'{consistency["token_reads"]} found with the token, '
+            f'{consistency["cookie_reads"]} found with the cookie, '
+            f'{consistency["other_client_reads"]} found by other clients (stale replica)'
+        )
+        payload = {
+            'meta': {
+                **self.environment(),
+                'size': options['size'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'workers': options['workers'],
+                'sticky_seconds': options['sticky_seconds'],
+            },
+            'results': results,
+            'consistency': consistency,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(payload, output, indent=2, sort_keys=True)
+        if consistency['token_reads'] < consistency['writes'] or consistency['cookie_reads'] < consistency['writes']:
+            raise CommandError('Clients did not read their own writes')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def create_replica(self, database):
+        """
+        A snapshot of ``database`` standing in for a replica. It never
+        catches up, so rows written during the run are only on the primary.
+        """
+        replica = f'{database}_replica'
+        # TEMPLATE needs the source database to have no other sessions.
+        close_db_connections()
+        with connection._nodb_cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{replica}"')
+            cursor.execute(f'CREATE DATABASE "{replica}" TEMPLATE "{database}"')
+        return replica
+
+    def drop_replica(self, replica):
+        with connection._nodb_cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{replica}"')
+
+    def queries_by_alias(self, port):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            status, _, body = http_request(connection, 'GET', '/metrics', headers={'Host': 'localhost'})
+        finally:
+            connection.close()
+        if status != 200:
+            raise CommandError(f'/metrics answered {status}')
+        return {alias: int(count) for alias, count in QUERY_COUNTER.findall(body.decode())}
+
+    def format_queries(self, queries):
+        total = sum(queries.values()) or 1
+        return ', '.join(
+            f'{alias}={count} ({count / total:.0%})' for alias, count in sorted(queries.items())
+        ) or 'none'
+
+    def check_read_your_writes(self, port, ctx, writes):
+        """
+        Create listings and read each one right back: with the writer's
+        token, with the cookie its response set, and as another client.
+        """
+        counts = {'writes': 0, 'token_reads': 0, 'cookie_reads': 0, 'other_client_reads': 0}
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        token = {'Host': 'localhost', 'Authorization': f'Bearer {ctx["access"]}'}
+        try:
+            for i in range(writes):
+                data, content_type = encode_body(textbook_form(ctx, i))
+                status, headers, body = http_request(
+                    connection, 'POST', '/api/textbook/create/', data, {**token, 'Content-Type': content_type},
+                )
+                if status != 201:
+                    raise CommandError(f'Creating a listing failed with {status}: {body[:200]!r}')
+                counts['writes'] += 1
+                path = f'/api/textbook/{json.loads(body)["id"]}/'
+                cookie = headers['Set-Cookie'].split(';', 1)[0]
+                for key, request_headers in [
+                    ('token_reads', token),
+                    ('cookie_reads', {'Host': 'localhost', 'Cookie': cookie}),
+                    ('other_client_reads', {'Host': 'localhost'}),
+                ]:
+                    status, _, _ = http_request(connection, 'GET', path, headers=request_headers)
+                    counts[key] += status == 200
+        finally:
+            connection.close()
+        return counts
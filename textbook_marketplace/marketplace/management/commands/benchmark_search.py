@@ -0,0 +1,65 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from marketplace.benchmarking import percentile
+from marketplace.models import Textbook
+from marketplace.serializers import TextbookSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare /api/textbooks/search/ with downloading the whole catalog and '
+        'filtering it on the client'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='+', help='Search phrases to benchmark')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query and approach')
+        parser.add_argument(
+            '--skip-full-scan', action='store_true',
+            help='Only time the search endpoint (the full download gets slow on big tables)',
+        )
+
+    def handle(self, *args, **options):
+        client = APIClient(HTTP_HOST='localhost')
+        self.stdout.write(f'Catalog size: {Textbook.objects.count()} textbooks')
+
+        for query in options['queries']:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                response = client.get('/api/textbooks/search/', {'q': query})
+                timings.append((time.perf_counter() - started) * 1000)
+            payload = response.json()
+            self.report(query, 'search endpoint', timings, len(payload['results']), payload['fuzzy'])
+
+            if options['skip_full_scan']:
+                continue
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                matches = self.client_side_filter(query)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.report(query, 'download all + filter', timings, len(matches), False)
+
+    def client_side_filter(self, query):
+        # What the frontend does today: pull every listing, then filter locally.
+        body = JSONRenderer().render(TextbookSerializer(Textbook.objects.all(), many=True).data)
+        rows = json.loads(body)
+        needle = query.lower()
+        return [
+            row for row in rows
+            if any(needle in (row[field] or '').lower()
+                   for field in ('title', 'author', 'publisher', 'description'))
+        ]
+
+    def report(self, query, approach, timings, hits, fuzzy):
+        self.stdout.write(self.style.SUCCESS(
+            f'{query!r:<24} {approach:<22} hits={hits:<4} fuzzy={fuzzy!s:<5} '
+            f'p50={statistics.median(timings):8.2f}ms p95={percentile(timings, 95):8.2f}ms'
+        ))
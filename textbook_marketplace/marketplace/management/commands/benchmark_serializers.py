@@ -0,0 +1,94 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from marketplace.fast_serializers import RowSerializer, Unsupported
+from marketplace.fieldsets import load_only
+from marketplace.models import Order, Textbook
+from marketplace.renderers import FastJSONRenderer
+from marketplace.serializers import (
+    OrderSerializer,
+    TextbookCardSerializer,
+    TextbookSerializer,
+)
+
+# (name, serializer class, queryset)
+SERIALIZERS = [
+    ('textbook', TextbookSerializer, Textbook.objects.select_related('seller')),
+    ('card', TextbookCardSerializer, Textbook.objects.all()),
+    ('order', OrderSerializer, Order.objects.select_related('textbook')),
+]
+
+
+def best_rate(rows, function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(rows / best)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the throughput of the values() row serializers and the orjson renderer with the DRF '
+        'serializers and JSONRenderer, in rows serialized per second'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Catalog rows to serialize')
+        parser.add_argument('--repeat', type=int, default=10, help='Runs per measurement, the best counts')
+        parser.add_argument('--output', default='bench_serializers.json', help='JSON results file')
+
+    def handle(self, *args, **options):
+        results = []
+        for name, serializer_class, queryset in SERIALIZERS:
+            result = self.measure(name, serializer_class, queryset, options['rows'], options['repeat'])
+            if result is not None:
+                results.append(result)
+        with open(options['output'], 'w') as output:
+            json.dump({'rows': options['rows'], 'results': results}, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def compiled(self, name, serializer_class):
+        try:
+            return RowSerializer(serializer_class())
+        except Unsupported as exc:
+            self.stdout.write(self.style.WARNING(f'{name}: stays on DRF, {exc}'))
+            return None
+
+    def measure(self, name, serializer_class, queryset, count, repeat):
+        row_serializer = self.compiled(name, serializer_class)
+        if row_serializer is None:
+            return None
+        serializer = serializer_class()
+        instances_queryset = load_only(queryset, serializer).order_by('id')[:count]
+        values_queryset = row_serializer.values(queryset).order_by('id')[:count]
+        instances, rows = list(instances_queryset), list(values_queryset)
+        if not rows:
+            self.stdout.write(self.style.WARNING(f'{name}: no rows to serialize'))
+            return None
+        data = serializer_class(instances, many=True).data
+        json_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+        rates = {
+            'drf_serializer': best_rate(len(rows), lambda: serializer_class(instances, many=True).data, repeat),
+            'row_serializer': best_rate(len(rows), lambda: row_serializer.serialize(rows), repeat),
+            'json_renderer': best_rate(len(rows), lambda: json_renderer.render(data), repeat),
+            'orjson_renderer': best_rate(len(rows), lambda: fast_renderer.render(data), repeat),
+            'drf_end_to_end': best_rate(len(rows), lambda: json_renderer.render(
+                serializer_class(list(instances_queryset.all()), many=True).data), repeat),
+            'fast_end_to_end': best_rate(len(rows), lambda: fast_renderer.render(
+                row_serializer.serialize(list(values_queryset.all()))), repeat),
+        }
+        self.stdout.write(
+            f'{name:<9} {len(rows)} rows, rows/s: serialize {rates["drf_serializer"]:>8} -> '
+            f'{rates["row_serializer"]:>8} ({rates["row_serializer"] / rates["drf_serializer"]:.1f}x), '
+            f'render {rates["json_renderer"]:>8} -> {rates["orjson_renderer"]:>8} '
+            f'({rates["orjson_renderer"] / rates["json_renderer"]:.1f}x), '
+            f'fetch+serialize+render {rates["drf_end_to_end"]:>7} -> {rates["fast_end_to_end"]:>7} '
+            f'({rates["fast_end_to_end"] / rates["drf_end_to_end"]:.1f}x)'
+        )
+        return {'serializer': name, 'rows': len(rows), 'rows_per_second': rates}
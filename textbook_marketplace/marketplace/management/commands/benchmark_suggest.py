@@ -0,0 +1,82 @@
+import json
+import os
+import random
+import time
+from urllib.parse import urlencode
+
+from marketplace.benchmarking import GunicornServer, benchmark_database, run_concurrent, summarize
+from marketplace.models import Suggestion, Textbook
+from marketplace.suggest import suggest
+
+from .benchmark_api import Command as ApiBenchmarkCommand
+
+PREFIX_LENGTHS = range(1, 7)
+
+
+class Command(ApiBenchmarkCommand):
+    help = (
+        'Time typeahead suggestions for prefixes of 1 to 6 characters of real titles, authors and '
+        'publishers, as queries and through gunicorn, and report the latency percentiles'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1_000_000, help='Textbooks to seed')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per prefix length')
+        parser.add_argument('--concurrency', type=int, default=2, help='Concurrent client connections')
+        parser.add_argument('--workers', type=int, default=2, help='Server workers')
+        parser.add_argument('--limit', type=int, default=5, help='Suggestions per kind')
+        parser.add_argument('--seed-workers', type=int, default=os.cpu_count())
+        parser.add_argument('--output', default='bench_suggest.json', help='JSON results file')
+        parser.add_argument('--fresh', action='store_true', help='Recreate the benchmark database')
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database(keepdb=not options['fresh']) as database:
+            self.stdout.write(f'Benchmark database: {database}')
+            self.seed(options['size'], options['seed_workers'])
+            self.stdout.write(
+                f'{Textbook.objects.count()} textbooks, '
+                f'{Suggestion.objects.filter(listing_count__gt=0).count()} distinct terms'
+            )
+            prefixes = self.sample_prefixes(options['requests'])
+
+            for length, sample in prefixes.items():
+                latencies = []
+                started = time.perf_counter()
+                for prefix in sample:
+                    query_started = time.perf_counter()
+                    suggest(prefix, options['limit'])
+                    latencies.append((time.perf_counter() - query_started) * 1000)
+                results.append(self.report('query', length, summarize(latencies, time.perf_counter() - started)))
+
+            with GunicornServer(workers=options['workers']) as server:
+                for length, sample in prefixes.items():
+                    def build_request(i, sample=sample):
+                        query = urlencode({'q': sample[i], 'limit': options['limit']})
+                        return 'GET', f'/api/textbooks/suggest/?{query}', None, {'Host': 'localhost'}
+
+                    latencies, errors, elapsed, _ = run_concurrent(
+                        server.port, build_request, len(sample), options['concurrency'],
+                    )
+                    results.append(self.report('http', length, summarize(latencies, elapsed, errors)))
+
+        with open(options['output'], 'w') as output:
+            json.dump({'options': {key: options[key] for key in (
+                'size', 'requests', 'concurrency', 'workers', 'limit',
+            )}, 'results': results}, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def sample_prefixes(self, count):
+        """``count`` prefixes per length, of terms drawn in proportion to their listings."""
+        rng = random.Random(0)
+        terms = list(Suggestion.objects.filter(listing_count__gt=0).values_list('term', 'listing_count'))
+        drawn = rng.choices([term for term, _ in terms], weights=[weight for _, weight in terms], k=count)
+        return {length: [term[:length] for term in drawn] for length in PREFIX_LENGTHS}
+
+    def report(self, mode, length, result):
+        result.update(mode=mode, prefix_length=length)
+        self.stdout.write(
+            f'{mode:<5} prefix of {length}: p50={result["p50_ms"]:.2f}ms p95={result["p95_ms"]:.2f}ms '
+            f'p99={result["p99_ms"]:.2f}ms, {result["throughput_rps"]} req/s, {result["errors"]} errors'
+        )
+        return result
@@ -0,0 +1,47 @@
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from marketplace.benchmarking import summarize
+from marketplace.models import Textbook
+from marketplace.similarity import FIELDS, SimilarityIndex, build_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the similar listings index from the catalog; workers switch to it within '
+        'SIMILARITY_REFRESH_SECONDS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=settings.SIMILARITY_INDEX_DIR, help='Index directory')
+        parser.add_argument('--chunk-size', type=int, default=10_000, help='Listings vectorized at a time')
+        parser.add_argument('--measure', type=int, default=0, metavar='N',
+                            help='Then time searches for 10 neighbours of N random listings')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        name, listings, entries = build_index(options['directory'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {name}: {listings} listings, {entries} entries in {time.perf_counter() - started:.1f}s'
+        ))
+        if options['measure']:
+            self.measure(os.path.join(options['directory'], name), options['measure'])
+
+    def measure(self, path, count):
+        index = SimilarityIndex(path)
+        ids = random.Random(0).sample(list(index.ids), min(count, len(index.ids)))
+        textbooks = Textbook.objects.only(*FIELDS).in_bulk(ids)
+        latencies = []
+        started = time.perf_counter()
+        for textbook in textbooks.values():
+            search_started = time.perf_counter()
+            index.search(textbook, 10)
+            latencies.append((time.perf_counter() - search_started) * 1000)
+        result = summarize(latencies, time.perf_counter() - started)
+        self.stdout.write(
+            f'search: p50={result["p50_ms"]:.2f}ms p95={result["p95_ms"]:.2f}ms p99={result["p99_ms"]:.2f}ms'
+        )
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from marketplace.cache import bump_catalog_version, invalidate_textbook
+from marketplace.changes import textbooks_changed
+from marketplace.models import Textbook
+from marketplace.renditions import warm_images
+
+
+class Command(BaseCommand):
+    help = (
+        'Move textbook images stored before content addressing to their content '
+        'hash names, so identical files are kept once, and delete the old copies'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--no-warm', action='store_true', help="Don't create renditions for the new names")
+
+    def handle(self, *args, **options):
+        field = Textbook._meta.get_field('image')
+        storage = field.storage
+        names = list(
+            Textbook.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        legacy = [name for name in names if not storage.is_content_addressed(name)]
+        self.stdout.write(f'{len(names)} distinct images, {len(legacy)} not content addressed yet')
+
+        moved = missing = rows = freed = 0
+        new_names = set()
+        for name in legacy:
+            if not storage.exists(name):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f'Missing file, skipping: {name}'))
+                continue
+            with storage.open(name) as image_file:
+                new_name = storage.get_content_name(name, image_file)
+                duplicate = storage.exists(new_name)
+                if options['dry_run']:
+                    self.stdout.write(f'{name} -> {new_name}{" (duplicate)" if duplicate else ""}')
+                elif not duplicate:
+                    storage.save(name, image_file)
+            if duplicate:
+                freed += storage.size(name)
+            if options['dry_run']:
+                continue
+
+            with transaction.atomic():
+                ids = list(Textbook.objects.filter(image=name).values_list('pk', flat=True))
+                rows += Textbook.objects.filter(pk__in=ids).update(image=new_name)
+                textbooks_changed(ids)
+            for pk in ids:
+                invalidate_textbook(pk)
+            # Nothing references the old name now, drop it with its renditions.
+            old_file = Textbook(image=name).image
+            old_file.delete_all_created_images()
+            storage.delete(name)
+            moved += 1
+            new_names.add(new_name)
+
+        if options['dry_run']:
+            self.stdout.write(f'~{freed / 1024 / 1024:.1f} MiB of duplicates would be freed')
+            return
+        if rows:
+            # QuerySet.update skips the signals that invalidate cached listings.
+            bump_catalog_version()
+        if new_names and not options['no_warm']:
+            for _ in warm_images(sorted(new_names)):
+                pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} files into {len(new_names)} content addressed files, '
+            f'updated {rows} textbooks, {missing} missing, ~{freed / 1024 / 1024:.1f} MiB of duplicates freed'
+        ))
@@ -0,0 +1,50 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.export import ENCODERS, iter_export
+from marketplace.filters import TextbookExportFilter
+from marketplace.models import Textbook
+
+
+class Command(BaseCommand):
+    help = 'Stream the catalog as NDJSON or CSV, in constant memory whatever its size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(ENCODERS), default='ndjson')
+        parser.add_argument('--output', default='-', help='File to write, - for stdout')
+        parser.add_argument('--seller', help='Only the listings of this username')
+        parser.add_argument('--updated-since', help='ISO 8601 datetime, inclusive')
+        parser.add_argument('--updated-before', help='ISO 8601 datetime, exclusive')
+        parser.add_argument('--chunk-size', type=int, help='Rows per fetch (default: EXPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        params = {
+            name: options[name] for name in ('seller', 'updated_since', 'updated_before')
+            if options[name] is not None
+        }
+        filterset = TextbookExportFilter(params, queryset=Textbook.objects.all())
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+
+        chunks = iter_export(filterset.qs, options['format'], options['chunk_size'])
+        started = time.perf_counter()
+        if options['output'] == '-':
+            size = self.write(sys.stdout.buffer, chunks)
+        else:
+            with open(options['output'], 'wb') as output:
+                size = self.write(output, chunks)
+        elapsed = time.perf_counter() - started
+        # Progress goes to stderr, stdout may be the export itself.
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {size / 1024 / 1024:.1f}MB of {options["format"]} in {elapsed:.2f}s'
+        ))
+
+    def write(self, output, chunks):
+        size = 0
+        for chunk in chunks:
+            output.write(chunk)
+            size += len(chunk)
+        output.flush()
+        return size
@@ -1,99 +1,122 @@
 import os
 import random
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files import File
 from django.core.management.base import BaseCommand
 from faker import Faker
+
+from marketplace.bulk import Progress, run_chunks
+from marketplace.cache import bump_catalog_version
+from marketplace.changes import textbooks_changed
 from marketplace.models import Textbook, User
-from django.conf import settings
-from django.core.files import File
-from django.core.exceptions import SuspiciousFileOperation
-from django.utils.text import slugify
-from django.core.files.storage import default_storage
+from marketplace.renditions import rendition_size_keys, warm_image
+from marketplace.seller_stats import recompute_seller_stats
+from marketplace.suggest import rebuild_suggestions
+
+CONDITIONS = ['New', 'Used - Excellent', 'Used - Good', 'Used - Fair']
+
+# Faker is by far the slowest part of generating a row, so every chunk draws
+# from pools of pre-generated values instead of calling it per row. That also
+# gives publishers and authors a realistic number of listings each.
+POOL_SIZE = 500
+
+
+def create_textbooks(chunk_index, start, size, seed, seller_ids, image_names):
+    # Seeded per chunk, so the data doesn't depend on the number of workers.
+    rng = random.Random(seed + chunk_index)
+    fake = Faker()
+    fake.seed_instance(seed + chunk_index)
+
+    pool_size = min(POOL_SIZE, size)
+    titles = [fake.bs() for _ in range(pool_size)]
+    authors = [fake.name() for _ in range(pool_size)]
+    publishers = [fake.company() for _ in range(pool_size // 10 + 1)]
+    descriptions = [fake.text() for _ in range(pool_size)]
+    phones = [fake.phone_number() for _ in range(pool_size)]
+
+    textbooks = [
+        Textbook(
+            title=rng.choice(titles),
+            author=rng.choice(authors),
+            school_class=str(rng.randint(1, 11)),
+            publisher=rng.choice(publishers),
+            price=Decimal(rng.randint(500, 10000)) / 100,
+            seller_id=rng.choice(seller_ids),
+            description=rng.choice(descriptions),
+            whatsapp_contact=rng.choice(phones),
+            viber_contact=rng.choice(phones),
+            telegram_contact=rng.choice(phones),
+            phone_contact=rng.choice(phones),
+            condition=rng.choice(CONDITIONS),
+            image=rng.choice(image_names),
+        )
+        for _ in range(size)
+    ]
+    Textbook.objects.bulk_create(textbooks, batch_size=size)
+    textbooks_changed([textbook.pk for textbook in textbooks])
+    return size
+
 
 class Command(BaseCommand):
     help = 'Generate fake textbooks with images from the sample_images folder and save them in the media directory'
 
     def add_arguments(self, parser):
         parser.add_argument('count', type=int, help='Number of textbooks to generate')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create chunk')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for reproducible data')
 
     def handle(self, *args, **options):
         count = options['count']
-        fake = Faker()
 
-        # Путь к папке с изображениями
-        image_folder = os.path.join(settings.BASE_DIR, 'marketplace', 'sample_images')
-
-        # Получаем список файлов в папке, но проверяем, что путь безопасен
-        image_files = []
-        for filename in os.listdir(image_folder):
-            full_path = os.path.join(image_folder, filename)
-            real_path = os.path.realpath(full_path)  # Получаем абсолютный путь
-            # Проверяем, что файл действительно находится внутри этой папки
-            if os.path.isfile(full_path) and real_path.startswith(os.path.abspath(image_folder)):
-                image_files.append(filename)
-            else:
-                self.stdout.write(self.style.WARNING(f"Skipping suspicious file: {filename}"))
-
-        # Проверяем, что в папке есть изображения
-        if not image_files:
+        image_names = self.store_sample_images()
+        if not image_names:
             self.stdout.write(self.style.ERROR('No valid images found in the sample_images folder!'))
             return
 
-        # Получаем случайных пользователей, которые будут продавцами учебников
-        users = User.objects.filter(is_seller=True)
-
-        if not users:
+        seller_ids = list(User.objects.filter(is_seller=True).values_list('id', flat=True))
+        if not seller_ids:
             self.stdout.write(self.style.ERROR('No sellers found! Please ensure you have sellers in the system.'))
             return
 
-        for _ in range(count):
-            title = fake.bs()  # Генерация случайного названия учебника
-            author = fake.name()  # Случайное имя автора
-            school_class = f'{random.randint(1, 11)}'  # Случайный класс от 1 до 11
-            publisher = fake.company()  # Генерация названия издательства
-            price = random.uniform(5, 100)  # Случайная цена учебника
-            seller = random.choice(users)  # Случайный продавец
-            description = fake.text()  # Описание учебника
-            whatsapp_contact = fake.phone_number()  # Контакт в WhatsApp
-            viber_contact = fake.phone_number()  # Контакт в Viber
-            telegram_contact = fake.phone_number()  # Контакт в Telegram
-            phone_contact = fake.phone_number()  # Простой номер телефона
-            condition = random.choice(['New', 'Used - Excellent', 'Used - Good', 'Used - Fair'])  # Состояние учебника
-
-            # Случайным образом выбираем изображение из папки
-            selected_image_file = random.choice(image_files)
-            image_path = os.path.join(image_folder, selected_image_file)
-
-            # Новый путь в директории media
-            media_image_path = os.path.join('textbook_images', selected_image_file)
-
-            # Копируем изображение в директорию media с помощью default_storage
-            try:
-                # Сохраняем изображение с помощью default_storage
-                with open(image_path, 'rb') as image_file:
-                    django_file = File(image_file)
-                    image_name = slugify(selected_image_file)  # Убираем пробелы и спецсимволы
-
-                    # Сохраняем файл в директорию media/textbook_images/ автоматически
-                    saved_image = default_storage.save(os.path.join('textbook_images', image_name), django_file)
-
-                    # Создаем учебник с изображением
-                    textbook = Textbook.objects.create(
-                        title=title,
-                        author=author,
-                        school_class=school_class,
-                        publisher=publisher,
-                        price=price,
-                        seller=seller,
-                        description=description,
-                        whatsapp_contact=whatsapp_contact,
-                        viber_contact=viber_contact,
-                        telegram_contact=telegram_contact,
-                        phone_contact=phone_contact,
-                        condition=condition,
-                        image=saved_image  # Ссылка на сохранённое изображение
-                    )
-
-                self.stdout.write(self.style.SUCCESS(f'Successfully created textbook "{title}" with image {saved_image}'))
-
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error processing image {selected_image_file}: {str(e)}"))
+        workers = max(1, min(options['workers'], -(-count // options['batch_size'])))
+        progress = Progress(self.stdout, count, unit='textbooks')
+        for created in run_chunks(
+            create_textbooks, count, options['batch_size'], workers,
+            options['seed'], seller_ids, image_names,
+        ):
+            progress.advance(created)
+
+        # bulk_create skips the model signals that keep these up to date.
+        bump_catalog_version()
+        recompute_seller_stats(seller_ids)
+        rebuild_suggestions()
+        size_keys = rendition_size_keys()
+        for name in image_names:
+            warm_image(name, size_keys)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully created {progress.summary()}'))
+
+    def store_sample_images(self):
+        """
+        Copy every sample image to storage once and return the stored names,
+        all generated textbooks point at these shared copies.
+        """
+        image_folder = os.path.join(settings.BASE_DIR, 'marketplace', 'sample_images')
+        storage = Textbook._meta.get_field('image').storage
+        image_names = []
+        for filename in sorted(os.listdir(image_folder)):
+            full_path = os.path.join(image_folder, filename)
+            real_path = os.path.realpath(full_path)
+            # Make sure the file really lives inside the sample_images folder.
+            if not (os.path.isfile(full_path) and real_path.startswith(os.path.abspath(image_folder))):
+                self.stdout.write(self.style.WARNING(f'Skipping suspicious file: {filename}'))
+                continue
+
+            # Content addressed, so re-running doesn't copy the file again.
+            with open(full_path, 'rb') as image_file:
+                image_names.append(storage.save(f'textbook_images/{filename}', File(image_file)))
+        # Byte identical samples end up under the same name.
+        return list(dict.fromkeys(image_names))
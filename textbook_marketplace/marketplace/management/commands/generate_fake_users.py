@@ -1,33 +1,52 @@
+import os
+import random
+
 from django.core.management.base import BaseCommand
+from django.db.models import Max
 from faker import Faker
+
+from marketplace.bulk import Progress, run_chunks
 from marketplace.models import User
-import random
+
+
+def create_users(chunk_index, start, size, seed, offset):
+    # Seeded per chunk, so the data doesn't depend on the number of workers.
+    rng = random.Random(seed + chunk_index)
+    fake = Faker()
+    fake.seed_instance(seed + chunk_index)
+
+    users = [
+        User(
+            # The numeric suffix keeps usernames unique across chunks and runs.
+            username=f'{fake.user_name()}_{offset + start + i}',
+            email=fake.email(),
+            telegram_id=str(fake.uuid4()),
+            telephone=fake.phone_number(),
+            is_seller=rng.choice([True, False]),
+            is_active=True,
+        )
+        for i in range(size)
+    ]
+    User.objects.bulk_create(users, batch_size=size)
+    return size
+
 
 class Command(BaseCommand):
     help = 'Generate fake users with specified count'
 
     def add_arguments(self, parser):
         parser.add_argument('count', type=int, help='Number of users to generate')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create chunk')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for reproducible data')
 
     def handle(self, *args, **options):
         count = options['count']
-        fake = Faker()
-
-        for _ in range(count):
-            username = fake.user_name()
-            email = fake.email()
-            telegram_id = fake.uuid4()  # Или другое значение для telegram_id
-            telephone = fake.phone_number()
-            is_seller = random.choice([True, False])
-
-            # Создаем пользователя
-            user = User.objects.create(
-                username=username,
-                email=email,
-                telegram_id=telegram_id,
-                telephone=telephone,
-                is_seller=is_seller,
-                is_active=True  # или False в зависимости от требований
-            )
-
-            self.stdout.write(self.style.SUCCESS(f'Successfully created user {username}'))
+        offset = (User.objects.aggregate(last_id=Max('id'))['last_id'] or 0) + 1
+        workers = max(1, min(options['workers'], -(-count // options['batch_size'])))
+
+        progress = Progress(self.stdout, count, unit='users')
+        for created in run_chunks(create_users, count, options['batch_size'], workers, options['seed'], offset):
+            progress.advance(created)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully created {progress.summary()}'))
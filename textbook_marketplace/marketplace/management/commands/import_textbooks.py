@@ -0,0 +1,56 @@
+import json
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.catalog_import import FORMATS, CatalogImporter, import_format, read_rows
+from marketplace.models import User
+from marketplace.renditions import warm_images
+
+
+class Command(BaseCommand):
+    help = 'Import a CSV or NDJSON file, and optionally a ZIP of cover images, as listings of a seller'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV or NDJSON file, see marketplace.catalog_import')
+        parser.add_argument('--seller', required=True, help='Username the listings belong to')
+        parser.add_argument('--images', help='ZIP archive holding the files named in the image column')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+        parser.add_argument('--batch-size', type=int, help='Rows per bulk write (default: IMPORT_BATCH_SIZE)')
+        parser.add_argument('--report', help='Write the JSON report of skipped rows to this file')
+        parser.add_argument('--no-renditions', action='store_true', help='Leave renditions to warm_renditions')
+        parser.add_argument('--workers', type=int, default=None, help='Rendition processes (default: CPU count)')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or import_format(options['file'])
+        if file_format is None:
+            raise CommandError('Cannot tell the format from the file name, pass --format')
+        try:
+            seller = User.objects.get(username=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user {options["seller"]!r}')
+
+        started = time.perf_counter()
+        with open(options['file'], 'rb') as source, \
+                (open(options['images'], 'rb') if options['images'] else nullcontext()) as images:
+            importer = CatalogImporter(seller, images=images, batch_size=options['batch_size'])
+            report = importer.run(read_rows(source, file_format))
+        elapsed = time.perf_counter() - started
+        rows = report['created'] + report['updated']
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {rows} rows in {elapsed:.2f}s ({rows / elapsed:.0f} rows/s): '
+            f'{report["created"]} created, {report["updated"]} updated, {report["unchanged"]} unchanged, '
+            f'{len(report["errors"])} skipped'
+        ))
+        for error in report['errors'][:10]:
+            self.stdout.write(self.style.WARNING(f'row {error["row"]}: {json.dumps(error["errors"])}'))
+        if options['report']:
+            with open(options['report'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        if importer.images and not options['no_renditions']:
+            self.stdout.write(f'Warming renditions of {len(importer.images)} images...')
+            failed = sum(result[2] for result in warm_images(sorted(importer.images), options['workers']))
+            if failed:
+                self.stdout.write(self.style.WARNING(f'{failed} renditions failed'))
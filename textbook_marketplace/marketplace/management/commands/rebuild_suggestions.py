@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.models import Suggestion
+from marketplace.suggest import rebuild_suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the typeahead suggestions from the listings, after bulk writes that bypassed them '
+        'or to drop terms no listing has any more'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create batch')
+
+    def handle(self, *args, **options):
+        before = Suggestion.objects.count()
+        terms = rebuild_suggestions(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {terms} suggestions (was {before})'))
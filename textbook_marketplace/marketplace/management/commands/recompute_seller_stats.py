@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from marketplace.models import SellerStats, User
+from marketplace.seller_stats import STATS_FIELDS, recompute_seller_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the denormalized seller statistics from the sellers' listings, "
+        'after bulk writes that bypassed them or to repair drift'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only these sellers (default: all)')
+
+    def handle(self, *args, **options):
+        seller_ids = None
+        if options['usernames']:
+            users = dict(User.objects.filter(username__in=options['usernames']).values_list('username', 'id'))
+            missing = set(options['usernames']) - set(users)
+            if missing:
+                raise CommandError(f'Unknown users: {", ".join(sorted(missing))}')
+            seller_ids = list(users.values())
+
+        stats = SellerStats.objects.all() if seller_ids is None else SellerStats.objects.filter(pk__in=seller_ids)
+        with transaction.atomic():
+            before = {row[0]: row[1:] for row in stats.values_list('pk', *STATS_FIELDS)}
+            sellers = recompute_seller_stats(seller_ids)
+            after = {row[0]: row[1:] for row in stats.values_list('pk', *STATS_FIELDS)}
+        drifted = [pk for pk, values in after.items() if before.get(pk) != values]
+        for pk in drifted[:20]:
+            self.stdout.write(self.style.WARNING(f'seller {pk}: {before.get(pk)} -> {after[pk]}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed {sellers} sellers with listings, {len(drifted)} rows corrected'
+        ))
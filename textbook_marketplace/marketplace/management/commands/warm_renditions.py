@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketplace.models import Textbook
+from marketplace.renditions import RENDITION_KEY_SET, warm_images
+
+
+class Command(BaseCommand):
+    help = 'Create the missing image renditions of all textbooks across a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=16, help='Images handed to a worker at once')
+        parser.add_argument('--key-set', default=RENDITION_KEY_SET, help='VERSATILEIMAGEFIELD_RENDITION_KEY_SETS entry')
+
+    def handle(self, *args, **options):
+        # Textbooks sharing a stored image share its renditions as well.
+        names = list(
+            Textbook.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        if not names:
+            self.stdout.write(self.style.WARNING('No textbook images to warm.'))
+            return
+
+        self.stdout.write(f'Warming renditions of {len(names)} images...')
+        created = skipped = failed = 0
+        started = time.perf_counter()
+        for done, (image_created, image_skipped, image_failed) in enumerate(
+            warm_images(names, options['workers'], options['chunk_size'], options['key_set']), start=1,
+        ):
+            created += image_created
+            skipped += image_skipped
+            failed += image_failed
+            if done % 500 == 0:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{done}/{len(names)} images, {done / elapsed:.1f} images/s')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(names)} images in {elapsed:.2f}s ({len(names) / elapsed:.1f} images/s): '
+            f'{created} renditions created, {skipped} already existed, {failed} failed'
+        ))
@@ -0,0 +1,165 @@
+"""
+Delivery of the ``MEDIA_ROOT`` files under ``MEDIA_URL``.
+
+``MEDIA_DELIVERY`` picks who sends the bytes. ``django`` streams them from
+the worker, answering byte ranges and conditional requests itself, for
+development and deployments without a front proxy. ``x-accel-redirect``
+(nginx) and ``x-sendfile`` (Apache, lighttpd) answer with the file's
+location only, the proxy sends it and handles ranges and conditional
+requests, and the worker spends no time on the transfer.
+
+Content addressed images (``marketplace.storage``) and their renditions
+never change under their name, a new image gets a new name and so do its
+renditions, so they are cached by clients and CDNs for good. Images stored
+before content addressing are revalidated instead, until ``dedupe_media``
+moves them.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import filepath_to_uri
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import textbook_image_storage
+
+DELIVERY_MODES = ('django', 'x-accel-redirect', 'x-sendfile')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """``length`` bytes of ``file`` from its current position, for ``FileResponse``."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def cache_control(name):
+    return IMMUTABLE if textbook_image_storage.is_immutable(name) else REVALIDATE
+
+
+def content_type(name):
+    content_type, encoding = mimetypes.guess_type(name)
+    # Compressed files are sent as they are, not decoded by the browser.
+    return content_type if content_type and encoding is None else 'application/octet-stream'
+
+
+def file_etag(file_stat):
+    # nginx's format, so the ETag doesn't change with MEDIA_DELIVERY.
+    return f'"{int(file_stat.st_mtime):x}-{file_stat.st_size:x}"'
+
+
+def byte_range(request, size, etag, last_modified):
+    """
+    ``(start, end)`` of the one byte range a ``GET`` asks for, ``None`` for
+    the whole file: without a range, with several, or one that doesn't match
+    ``If-Range``. Raises ``RangeNotSatisfiable`` when it starts past the end.
+    """
+    header = request.headers.get('Range')
+    if not header or request.method != 'GET':
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # A suffix, the last bytes of the file, of which an empty one has none.
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _send_file(request, path, name):
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404
+    etag, last_modified = file_etag(file_stat), int(file_stat.st_mtime)
+    headers = {'ETag': etag, 'Last-Modified': http_date(last_modified), 'Cache-Control': cache_control(name)}
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        for header, value in headers.items():
+            response[header] = value
+        return response
+    try:
+        requested = byte_range(request, file_stat.st_size, etag, last_modified)
+    except RangeNotSatisfiable:
+        return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{file_stat.st_size}'})
+
+    file = open(path, 'rb')
+    if requested is None:
+        response = FileResponse(file, content_type=content_type(name))
+    else:
+        start, end = requested
+        file.seek(start)
+        response = FileResponse(FileRange(file, end - start + 1), status=206, content_type=content_type(name))
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{file_stat.st_size}'
+    for header, value in headers.items():
+        response[header] = value
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """The ``MEDIA_ROOT`` file ``path``, sent as ``MEDIA_DELIVERY`` says."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    name = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+    delivery = settings.MEDIA_DELIVERY
+    if delivery == 'django':
+        return _send_file(request, full_path, name)
+    if path.endswith('/'):
+        raise Http404
+
+    # The proxy checks that the file exists, sets its validators and
+    # answers ranges and conditional requests; its location is all it needs.
+    response = HttpResponse(content_type=content_type(name))
+    response['Cache-Control'] = cache_control(name)
+    if delivery == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + filepath_to_uri(name)
+    elif delivery == 'x-sendfile':
+        response['X-Sendfile'] = full_path
+    else:
+        raise ImproperlyConfigured(f'MEDIA_DELIVERY must be one of {", ".join(DELIVERY_MODES)}, not {delivery!r}')
+    return response
@@ -0,0 +1,230 @@
+"""
+Per-request performance metrics.
+
+``MetricsMiddleware`` measures every request: wall time, database queries and
+their time, response size and the phases code reports with ``timer()``
+(``auth``, ``serialize``, ``images``, ``render``). They are sent back as a
+``Server-Timing`` header and aggregated into histograms served at ``/metrics``
+in the Prometheus text format.
+
+Every process aggregates in memory and writes its totals to its own file in
+``settings.METRICS_DIR`` at most every ``METRICS_FLUSH_INTERVAL`` seconds.
+``/metrics`` merges the files of all processes, so a scrape sees the requests
+of every gunicorn worker whichever worker answers it. Files of exited workers
+are kept as counters must never go backwards; clear the directory when
+(re)deploying.
+"""
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Wall time of requests in Django', DURATION_BUCKETS),
+    'http_request_db_queries': ('Database queries per request', QUERY_BUCKETS),
+    'http_request_db_duration_seconds': ('Time per request spent in database queries', DURATION_BUCKETS),
+    'http_request_auth_duration_seconds': ('Time per request spent authenticating', DURATION_BUCKETS),
+    'http_request_serialize_duration_seconds': ('Time per request spent in serializers', DURATION_BUCKETS),
+    'http_request_images_duration_seconds': ('Time per request spent building image URLs', DURATION_BUCKETS),
+    'http_request_similarity_duration_seconds': ('Time per request spent searching similar listings', DURATION_BUCKETS),
+    'http_request_render_duration_seconds': ('Time per request spent rendering the body', DURATION_BUCKETS),
+    'http_response_size_bytes': ('Size of response bodies', SIZE_BUCKETS),
+}
+PHASES = ('auth', 'serialize', 'images', 'similarity', 'render')
+LABELS = ('view', 'method', 'status')
+
+# name: (help, label names)
+COUNTERS = {
+    'db_queries_total': ('Database queries by connection alias', ('alias',)),
+}
+
+# Phase durations of the request being handled, unset outside of requests or
+# with the middleware disabled.
+current_timings = ContextVar('request_timings', default=None)
+
+
+def add_timing(phase, duration):
+    timings = current_timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + duration
+
+
+@contextmanager
+def timer(phase):
+    """Add the time spent in the block to ``phase`` of the current request."""
+    if current_timings.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(phase, time.perf_counter() - started)
+
+
+def server_timing(timings, queries, total):
+    """``Server-Timing`` header value, durations in milliseconds."""
+    entries = [f'db;dur={queries.duration * 1000:.2f};desc="{queries.count} queries"']
+    entries += [f'{phase};dur={timings[phase] * 1000:.2f}' for phase in PHASES if phase in timings]
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
+
+
+class Registry:
+    """Histograms and counters of this process, merged with the other processes' on collect."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.samples = {}
+        self.flushed_at = 0.0
+        atexit.register(self.flush)
+
+    def _check_pid(self):
+        if self.pid != os.getpid():
+            self._reset_after_fork()
+
+    def _reset_after_fork(self):
+        # Forked processes start empty and write their own file, or the
+        # parent's observations would be counted twice.
+        self.pid = os.getpid()
+        self.path = os.path.join(settings.METRICS_DIR, f'{self.pid}-{time.time_ns()}.json')
+        self.samples = {}
+        # Snapshots are numbered, so a slow writer can't replace the file
+        # with an older one than the last written.
+        self.write_lock = threading.Lock()
+        self.snapshots = 0
+        self.written = 0
+
+    def observe_request(self, labels, values):
+        """Record ``{histogram name: value}`` for one request."""
+        snapshot = None
+        with self.lock:
+            self._check_pid()
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][1]
+                sample = self.samples.get((name, labels))
+                if sample is None:
+                    # Count per bucket (the last one is +Inf), then the sum.
+                    sample = self.samples[(name, labels)] = [0] * (len(buckets) + 1) + [0.0]
+                sample[bisect.bisect_left(buckets, value)] += 1
+                sample[-1] += value
+            # Claimed under the lock, so one request per interval writes.
+            if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+                snapshot = self._snapshot()
+        if snapshot is not None:
+            self._write(*snapshot)
+
+    def inc(self, name, labels, amount=1):
+        """Add ``amount`` to a counter, written out with the next request's flush."""
+        with self.lock:
+            self._check_pid()
+            sample = self.samples.get((name, labels))
+            if sample is None:
+                sample = self.samples[(name, labels)] = [0]
+            sample[0] += amount
+
+    def flush(self):
+        with self.lock:
+            if self.pid != os.getpid() or not self.samples:
+                return
+            snapshot = self._snapshot()
+        self._write(*snapshot)
+
+    def _snapshot(self):
+        """Called with the lock held, copies the samples other requests keep changing."""
+        self.flushed_at = time.monotonic()
+        self.snapshots += 1
+        samples = [[name, list(labels), list(sample)] for (name, labels), sample in self.samples.items()]
+        return self.snapshots, self.path, samples
+
+    def _write(self, number, path, samples):
+        with self.write_lock:
+            if number < self.written:
+                return
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, temporary = tempfile.mkstemp(dir=directory, prefix=f'{self.pid}-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as output:
+                    json.dump(samples, output)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+            self.written = number
+
+    def collect(self):
+        """Merged samples of all processes, ``{(name, labels): sample}``."""
+        self.flush()
+        merged = {}
+        try:
+            filenames = os.listdir(settings.METRICS_DIR)
+        except FileNotFoundError:
+            return merged
+        for filename in filenames:
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, filename)) as source:
+                    snapshot = json.load(source)
+            except (OSError, ValueError):
+                continue
+            for name, labels, sample in snapshot:
+                if name in HISTOGRAMS:
+                    expected = len(HISTOGRAMS[name][1]) + 2
+                else:
+                    expected = 1 if name in COUNTERS else None
+                if len(sample) != expected:
+                    continue
+                key = (name, tuple(labels))
+                if key in merged:
+                    merged[key] = [total + value for total, value in zip(merged[key], sample)]
+                else:
+                    merged[key] = sample
+        return merged
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        samples = self.collect()
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (sample_name, labels), sample in sorted(samples.items()):
+                if sample_name != name:
+                    continue
+                label_text = ','.join(f'{key}="{escape(value)}"' for key, value in zip(LABELS, labels))
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), sample[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label_text}}} {sample[-1]}')
+                lines.append(f'{name}_count{{{label_text}}} {cumulative}')
+        for name, (help_text, label_names) in COUNTERS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (sample_name, labels), sample in sorted(samples.items()):
+                if sample_name == name:
+                    label_text = ','.join(f'{key}="{escape(value)}"' for key, value in zip(label_names, labels))
+                    lines.append(f'{name}{{{label_text}}} {sample[0]}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
@@ -0,0 +1,136 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import add_timing, current_timings, registry, server_timing
+from .query_budget import QueryBudgetExceeded, acount_queries, count_queries
+from .routers import achoose_read_alias, astick_to_primary, choose_read_alias, read_alias, stick_to_primary
+
+
+class QueryBudgetMiddleware:
+    """
+    Debug middleware failing any request that runs more queries than its view
+    allows. Views set ``query_budget = <n>``, everything else falls back to
+    ``settings.QUERY_BUDGET_DEFAULT``. Enabled with ``QUERY_BUDGET_ENABLED``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with count_queries(using=None) as counter:
+            response = self.get_response(request)
+        budget = getattr(request, '_query_budget', settings.QUERY_BUDGET_DEFAULT)
+        if budget is not None and counter.count > budget:
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.path} ran {counter.count} queries, budget is {budget}:\n'
+                + '\n'.join(counter.statements)
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        if view_class is not None and hasattr(view_class, 'query_budget'):
+            request._query_budget = view_class.query_budget
+
+
+class MetricsMiddleware:
+    """
+    Times every request, adds a ``Server-Timing`` header and records the
+    request in the ``/metrics`` histograms, see ``marketplace.metrics``.
+    Enabled with ``METRICS_ENABLED``, put it first to include the other
+    middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = {}
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with count_queries(using=None) as queries:
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.record(request, response, timings, queries, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timings = {}
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            async with acount_queries(using=None) as queries:
+                response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.record(request, response, timings, queries, time.perf_counter() - started)
+
+    def record(self, request, response, timings, queries, total):
+        response['Server-Timing'] = server_timing(timings, queries, total)
+        match = request.resolver_match
+        labels = (match.view_name if match else 'unmatched', request.method, str(response.status_code))
+        values = {
+            'http_request_duration_seconds': total,
+            'http_request_db_queries': queries.count,
+            'http_request_db_duration_seconds': queries.duration,
+        }
+        for phase, duration in timings.items():
+            values[f'http_request_{phase}_duration_seconds'] = duration
+        if not response.streaming:
+            values['http_response_size_bytes'] = len(response.content)
+        # Counters go first, observe_request() may flush.
+        for alias, count in queries.by_alias.items():
+            registry.inc('db_queries_total', (alias,), count)
+        registry.observe_request(labels, values)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns.
+        started = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: add_timing('render', time.perf_counter() - started))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Chooses the database the request reads from and pins clients that wrote
+    to the primary, see ``marketplace.routers``. Enabled by ``DB_REPLICAS``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = read_alias.set(choose_read_alias(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        stick_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = read_alias.set(await achoose_read_alias(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        await astick_to_primary(request, response)
+        return response
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0003_alter_textbook_image"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="textbook",
+            index=models.Index(
+                fields=["created_at", "id"], name="textbook_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="textbook",
+            index=models.Index(fields=["price", "id"], name="textbook_price_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="textbook",
+            index=models.Index(
+                fields=["seller", "created_at", "id"],
+                name="textbook_seller_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="textbook",
+            index=models.Index(
+                fields=["seller", "price", "id"], name="textbook_seller_price_idx"
+            ),
+        ),
+    ]
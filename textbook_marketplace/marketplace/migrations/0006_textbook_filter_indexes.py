@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0005_textbook_search"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="textbook",
+            index=models.Index(
+                fields=["school_class", "condition", "price"],
+                name="textbook_facets_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="textbook",
+            index=models.Index(
+                fields=["condition", "price"], name="textbook_condition_price_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="textbook",
+            index=models.Index(
+                fields=["publisher", "price"], name="textbook_publisher_price_idx"
+            ),
+        ),
+    ]
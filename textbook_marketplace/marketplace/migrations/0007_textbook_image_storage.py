@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:53
+
+import marketplace.storage
+import versatileimagefield.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0006_textbook_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="textbook",
+            name="image",
+            field=versatileimagefield.fields.VersatileImageField(
+                blank=True,
+                null=True,
+                storage=marketplace.storage.get_textbook_image_storage,
+                upload_to="textbook_images/",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="textbook",
+            index=models.Index(fields=["image"], name="textbook_image_idx"),
+        ),
+    ]
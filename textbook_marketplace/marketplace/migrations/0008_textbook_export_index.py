@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0007_textbook_image_storage"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="textbook",
+            index=models.Index(
+                fields=["updated_at", "id"], name="textbook_updated_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def delete_orders_without_buyer(apps, schema_editor):
+    # Orders had no buyer, and no endpoint or admin created them; one that
+    # exists can't be attributed to anybody.
+    apps.get_model("marketplace", "Order").objects.filter(buyer__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0008_textbook_export_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="textbook",
+            name="stock",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="buyer",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="orders",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.RunPython(delete_orders_without_buyer, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="order",
+            name="buyer",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="orders",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="idempotency_key",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="order",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("idempotency_key__isnull", False)),
+                fields=("buyer", "idempotency_key", "textbook"),
+                name="order_idempotency_key",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["buyer", "order_date", "id"], name="order_buyer_date_idx"
+            ),
+        ),
+    ]
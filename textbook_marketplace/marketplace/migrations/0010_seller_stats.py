@@ -0,0 +1,62 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def build_seller_stats(apps, schema_editor):
+    Textbook = apps.get_model("marketplace", "Textbook")
+    SellerStats = apps.get_model("marketplace", "SellerStats")
+    rows = Textbook.objects.order_by().values("seller_id").annotate(
+        listing_count=Count("*"),
+        price_sum=Sum("price"),
+        min_price=Min("price"),
+        max_price=Max("price"),
+        last_listed_at=Max("created_at"),
+    )
+    SellerStats.objects.bulk_create((SellerStats(**row) for row in rows), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0009_order_placement"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SellerStats",
+            fields=[
+                (
+                    "seller",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="listing_stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("listing_count", models.PositiveIntegerField(default=0)),
+                (
+                    "price_sum",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "min_price",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=6, null=True
+                    ),
+                ),
+                (
+                    "max_price",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=6, null=True
+                    ),
+                ),
+                ("last_listed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(build_seller_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:40
+
+from collections import Counter
+
+from django.db import migrations, models
+
+KINDS = ("title", "author", "publisher")
+
+
+def build_suggestions(apps, schema_editor):
+    # marketplace.suggest.rebuild_suggestions() against the historical models.
+    Textbook = apps.get_model("marketplace", "Textbook")
+    Suggestion = apps.get_model("marketplace", "Suggestion")
+    counts, terms = Counter(), {}
+    for values in Textbook.objects.order_by().values(*KINDS).iterator(chunk_size=10_000):
+        for kind in KINDS:
+            value = " ".join((values[kind] or "").split())
+            if value:
+                key = (kind, value.casefold()[:255])
+                counts[key] += 1
+                terms.setdefault(key, value[:255])
+    Suggestion.objects.bulk_create(
+        (
+            Suggestion(kind=kind, normalized=normalized, term=terms[kind, normalized], listing_count=count)
+            for (kind, normalized), count in counts.items()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0010_seller_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Suggestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("title", "Title"),
+                            ("author", "Author"),
+                            ("publisher", "Publisher"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("term", models.CharField(max_length=255)),
+                ("normalized", models.CharField(max_length=255)),
+                ("listing_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("kind", "normalized"),
+                        include=("listing_count", "term"),
+                        name="suggestion_kind_normalized",
+                        opclasses=["varchar_pattern_ops", "varchar_pattern_ops"],
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_suggestions, migrations.RunPython.noop),
+    ]
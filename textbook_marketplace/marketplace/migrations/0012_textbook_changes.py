@@ -0,0 +1,51 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:18
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0011_suggestions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TextbookChange",
+            fields=[
+                (
+                    "textbook_id",
+                    models.BigIntegerField(primary_key=True, serialize=False),
+                ),
+                (
+                    "transaction_id",
+                    models.BigIntegerField(
+                        db_default=django.db.models.functions.comparison.Cast(
+                            django.db.models.functions.comparison.Cast(
+                                models.Func(function="pg_current_xact_id"),
+                                models.TextField(),
+                            ),
+                            models.BigIntegerField(),
+                        )
+                    ),
+                ),
+                ("deleted", models.BooleanField(default=False)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["transaction_id", "textbook_id"],
+                        name="textbookchange_sequence_idx",
+                    )
+                ],
+            },
+        ),
+        # Every existing listing is a change for clients starting the feed.
+        migrations.RunSQL(
+            """
+            INSERT INTO marketplace_textbookchange (textbook_id, deleted)
+            SELECT id, false FROM marketplace_textbook
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
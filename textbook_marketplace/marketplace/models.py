@@ -1,7 +1,19 @@
-from django.db import models
+from decimal import Decimal
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Cast
 from versatileimagefield.fields import VersatileImageField
 from django.contrib.auth.models import AbstractUser, Group, Permission
 
+from .storage import get_textbook_image_storage
+
+# Language agnostic on purpose: listings mix Serbian (latin and cyrillic) and
+# English titles, so stemming for one language would hurt the others.
+SEARCH_CONFIG = 'simple'
+
+
 class User(AbstractUser):
     # username = models.CharField(max_length=255, unique=True)
     # groups = models.ManyToManyField(Group, related_name='marketplace_user_set')
@@ -13,6 +25,12 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+class TextbookManager(models.Manager):
+    def get_queryset(self):
+        # search_vector is only ever used inside SQL, don't ship it to Python.
+        return super().get_queryset().defer('search_vector')
+
+
 class Textbook(models.Model):
     title = models.CharField(max_length=255)
     author = models.CharField(max_length=255)
@@ -31,15 +49,161 @@ class Textbook(models.Model):
         ('Used - Good', 'Used - Good'),
         ('Used - Fair', 'Used - Fair'),
     ], default='Used - Good')
-    image = VersatileImageField(upload_to='textbook_images/', blank=True, null=True)
+    # Content addressed: identical uploads share one file and its renditions.
+    image = VersatileImageField(
+        upload_to='textbook_images/', storage=get_textbook_image_storage, blank=True, null=True,
+    )
+    # Copies left, taken by orders with a conditional update, see marketplace.orders.
+    stock = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)  
     updated_at = models.DateTimeField(auto_now=True) 
+    # Computed by Postgres on every insert/update, so bulk writes keep it current too.
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('author', weight='B', config=SEARCH_CONFIG)
+            + SearchVector('publisher', weight='C', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = TextbookManager()
+
+    TRACKED_FIELDS = ('seller_id', 'price', 'title', 'author', 'publisher')
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='textbook_search_vector_idx'),
+            # Typo tolerant fallback of the search endpoint, needs pg_trgm.
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='textbook_title_trgm_idx'),
+            GinIndex(fields=['author'], opclasses=['gin_trgm_ops'], name='textbook_author_trgm_idx'),
+            # Keyset pagination orders, see marketplace.pagination.
+            models.Index(fields=['created_at', 'id'], name='textbook_created_id_idx'),
+            models.Index(fields=['price', 'id'], name='textbook_price_id_idx'),
+            models.Index(fields=['seller', 'created_at', 'id'], name='textbook_seller_created_idx'),
+            models.Index(fields=['seller', 'price', 'id'], name='textbook_seller_price_idx'),
+            # Filters of marketplace.filters.TextbookFilter. The first one also
+            # covers the facet GROUP BY, so facets come from an index-only scan.
+            models.Index(fields=['school_class', 'condition', 'price'], name='textbook_facets_idx'),
+            models.Index(fields=['condition', 'price'], name='textbook_condition_price_idx'),
+            models.Index(fields=['publisher', 'price'], name='textbook_publisher_price_idx'),
+            # Incremental exports, see marketplace.export.
+            models.Index(fields=['updated_at', 'id'], name='textbook_updated_id_idx'),
+            # Reference counting of shared image files, see marketplace.storage.
+            models.Index(fields=['image'], name='textbook_image_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # One transaction with what pre_save() and the post_save receivers
+        # write: a new image is stored in the transaction of the row
+        # referencing it (marketplace.storage), and the suggestion counts
+        # change with the row (marketplace.suggest.rebuild_suggestions).
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def remember_loaded_values(self):
+        # The stored values of the fields denormalized elsewhere (seller
+        # statistics, suggestions), what has to be taken back out of them when
+        # the fields change. Deferred fields stay None.
+        self._loaded_values = {name: self.__dict__.get(name) for name in self.TRACKED_FIELDS}
+
 class Order(models.Model):
     textbook = models.ForeignKey(Textbook, on_delete=models.CASCADE)
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders")
     quantity = models.PositiveIntegerField()
     order_date = models.DateTimeField(auto_now_add=True)
-    
\ No newline at end of file
+    # Idempotency-Key of the request that placed the order, see marketplace.orders.
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['buyer', 'idempotency_key', 'textbook'], name='order_idempotency_key',
+                condition=models.Q(idempotency_key__isnull=False),
+            ),
+        ]
+        indexes = [
+            # A buyer's orders, newest first, see marketplace.pagination.
+            models.Index(fields=['buyer', 'order_date', 'id'], name='order_buyer_date_idx'),
+        ]
+    
+
+class SellerStats(models.Model):
+    """
+    Aggregates of a seller's listings, kept up to date by
+    ``marketplace.seller_stats`` as listings are created, changed and deleted.
+    """
+    seller = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="listing_stats")
+    listing_count = models.PositiveIntegerField(default=0)
+    # The sum rather than the average, so adding and removing a listing are
+    # both a single increment.
+    price_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    min_price = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    last_listed_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def avg_price(self):
+        if not self.listing_count:
+            return None
+        return (self.price_sum / self.listing_count).quantize(Decimal('0.01'))
+
+
+class Suggestion(models.Model):
+    """
+    A distinct title, author or publisher and the number of listings with it,
+    the typeahead index of ``marketplace.suggest``.
+    """
+    KINDS = ('title', 'author', 'publisher')
+
+    kind = models.CharField(max_length=16, choices=[(kind, kind.capitalize()) for kind in KINDS])
+    # As first listed; ``normalized`` is what prefixes are matched against.
+    term = models.CharField(max_length=255)
+    normalized = models.CharField(max_length=255)
+    listing_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also serves the LIKE 'prefix%' range scans, whatever the database
+            # collation; covering, so ranking the matches doesn't visit the table.
+            models.UniqueConstraint(
+                fields=['kind', 'normalized'], opclasses=['varchar_pattern_ops', 'varchar_pattern_ops'],
+                include=['listing_count', 'term'], name='suggestion_kind_normalized',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}: {self.term}'
+
+
+class TextbookChange(models.Model):
+    """
+    The last change of a listing, the delta feed of ``marketplace.changes``:
+    one row per listing ever saved, a tombstone once it is deleted.
+    """
+    # Not a foreign key, the row outlives the listing.
+    textbook_id = models.BigIntegerField(primary_key=True)
+    # pg_current_xact_id() of the transaction that wrote the row, as bigint.
+    transaction_id = models.BigIntegerField(
+        db_default=Cast(Cast(models.Func(function='pg_current_xact_id'), models.TextField()), models.BigIntegerField()),
+    )
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['transaction_id', 'textbook_id'], name='textbookchange_sequence_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.textbook_id} {"deleted" if self.deleted else "saved"} in {self.transaction_id}'
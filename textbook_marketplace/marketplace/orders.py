@@ -0,0 +1,110 @@
+"""
+Order placement.
+
+Stock is taken with one conditional ``UPDATE ... SET stock = stock - n WHERE
+stock >= n`` per textbook, so concurrent orders of the last copies can't
+oversell: Postgres re-checks the condition against the committed row when an
+update waits on another one, and the row lock is only held until the order
+commits, not across a read and a write. A checkout of several textbooks
+takes them in id order, so two carts never wait on each other's rows.
+
+Clients send an ``Idempotency-Key`` header with a POST to make it safe to
+retry. The key is stored on the orders it placed, unique per buyer and
+textbook, and a request repeating a key gets the orders placed under it
+instead of new ones, also when the retry races the original request.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import exceptions, status
+
+from .cache import bump_catalog_version, invalidate_textbook
+from .changes import textbooks_changed
+from .live import publish_saved
+from .models import Order, Textbook
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+class OutOfStock(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Not enough copies in stock.'
+    default_code = 'out_of_stock'
+
+
+class IdempotencyKeyReused(exceptions.APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'The Idempotency-Key was already used for different items.'
+    default_code = 'idempotency_key_reused'
+
+
+def _replay(buyer, items, idempotency_key):
+    """The orders placed under ``idempotency_key``, ``None`` if there are none."""
+    orders = list(
+        Order.objects.filter(buyer=buyer, idempotency_key=idempotency_key)
+        .select_related('textbook', 'buyer').order_by('id')
+    )
+    if not orders:
+        return None
+    if {order.textbook_id: order.quantity for order in orders} != items:
+        raise IdempotencyKeyReused()
+    return orders
+
+
+def _take_stock(items):
+    """Decrement the stock of ``{textbook id: quantity}``, see the module docstring."""
+    now = timezone.now()
+    for pk in sorted(items):
+        taken = Textbook.objects.filter(pk=pk, stock__gte=items[pk]).update(
+            stock=F('stock') - items[pk], updated_at=now,
+        )
+        if not taken:
+            if not Textbook.objects.filter(pk=pk).exists():
+                raise exceptions.ValidationError({'textbook': [f'Invalid pk "{pk}" - object does not exist.']})
+            raise OutOfStock({'textbook': [f'Not enough copies of {pk} in stock.']})
+    textbooks_changed(items)
+    publish_saved(items)
+
+
+def place_orders(buyer, items, idempotency_key=None):
+    """
+    Order ``items``, ``(textbook id, quantity)`` pairs, for ``buyer``: all or
+    none of them. Returns ``(orders, created)``, ``created`` is ``False`` when
+    ``idempotency_key`` was already used for the same items.
+    """
+    quantities = Counter()
+    for textbook_id, quantity in items:
+        quantities[textbook_id] += quantity
+    quantities = dict(quantities)
+
+    if idempotency_key is not None:
+        orders = _replay(buyer, quantities, idempotency_key)
+        if orders is not None:
+            return orders, False
+    try:
+        with transaction.atomic():
+            _take_stock(quantities)
+            orders = Order.objects.bulk_create([
+                Order(buyer=buyer, textbook_id=pk, quantity=quantity, idempotency_key=idempotency_key)
+                for pk, quantity in quantities.items()
+            ])
+    except (IntegrityError, OutOfStock):
+        # A concurrent request with the same key may have committed first,
+        # then the stock taken here was rolled back, or it took the last
+        # copies.
+        orders = _replay(buyer, quantities, idempotency_key) if idempotency_key is not None else None
+        if orders is None:
+            raise
+        return orders, False
+
+    # For the representation, and the cached listings that show the stock.
+    textbooks = Textbook.objects.select_related('seller').only('title', 'seller__username').in_bulk(quantities)
+    for order in orders:
+        order.textbook = textbooks[order.textbook_id]
+    for seller_id in {textbook.seller_id for textbook in textbooks.values()}:
+        bump_catalog_version(seller_id=seller_id)
+    for pk in textbooks:
+        invalidate_textbook(pk)
+    return orders, True
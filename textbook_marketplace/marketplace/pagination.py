@@ -0,0 +1,175 @@
+import binascii
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on ``(<ordering field>, id)``.
+
+    Every page is fetched with a ``WHERE (field, id) > (last_field, last_id)``
+    style range condition instead of ``OFFSET``, so with a matching composite
+    index a deep page costs the same as the first one. Cursors are opaque
+    base64 tokens that also remember the ordering they were issued for.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    ordering_fields = ('created_at', 'price')
+    default_ordering = '-created_at'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        """The query for the requested page plus one row to tell if there are more."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        self.field = self.ordering.lstrip('-')
+        self.descending = self.ordering.startswith('-')
+
+        self.cursor = cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['reverse'])
+        descending = self.descending != reverse
+
+        queryset = queryset.order_by(*self.get_ordering_clause(descending))
+        if cursor is not None:
+            queryset = queryset.filter(
+                *self.get_keyset_filter(cursor['value'], cursor['id'], descending)
+            )
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        cursor = self.cursor
+        if cursor is not None and cursor['reverse']:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if ordering.lstrip('-') not in self.ordering_fields:
+            return self.default_ordering
+        return ordering
+
+    def get_ordering_clause(self, descending):
+        prefix = '-' if descending else ''
+        return (prefix + self.field, prefix + self.tiebreaker)
+
+    def get_keyset_filter(self, value, pk, descending):
+        # The redundant lte/gte bound lets Postgres use the composite index as a
+        # range scan, the OR only has to filter rows tied on the field value.
+        op = 'lt' if descending else 'gt'
+        bound = 'lte' if descending else 'gte'
+        return (
+            Q(**{f'{self.field}__{bound}': value}),
+            Q(**{f'{self.field}__{op}': value})
+            | Q(**{self.field: value, f'{self.tiebreaker}__{op}': pk}),
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        # Pages are model instances, or values() rows.
+        if isinstance(instance, Mapping):
+            value, pk = instance[self.field], instance[self.tiebreaker]
+        else:
+            value, pk = getattr(instance, self.field), getattr(instance, self.tiebreaker)
+        payload = {
+            'o': self.ordering,
+            'v': value.isoformat() if hasattr(value, 'isoformat') else str(value),
+            'id': pk,
+        }
+        if reverse:
+            payload['r'] = 1
+        token = b64encode(json.dumps(payload, separators=(',', ':')).encode('ascii'))
+        return replace_query_param(self.base_url, self.cursor_query_param, token.decode('ascii'))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            payload = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            if payload['o'] != self.ordering:
+                raise ValueError('cursor was issued for another ordering')
+            model_field = self.model._meta.get_field(self.field)
+            return {
+                'value': model_field.to_python(payload['v']),
+                'id': int(payload['id']),
+                'reverse': bool(payload.get('r')),
+            }
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class OrderPagination(KeysetPagination):
+    """A buyer's orders, newest first."""
+    ordering_fields = ('order_date',)
+    default_ordering = '-order_date'
@@ -0,0 +1,100 @@
+import time
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """``execute_wrapper`` that counts and times queries, works with ``DEBUG = False`` too."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+        self.by_alias = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        alias = context['connection'].alias
+        self.by_alias[alias] = self.by_alias.get(alias, 0) + 1
+        self.statements.append(sql)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+
+
+def _aliases(using):
+    return list(connections) if using is None else [using]
+
+
+@contextmanager
+def count_queries(using=DEFAULT_DB_ALIAS):
+    """Count the queries on ``using``, on every database when it is ``None``."""
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for alias in _aliases(using):
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        yield counter
+
+
+@asynccontextmanager
+async def acount_queries(using=DEFAULT_DB_ALIAS):
+    """``count_queries`` for async code, the async ORM queries on a worker thread."""
+    counter = QueryCounter()
+    wrappers = await sync_to_async(
+        lambda: [connections[alias].execute_wrappers for alias in _aliases(using)]
+    )()
+    for alias_wrappers in wrappers:
+        alias_wrappers.append(counter)
+    try:
+        yield counter
+    finally:
+        for alias_wrappers in wrappers:
+            alias_wrappers.remove(counter)
+
+
+@contextmanager
+def query_budget(max_queries, using=DEFAULT_DB_ALIAS, label='block'):
+    """
+    Fail when the wrapped block runs more than ``max_queries`` queries::
+
+        with query_budget(3):
+            client.get('/api/textbooks/')
+    """
+    with count_queries(using) as counter:
+        yield counter
+    if counter.count > max_queries:
+        raise QueryBudgetExceeded(
+            f'{label} ran {counter.count} queries, budget is {max_queries}:\n'
+            + '\n'.join(counter.statements)
+        )
+
+
+def assert_queries_do_not_grow(fetch, grow, using=DEFAULT_DB_ALIAS):
+    """
+    Test helper catching N+1 queries: count the queries of ``fetch()``, call
+    ``grow()`` to add more rows to the result, then fail if ``fetch()`` needs
+    more queries than before::
+
+        assert_queries_do_not_grow(
+            lambda: client.get('/api/textbooks/'),
+            lambda: make_textbooks(10),
+        )
+    """
+    with count_queries(using) as before:
+        fetch()
+    grow()
+    with count_queries(using) as after:
+        fetch()
+    if after.count > before.count:
+        raise QueryBudgetExceeded(
+            f'query count grew with the result size: {before.count} -> {after.count}:\n'
+            + '\n'.join(after.statements)
+        )
@@ -0,0 +1,102 @@
+"""
+Pre-generation of the ``marketplace`` VersatileImageField renditions.
+
+VersatileImageField resizes lazily, inside whichever request first asks for
+a size. Warming the renditions right after a textbook is saved (on a small
+background thread pool) and in bulk with ``manage.py warm_renditions`` (on a
+process pool) keeps Pillow out of the request path. The request saving the
+textbook doesn't render them either, its response only has their URLs.
+"""
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import reduce
+
+from django.conf import settings
+from versatileimagefield.utils import (
+    get_rendition_key_set,
+    get_resized_path,
+    validate_versatileimagefield_sizekey_list,
+)
+
+from .bulk import close_db_connections, init_worker
+from .models import Textbook
+
+logger = logging.getLogger(__name__)
+
+RENDITION_KEY_SET = 'marketplace'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rendition_size_keys(key_set=RENDITION_KEY_SET):
+    """``['thumbnail__240x312', 'crop__324x420']``, the original (``url``) is skipped."""
+    return [
+        size_key
+        for _, size_key in validate_versatileimagefield_sizekey_list(get_rendition_key_set(key_set))
+        if '__' in size_key
+    ]
+
+
+def warm_image(name, size_keys):
+    """
+    Create the missing renditions of the stored image ``name``.
+
+    Returns ``(created, skipped, failed)`` rendition counts.
+    """
+    field_file = Textbook(image=name).image
+    created = skipped = failed = 0
+    for size_key in size_keys:
+        *sizer_path, size = size_key.split('__')
+        try:
+            sizer = reduce(getattr, sizer_path, field_file)
+            width, height = (int(i) for i in size.split('x'))
+            resized_path = get_resized_path(
+                path_to_image=sizer.path_to_image,
+                width=width,
+                height=height,
+                filename_key=sizer.get_filename_key(),
+                storage=sizer.storage,
+            )
+            if sizer.storage.exists(resized_path):
+                skipped += 1
+                continue
+            sizer.create_on_demand = True
+            sizer[size]
+            created += 1
+        except Exception:
+            failed += 1
+            logger.exception('Rendition %s of %s failed', size_key, name)
+    return created, skipped, failed
+
+
+def _warm_image_task(args):
+    return warm_image(*args)
+
+
+def warm_images(names, workers=None, chunksize=16, key_set=RENDITION_KEY_SET):
+    """
+    Warm the renditions of ``names`` across a process pool, yielding the
+    ``(created, skipped, failed)`` counts per image as they complete.
+    """
+    size_keys = rendition_size_keys(key_set)
+    close_db_connections()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        yield from pool.map(_warm_image_task, ((name, size_keys) for name in names), chunksize=chunksize)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RENDITION_WARM_WORKERS,
+                thread_name_prefix='renditions',
+            )
+    return _executor
+
+
+def schedule_warm_renditions(name):
+    """Warm ``name``'s renditions in the background of the current process."""
+    get_executor().submit(warm_image, name, rendition_size_keys())
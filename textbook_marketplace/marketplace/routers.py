@@ -0,0 +1,155 @@
+"""
+Read replica routing.
+
+With ``DB_REPLICAS`` set, ``ReplicaRoutingMiddleware`` sends the reads of
+safe requests (GET, HEAD, OPTIONS) to a replica, picked once per request so
+all of its queries see the same snapshot. Writes, the reads of other requests
+and of transactions, and everything outside of requests (management
+commands, the shell) use ``default``, the primary.
+
+Replicas lag behind the primary. So that clients read their own writes, an
+unsafe request pins its client to the primary for ``REPLICA_STICKY_SECONDS``:
+the response sets a signed cookie and, for API clients that don't keep
+cookies, the user of its bearer token is marked in the
+``REPLICA_STICKY_CACHE_ALIAS`` cache. Like the catalog cache, that mark needs
+a shared backend when running several workers.
+
+Responses stored in the catalog cache are built from the primary
+(``use_primary``), or replica lag would be cached for
+``CATALOG_CACHE_TIMEOUT``.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+STICKY_COOKIE = 'db_primary'
+STICKY_COOKIE_SALT = 'marketplace.routers'
+
+# Alias the current request reads from, unset outside of requests.
+read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary in the block."""
+    token = read_alias.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def _sticky_key(user_id):
+    return f'db:primary:user:{user_id}'
+
+
+def _get_cache():
+    return caches[settings.REPLICA_STICKY_CACHE_ALIAS]
+
+
+def token_user_id(request):
+    """The user id of the request's bearer token, ``None`` without a valid one."""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    try:
+        raw_token = authentication.get_raw_token(header)
+        if raw_token is None:
+            return None
+        return authentication.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+    except AuthenticationFailed:
+        # Authentication rejects the request later, any alias will do.
+        return None
+
+
+def _has_sticky_cookie(request):
+    value = request.get_signed_cookie(
+        STICKY_COOKIE, default=None, salt=STICKY_COOKIE_SALT, max_age=settings.REPLICA_STICKY_SECONDS,
+    )
+    return value is not None
+
+
+def _pick_replica(request):
+    """A replica alias, ``None`` when the request must use the primary anyway."""
+    replicas = replica_aliases()
+    if not replicas or request.method not in SAFE_METHODS:
+        return None
+    return random.choice(replicas)
+
+
+def choose_read_alias(request):
+    replica = _pick_replica(request)
+    if replica is None or _has_sticky_cookie(request):
+        return DEFAULT_DB_ALIAS
+    user_id = token_user_id(request)
+    if user_id is not None and _get_cache().get(_sticky_key(user_id)) is not None:
+        return DEFAULT_DB_ALIAS
+    return replica
+
+
+async def achoose_read_alias(request):
+    replica = _pick_replica(request)
+    if replica is None or _has_sticky_cookie(request):
+        return DEFAULT_DB_ALIAS
+    user_id = token_user_id(request)
+    if user_id is not None and await _get_cache().aget(_sticky_key(user_id)) is not None:
+        return DEFAULT_DB_ALIAS
+    return replica
+
+
+def _set_sticky_cookie(request, response):
+    """Pin the client of an unsafe request to the primary, returns its token's user id."""
+    if request.method in SAFE_METHODS:
+        return None
+    response.set_signed_cookie(
+        STICKY_COOKIE, '1', salt=STICKY_COOKIE_SALT, max_age=settings.REPLICA_STICKY_SECONDS,
+        httponly=True, samesite='Lax',
+    )
+    return token_user_id(request)
+
+
+def stick_to_primary(request, response):
+    user_id = _set_sticky_cookie(request, response)
+    if user_id is not None:
+        _get_cache().set(_sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+async def astick_to_primary(request, response):
+    user_id = _set_sticky_cookie(request, response)
+    if user_id is not None:
+        await _get_cache().aset(_sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+class PrimaryReplicaRouter:
+    """Writes to the primary, reads from the alias ``ReplicaRoutingMiddleware`` chose."""
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        # Inside a transaction, read what it wrote.
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema by replication.
+        return db == DEFAULT_DB_ALIAS
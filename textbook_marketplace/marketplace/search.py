@@ -0,0 +1,50 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity,
+)
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from .models import SEARCH_CONFIG
+
+
+def full_text_search(queryset, query):
+    """
+    Rank ``queryset`` against ``query`` using the stored, weighted
+    ``Textbook.search_vector`` column (title > author > publisher > description).
+    """
+    search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+    return (
+        queryset
+        .filter(search_vector=search_query)
+        .annotate(rank=SearchRank(F('search_vector'), search_query))
+        .order_by('-rank', '-id')
+    )
+
+
+def trigram_search(queryset, query):
+    """
+    Typo tolerant fallback: word similarity of ``query`` against title and
+    author, served by the ``gin_trgm_ops`` indexes.
+    """
+    return (
+        queryset
+        .filter(Q(title__trigram_word_similar=query) | Q(author__trigram_word_similar=query))
+        .annotate(rank=Greatest(
+            TrigramWordSimilarity(query, 'title'),
+            TrigramWordSimilarity(query, 'author'),
+        ))
+        .order_by('-rank', '-id')
+    )
+
+
+def search_textbooks(queryset, query, limit):
+    """
+    Return ``(textbooks, fuzzy)``, falling back to trigram similarity only when
+    the full-text match is empty.
+    """
+    textbooks = list(full_text_search(queryset, query)[:limit])
+    if textbooks:
+        return textbooks, False
+    return list(trigram_search(queryset, query)[:limit]), True
@@ -0,0 +1,159 @@
+"""
+Per seller listing statistics.
+
+``SellerStats`` holds a seller's listing count, price sum, lowest and highest
+price and last listing time, so seller pages read one row instead of
+aggregating the seller's listings. The row is maintained with single
+``UPDATE`` statements of ``F()`` expressions as listings come and go: counts
+and sums are incremented, new prices are folded in with ``LEAST``/
+``GREATEST``. Only when the listing removed (or repriced) held the lowest or
+highest price or the latest listing time is that value looked up again, from
+the ``(seller, price)`` and ``(seller, created_at)`` indexes.
+
+``marketplace.signals`` calls these for saves and deletes, bulk writes have
+to call them themselves. Concurrent writes to one seller's listings can leave
+a looked up minimum, maximum or time stale, ``recompute_seller_stats``
+repairs the rows (``python manage.py recompute_seller_stats``).
+"""
+from django.db.models import Case, Count, DecimalField, F, Max, Min, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import SellerStats, Textbook, User
+
+STATS_FIELDS = ['listing_count', 'price_sum', 'min_price', 'max_price', 'last_listed_at']
+
+
+def _update(seller_id, **values):
+    return SellerStats.objects.filter(pk=seller_id).update(**values)
+
+
+def _listings_aggregate(seller_id, aggregate):
+    return Subquery(
+        Textbook.objects.filter(seller_id=seller_id).order_by()
+        .values('seller_id').annotate(value=aggregate).values('value')
+    )
+
+
+def _refreshed(field, removed, aggregate, seller_id, otherwise=None):
+    """``field``, or its value looked up again if it was ``removed``."""
+    return Case(
+        When(**{field: removed}, then=_listings_aggregate(seller_id, aggregate)),
+        default=otherwise if otherwise is not None else F(field),
+    )
+
+
+def listings_added(seller_id, textbooks):
+    """Add saved ``textbooks`` of one seller to the seller's statistics."""
+    if not textbooks:
+        return
+    prices = [textbook.price for textbook in textbooks]
+    values = {
+        'listing_count': F('listing_count') + len(textbooks),
+        'price_sum': F('price_sum') + sum(prices),
+        # LEAST and GREATEST skip NULLs, the first listing sets them.
+        'min_price': Least('min_price', Value(min(prices))),
+        'max_price': Greatest('max_price', Value(max(prices))),
+        'last_listed_at': Greatest('last_listed_at', Value(max(textbook.created_at for textbook in textbooks))),
+    }
+    if not _update(seller_id, **values):
+        SellerStats.objects.bulk_create([SellerStats(seller_id=seller_id)], ignore_conflicts=True)
+        _update(seller_id, **values)
+
+
+def listing_removed(seller_id, price, created_at):
+    """Take a deleted listing out of its seller's statistics."""
+    if price is None or created_at is None:
+        recompute_seller_stats([seller_id])
+        return
+    # No row means the seller (being deleted) took it along, or it was never
+    # built; recompute_seller_stats() builds missing rows.
+    _update(
+        seller_id,
+        listing_count=F('listing_count') - 1,
+        price_sum=F('price_sum') - price,
+        min_price=_refreshed('min_price', price, Min('price'), seller_id),
+        max_price=_refreshed('max_price', price, Max('price'), seller_id),
+        last_listed_at=_refreshed('last_listed_at', created_at, Max('created_at'), seller_id),
+    )
+
+
+def price_changed(seller_id, old_price, new_price):
+    """Move a listing of ``seller_id`` from ``old_price`` to ``new_price``."""
+    if old_price == new_price:
+        return
+    updated = _update(
+        seller_id,
+        price_sum=F('price_sum') + (new_price - old_price),
+        min_price=_refreshed('min_price', old_price, Min('price'), seller_id,
+                             otherwise=Least('min_price', Value(new_price))),
+        max_price=_refreshed('max_price', old_price, Max('price'), seller_id,
+                             otherwise=Greatest('max_price', Value(new_price))),
+    )
+    if not updated:
+        recompute_seller_stats([seller_id])
+
+
+def recompute_seller_stats(seller_ids=None):
+    """
+    Rebuild the statistics of ``seller_ids`` (every seller when ``None``) from
+    their listings. Returns the number of sellers with listings.
+    """
+    textbooks = Textbook.objects.order_by()
+    stats = SellerStats.objects.all()
+    if seller_ids is not None:
+        textbooks = textbooks.filter(seller_id__in=seller_ids)
+        stats = stats.filter(pk__in=seller_ids)
+    rows = textbooks.values('seller_id').annotate(
+        listing_count=Count('*'),
+        price_sum=Coalesce(Sum('price'), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        min_price=Min('price'),
+        max_price=Max('price'),
+        last_listed_at=Max('created_at'),
+    )
+    rebuilt = [SellerStats(**row) for row in rows]
+    SellerStats.objects.bulk_create(
+        rebuilt, batch_size=1000, update_conflicts=True, unique_fields=['seller'], update_fields=STATS_FIELDS,
+    )
+    # Sellers without listings whose row isn't empty: their last listing is
+    # gone, or the row drifted. Told apart here: a NOT IN of the listings'
+    # sellers is slow on a big catalog.
+    not_empty = stats.filter(
+        Q(listing_count__gt=0) | ~Q(price_sum=0) | Q(min_price__isnull=False) | Q(max_price__isnull=False)
+        | Q(last_listed_at__isnull=False)
+    )
+    emptied = set(not_empty.values_list('pk', flat=True)) - {row.seller_id for row in rebuilt}
+    SellerStats.objects.filter(pk__in=emptied).update(
+        listing_count=0, price_sum=0, min_price=None, max_price=None, last_listed_at=None,
+    )
+    return len(rebuilt)
+
+
+def _sellers():
+    return User.objects.select_related('listing_stats').only(
+        'username', *[f'listing_stats__{field}' for field in STATS_FIELDS],
+    )
+
+
+def _stats(seller):
+    try:
+        return seller.listing_stats
+    except SellerStats.DoesNotExist:
+        return SellerStats(seller=seller)
+
+
+def get_seller_stats(username):
+    """
+    The statistics of the user ``username``, empty ones when they have no
+    listings, ``None`` when there is no such user. One indexed lookup.
+    """
+    try:
+        return _stats(_sellers().get(username=username))
+    except User.DoesNotExist:
+        return None
+
+
+async def aget_seller_stats(username):
+    try:
+        return _stats(await _sellers().aget(username=username))
+    except User.DoesNotExist:
+        return None
@@ -1,18 +1,38 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from .models import Textbook, User, Order 
+from .authentication import get_token_claims
+from .metrics import timer
+from .models import SellerStats, Textbook, User, Order 
 from versatileimagefield.serializers import VersatileImageFieldSerializer
 
 
-class TextbookSerializer(serializers.ModelSerializer):
+class TimedVersatileImageFieldSerializer(VersatileImageFieldSerializer):
+    def to_representation(self, value):
+        with timer('images'):
+            return super().to_representation(value)
+
+
+class SparseFieldsetMixin:
+    """Takes ``fields``, the names of the fields to keep (all when ``None``)."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class TextbookSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     seller = serializers.ReadOnlyField(source='seller.username')
-    image = VersatileImageFieldSerializer(
+    image = TimedVersatileImageFieldSerializer(
         sizes='marketplace',
     )
 
     class Meta:
         model = Textbook
-        fields = '__all__'
+        exclude = ['search_vector']
         
     def create(self, validated_data):
         request = self.context.get('request')
@@ -21,6 +41,37 @@ class TextbookSerializer(serializers.ModelSerializer):
         return textbook
 
 
+class TextbookCardSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """The compact rows of the catalog grid, only the preview rendition."""
+    image = TimedVersatileImageFieldSerializer(sizes=[('preview', 'thumbnail__240x312')])
+
+    class Meta:
+        model = Textbook
+        fields = ['id', 'title', 'price', 'condition', 'image']
+
+
+class TextbookImportSerializer(serializers.ModelSerializer):
+    """A row of a catalog import, ``image`` names a file in the images archive."""
+    id = serializers.IntegerField(required=False, allow_null=True)
+    image = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+    class Meta:
+        model = Textbook
+        fields = [
+            'id', 'title', 'author', 'school_class', 'publisher', 'price', 'stock', 'condition', 'description',
+            'whatsapp_contact', 'viber_contact', 'telegram_contact', 'phone_contact', 'image',
+        ]
+
+
+class SellerStatsSerializer(serializers.ModelSerializer):
+    seller = serializers.ReadOnlyField(source='seller.username')
+    avg_price = serializers.DecimalField(max_digits=6, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = SellerStats
+        fields = ['seller', 'listing_count', 'min_price', 'max_price', 'avg_price', 'last_listed_at']
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -44,4 +95,24 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = '__all__'
+        exclude = ['idempotency_key']
+
+
+class OrderItemSerializer(serializers.Serializer):
+    """A textbook to order, see marketplace.orders."""
+    textbook = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    items = OrderItemSerializer(many=True, allow_empty=False, max_length=settings.CHECKOUT_MAX_ITEMS)
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        # Lets CachedJWTAuthentication's stateless mode skip the user lookup.
+        for claim, value in get_token_claims(user).items():
+            token[claim] = value
+        return token
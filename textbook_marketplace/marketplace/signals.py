@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+from .cache import bump_catalog_version, forget_seller, invalidate_textbook
+from .changes import textbooks_changed
+from .live import publish_deleted, publish_saved
+from .models import Suggestion, Textbook, User
+from .renditions import schedule_warm_renditions
+from .seller_stats import listing_removed, listings_added, price_changed, recompute_seller_stats
+from .storage import release_image
+from .suggest import terms_changed
+
+
+@receiver(post_save, sender=Textbook)
+@receiver(post_delete, sender=Textbook)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    # The id, not the username: no query per listing of a deleted seller.
+    seller_id, pk = instance.seller_id, instance.pk
+
+    # Once committed, or a request in between would cache the old row again.
+    def invalidate():
+        bump_catalog_version(seller_id=seller_id)
+        invalidate_textbook(pk)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Textbook)
+def record_textbook_change(sender, instance, created, **kwargs):
+    textbooks_changed([instance.pk])
+    publish_saved([instance.pk], created=created)
+
+
+@receiver(post_delete, sender=Textbook)
+def record_textbook_deletion(sender, instance, **kwargs):
+    textbooks_changed([instance.pk], deleted=True)
+    publish_deleted([instance])
+
+
+@receiver(post_save, sender=Textbook)
+def warm_textbook_renditions(sender, instance, **kwargs):
+    if settings.RENDITION_WARM_ON_SAVE and instance.image:
+        name = instance.image.name
+        # The warm job renders them, the saving request (its response) only
+        # builds their URLs.
+        instance.image.create_on_demand = False
+        transaction.on_commit(lambda: schedule_warm_renditions(name))
+
+
+@receiver(post_delete, sender=Textbook)
+def release_textbook_image(sender, instance, **kwargs):
+    if instance.image:
+        field_file = instance.image
+        transaction.on_commit(lambda: release_image(field_file))
+
+
+@receiver(post_save, sender=Textbook)
+def add_to_seller_stats(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        listings_added(instance.seller_id, [instance])
+    elif update_fields is None or {'seller', 'price'} & set(update_fields):
+        # Textbook.from_db() remembers what was stored, without it (or the
+        # price, when it was deferred) only a recompute knows what changed.
+        loaded = getattr(instance, '_loaded_values', {})
+        seller_id, price = loaded.get('seller_id'), loaded.get('price')
+        if seller_id == instance.seller_id and price is not None:
+            price_changed(seller_id, price, instance.price)
+        else:
+            recompute_seller_stats({seller_id, instance.seller_id} - {None})
+
+
+@receiver(post_delete, sender=Textbook)
+def remove_from_seller_stats(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    listing_removed(
+        loaded.get('seller_id', instance.seller_id), loaded.get('price', instance.__dict__.get('price')),
+        instance.__dict__.get('created_at'),
+    )
+
+
+@receiver(post_save, sender=Textbook)
+def update_suggestions(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        terms_changed(added=[instance.__dict__])
+    elif update_fields is None or set(Suggestion.KINDS) & set(update_fields):
+        loaded = getattr(instance, '_loaded_values', None)
+        # Without the stored values the old terms are unknown, the counts
+        # are left for rebuild_suggestions to correct.
+        if loaded is not None:
+            terms_changed(added=[instance.__dict__], removed=[loaded])
+
+
+@receiver(post_delete, sender=Textbook)
+def remove_from_suggestions(sender, instance, **kwargs):
+    terms_changed(removed=[getattr(instance, '_loaded_values', instance.__dict__)])
+
+
+@receiver(post_save, sender=Textbook)
+def remember_saved_values(sender, instance, **kwargs):
+    # After every receiver that compares them with the stored ones.
+    instance.remember_loaded_values()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # After the commit, or a request could cache the row that is replaced.
+    user_id, username = instance.pk, instance.username
+
+    def invalidate():
+        invalidate_user(user_id)
+        # A new user may take the name, its listings are another seller's.
+        forget_seller(username)
+
+    transaction.on_commit(invalidate)
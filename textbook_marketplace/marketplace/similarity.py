@@ -0,0 +1,307 @@
+"""
+Similar listings, by TF-IDF cosine similarity.
+
+A listing is a sparse vector of its title and publisher words, its author's
+name and its class, each token hashed to one of ``FEATURES`` columns and
+weighted by sublinear tf times idf, then L2 normalized, so the dot product
+of two vectors is their cosine. ``build_similarity_index`` writes the vectors
+of the whole catalog as NumPy arrays, by column (the inverted index) and by
+row, with the rows' ids and prices and the idf.
+
+Workers memory-map the arrays, so all of them share one copy in the page
+cache, and switch to a new build when ``CURRENT`` names one. A search adds up
+the weights in the postings of the query's rarest columns (``np.bincount``),
+scores the best candidates with all their columns and re-ranks them by price
+proximity; its cost is bounded by ``CANDIDATE_POSTINGS``, whatever the size
+of the catalog.
+
+Listings created after a build are vectorized with the built idf into a
+small segment of each worker, refreshed from the database at most every
+``SIMILARITY_REFRESH_SECONDS``. Changed listings keep their built vectors,
+and deleted ones their postings, until the next build; callers drop ids that
+no longer exist.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+from rest_framework import exceptions, status
+
+from .models import Textbook
+
+FEATURES = 1 << 20
+# Model fields a listing's vector and re-ranking are built from.
+FIELDS = ('id', 'price', 'title', 'author', 'publisher', 'school_class')
+# Postings of the query's rarest terms searched for candidates: the terms
+# shared by a large part of the catalog (a class, "and" of publishers) are
+# what make a listing similar the least and cost the most to scan.
+CANDIDATE_POSTINGS = 50_000
+# Candidates scored with all their terms and re-ranked with the price.
+CANDIDATES = 200
+# A listing at twice or half the price scores exp(-0.5 * ln 2) = 0.71 times
+# its cosine.
+PRICE_DECAY = 0.5
+# New listings vectorized per refresh, a rebuild takes over beyond that.
+DELTA_LIMIT = 50_000
+ARRAYS = ('ids', 'prices', 'idf', 'indptr', 'docs', 'weights', 'row_indptr', 'row_terms', 'row_weights')
+WORD_RE = re.compile(r'\w\w+')
+
+
+class IndexUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The similarity index has not been built yet.'
+    default_code = 'similarity_index_unavailable'
+
+
+def _tokens(title, author, publisher, school_class):
+    tokens = WORD_RE.findall(title.casefold())
+    tokens += [f'a:{word}' for word in WORD_RE.findall(author.casefold())]
+    tokens += [f'p:{word}' for word in WORD_RE.findall(publisher.casefold())]
+    tokens.append(f'c:{school_class.strip().casefold()}')
+    return tokens
+
+
+def _term_counts(rows):
+    """
+    Columns and counts of ``rows`` (tuples of ``FIELDS``): ``(lengths, terms,
+    counts)``, every row's columns sorted and counted once.
+    """
+    keys = []
+    for number, (_, _, title, author, publisher, school_class) in enumerate(rows):
+        offset = number * FEATURES
+        keys += [offset + (zlib.crc32(token.encode('utf-8')) & (FEATURES - 1))
+                 for token in _tokens(title, author, publisher, school_class)]
+    keys, counts = np.unique(np.array(keys, dtype=np.int64), return_counts=True)
+    lengths = np.bincount(keys // FEATURES, minlength=len(rows))
+    return lengths, (keys % FEATURES).astype(np.int32), counts
+
+
+def _weights(lengths, terms, counts, idf):
+    """L2 normalized tf-idf weights of the ``_term_counts`` entries."""
+    weights = ((1 + np.log(counts)) * idf[terms]).astype(np.float32)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    norms = np.sqrt(np.bincount(rows, weights=weights.astype(np.float64) ** 2, minlength=len(lengths)))
+    weights /= norms[rows].astype(np.float32)
+    return weights
+
+
+def _row_arrays(rows):
+    return (
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([row[1] for row in rows], dtype=np.float32),
+    )
+
+
+def _chunks(queryset, chunk_size):
+    chunk = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_index(directory, chunk_size=10_000):
+    """
+    Vectorize every listing into a new build under ``directory`` and make it
+    current. Returns the build's name, listings and non-zero entries.
+    """
+    parts = [], [], [], [], []
+    for chunk in _chunks(Textbook.objects.order_by('id').values_list(*FIELDS), chunk_size):
+        for part, array in zip(parts, _row_arrays(chunk) + _term_counts(chunk)):
+            part.append(array)
+    ids, prices, lengths, terms, counts = (
+        np.concatenate(part) if part else np.array([], dtype=dtype)
+        for part, dtype in zip(parts, (np.int64, np.float32, np.int64, np.int32, np.int64))
+    )
+
+    # Smoothed like scikit-learn's TfidfVectorizer.
+    document_frequency = np.bincount(terms, minlength=FEATURES)
+    idf = (np.log((1 + len(ids)) / (1 + document_frequency)) + 1).astype(np.float32)
+    weights = _weights(lengths, terms, counts, idf)
+    rows = np.repeat(np.arange(len(ids), dtype=np.int32), lengths)
+    order = np.argsort(terms, kind='stable')
+    indptr = np.zeros(FEATURES + 1, dtype=np.int64)
+    np.cumsum(document_frequency, out=indptr[1:])
+
+    name = f'build-{time.time_ns()}'
+    os.makedirs(os.path.join(directory, name))
+    row_indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=row_indptr[1:])
+    arrays = {
+        'ids': ids, 'prices': prices, 'idf': idf, 'indptr': indptr, 'docs': rows[order], 'weights': weights[order],
+        'row_indptr': row_indptr, 'row_terms': terms, 'row_weights': weights,
+    }
+    for array_name, array in arrays.items():
+        np.save(os.path.join(directory, name, f'{array_name}.npy'), array)
+    with open(os.path.join(directory, name, 'manifest.json'), 'w') as manifest:
+        json.dump({'listings': len(ids), 'entries': len(terms), 'features': FEATURES}, manifest)
+
+    # Switch atomically, then drop older builds; workers that still map
+    # them keep reading the unlinked files until they switch too.
+    current = os.path.join(directory, 'CURRENT')
+    with open(f'{current}.tmp', 'w') as pointer:
+        pointer.write(name)
+    os.replace(f'{current}.tmp', current)
+    for entry in os.listdir(directory):
+        if entry.startswith('build-') and entry != name:
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    return name, len(ids), len(terms)
+
+
+class SimilarityIndex:
+    """A memory-mapped build and the listings created after it."""
+
+    def __init__(self, path):
+        self.path = path
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+        self.built_max_id = int(self.ids[-1]) if len(self.ids) else 0
+        self.delta_max_id = self.built_max_id
+        self.delta = (
+            np.array([], dtype=np.int64), np.array([], dtype=np.float32), np.array([], dtype=np.int64),
+            np.array([], dtype=np.int32), np.array([], dtype=np.float32),
+        )
+
+    def refresh(self):
+        """
+        Vectorize the listings created since the last refresh into the delta
+        segment. One refresh at a time (``get_similarity_index`` claims it),
+        while searches keep reading the previous segment until it is swapped.
+        """
+        rows = list(
+            Textbook.objects.filter(id__gt=self.delta_max_id).order_by('id').values_list(*FIELDS)[:DELTA_LIMIT]
+        )
+        if not rows:
+            return
+        lengths, terms, counts = _term_counts(rows)
+        ids, prices = _row_arrays(rows)
+        weights = _weights(lengths, terms, counts, self.idf)
+        # A single assignment, a search sees the old segment or the new one.
+        self.delta = tuple(np.concatenate(pair) for pair in zip(self.delta, (ids, prices, lengths, terms, weights)))
+        self.delta_max_id = int(ids[-1])
+
+    def vectorize(self, textbook):
+        row = tuple(getattr(textbook, name) for name in FIELDS)
+        lengths, terms, counts = _term_counts([row])
+        return terms, _weights(lengths, terms, counts, self.idf)
+
+    def search(self, textbook, limit):
+        """
+        Ids of the ``limit`` listings most similar to ``textbook``, best first,
+        without ``textbook`` itself.
+        """
+        terms, query_weights = self.vectorize(textbook)
+        price = max(float(textbook.price), 0.01)
+        rows = self._candidates(terms, query_weights, price, max(CANDIDATES, limit + 1))
+        starts = np.asarray(self.row_indptr[rows])
+        lengths = np.asarray(self.row_indptr[rows + 1]) - starts
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        scores = _cosines(lengths, self.row_terms[entries], self.row_weights[entries], terms, query_weights)
+        candidates, prices = self.ids[rows], self.prices[rows]
+
+        delta_ids, delta_prices, delta_lengths, delta_terms, delta_weights = self.delta
+        if len(delta_ids):
+            delta_scores = _cosines(delta_lengths, delta_terms, delta_weights, terms, query_weights)
+            hits = np.flatnonzero(delta_scores)
+            candidates = np.concatenate([candidates, delta_ids[hits]])
+            scores = np.concatenate([scores, delta_scores[hits]])
+            prices = np.concatenate([prices, delta_prices[hits]])
+
+        keep = candidates != textbook.pk
+        candidates, scores, prices = candidates[keep], scores[keep], prices[keep]
+        scores = scores * _price_proximity(prices, price)
+        # Ties broken by id, newest first.
+        order = np.lexsort((-candidates, -scores))[:limit]
+        return [int(pk) for pk in candidates[order]]
+
+    def _candidates(self, terms, query_weights, price, count):
+        """
+        Rows of the ``count`` best scores over the postings of the query's
+        rarest terms, at most ``CANDIDATE_POSTINGS`` of them, the newest
+        listings of a term that doesn't fit.
+        """
+        starts, ends = self.indptr[terms], self.indptr[terms + 1]
+        docs, contributions = [], []
+        budget = CANDIDATE_POSTINGS
+        for position in np.argsort(ends - starts, kind='stable'):
+            if budget <= 0:
+                break
+            start, end = max(starts[position], ends[position] - budget), ends[position]
+            docs.append(self.docs[start:end])
+            contributions.append(self.weights[start:end] * query_weights[position])
+            budget -= end - start
+        rows, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        if len(rows) <= count:
+            return rows
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        scores *= _price_proximity(self.prices[rows], price)
+        return rows[np.argpartition(scores, -count)[-count:]]
+
+
+def _price_proximity(prices, price):
+    return np.exp(-PRICE_DECAY * np.abs(np.log(np.maximum(prices, 0.01) / price)))
+
+
+def _cosines(lengths, entry_terms, entry_weights, terms, query_weights):
+    """
+    Dot products of rows, given as their lengths and concatenated entries,
+    with the query's sorted ``terms`` and ``query_weights``.
+    """
+    positions = np.minimum(np.searchsorted(terms, entry_terms), len(terms) - 1)
+    matched = terms[positions] == entry_terms
+    products = np.where(matched, entry_weights * query_weights[positions], 0)
+    return np.bincount(np.repeat(np.arange(len(lengths)), lengths), weights=products, minlength=len(lengths))
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'build': None, 'checked_at': None, 'refreshing': False}
+
+
+def get_similarity_index():
+    """
+    This process's index, switched to a new build and refreshed with new
+    listings at most every ``SIMILARITY_REFRESH_SECONDS``.
+
+    The check is claimed under the lock, the refresh's query and
+    vectorization run outside it: the other threads search the index as it
+    is meanwhile, instead of queueing behind the database.
+    """
+    with _lock:
+        now = time.monotonic()
+        checked_at = _state['checked_at']
+        refresh = (
+            not _state['refreshing']
+            and (checked_at is None or now - checked_at >= settings.SIMILARITY_REFRESH_SECONDS)
+        )
+        if refresh:
+            _state['checked_at'] = now
+            try:
+                with open(os.path.join(settings.SIMILARITY_INDEX_DIR, 'CURRENT')) as pointer:
+                    build = pointer.read().strip()
+            except FileNotFoundError:
+                build = None
+            if build != _state['build']:
+                _state['build'] = build
+                _state['index'] = (
+                    SimilarityIndex(os.path.join(settings.SIMILARITY_INDEX_DIR, build)) if build else None
+                )
+            refresh = _state['refreshing'] = _state['index'] is not None
+        index = _state['index']
+    if index is None:
+        raise IndexUnavailable()
+    if refresh:
+        try:
+            index.refresh()
+        finally:
+            with _lock:
+                _state['refreshing'] = False
+    return index
@@ -0,0 +1,152 @@
+"""
+Content addressed storage for textbook images.
+
+Uploaded images are stored as ``<directory>/<sha256[:2]>/<sha256>.<ext>``, so
+identical files (the same cover photo uploaded for every copy of an edition)
+are written once and share one set of VersatileImageField renditions, which
+are derived from the original's path. Files are released by
+``release_image`` once no textbook references them any more.
+
+Storing bytes that are already there only references the existing file, so a
+release deleting it between that check and the commit of the referencing row
+would leave the row without its image. Both hold a transaction level
+advisory lock on the name (``lock_image``): a release waits for the row to
+commit and then finds it, a save waits for the files to be deleted and then
+writes them again. The lock is only held to the end of a transaction, the
+file has to be saved in the one writing the row, as ``Textbook.save`` does.
+
+Renditions keep the name derived from their original: two processes
+rendering the same size write the same bytes, the last one replaces the
+file instead of leaving a suffixed copy nothing references.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.db import connection, transaction
+from versatileimagefield.settings import (
+    VERSATILEIMAGEFIELD_FILTERED_DIRNAME,
+    VERSATILEIMAGEFIELD_PLACEHOLDER_DIRNAME,
+    VERSATILEIMAGEFIELD_SIZED_DIRNAME,
+)
+
+# Renditions are saved through the same storage, they keep their own names.
+DERIVED_DIRNAMES = {
+    VERSATILEIMAGEFIELD_SIZED_DIRNAME,
+    VERSATILEIMAGEFIELD_FILTERED_DIRNAME,
+    VERSATILEIMAGEFIELD_PLACEHOLDER_DIRNAME,
+}
+
+
+def lock_image(name):
+    """Hold the advisory lock of ``name`` until the transaction ends, see the module docstring."""
+    # hash() differs between processes, the key has to be the same in all.
+    key = int.from_bytes(hashlib.sha256(name.encode('utf-8')).digest()[:8], 'big', signed=True)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory.strip('/')
+        self.content_name_re = re.compile(
+            rf'^{re.escape(self.directory)}/([0-9a-f]{{2}})/\1[0-9a-f]{{62}}(\.\w+)?$'
+        )
+        # Renditions are named after the original, plus their size or filter.
+        self.immutable_name_re = re.compile(
+            rf'^(?:(?:{VERSATILEIMAGEFIELD_SIZED_DIRNAME}|{VERSATILEIMAGEFIELD_FILTERED_DIRNAME})/)*'
+            rf'{re.escape(self.directory)}/([0-9a-f]{{2}})/\1[0-9a-f]{{62}}(?:[^0-9a-f/][^/]*)?$'
+        )
+
+    def is_content_addressed(self, name):
+        return bool(self.content_name_re.match(name))
+
+    def is_immutable(self, name):
+        """Whether ``name`` is a content addressed image or one of its renditions."""
+        return bool(self.immutable_name_re.match(name))
+
+    def is_derived(self, name):
+        return not DERIVED_DIRNAMES.isdisjoint(name.split('/'))
+
+    def get_content_name(self, name, content):
+        digest = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(self.directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = name.replace('\\', '/')
+        if self.is_derived(name):
+            return self.replace(name, content)
+
+        name = self.get_content_name(name, content)
+        lock_image(name)
+        if self.exists(name):
+            # Same bytes are already stored, share them.
+            return name
+        return super().save(name, content, max_length)
+
+    def replace(self, name, content):
+        """Write ``content`` to ``name`` whole, replacing the file there."""
+        validate_file_name(name, allow_relative_path=True)
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return name
+
+
+textbook_image_storage = ContentAddressedStorage('textbook_images')
+
+
+def get_textbook_image_storage():
+    return textbook_image_storage
+
+
+def release_image(field_file):
+    """
+    Delete a stored image and its renditions unless another textbook still
+    references it.
+    """
+    from .models import Textbook
+
+    name = field_file.name
+    if not name:
+        return False
+    with transaction.atomic():
+        lock_image(name)
+        if Textbook.objects.filter(image=name).exists():
+            return False
+        field_file.delete_all_created_images()
+        field_file.storage.delete(name)
+    return True
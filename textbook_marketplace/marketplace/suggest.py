@@ -0,0 +1,152 @@
+"""
+Typeahead suggestions for the search box.
+
+``Suggestion`` holds every distinct title, author and publisher, compared
+case and whitespace insensitively, with the number of listings that have it.
+A prefix is answered with one ``UNION ALL`` of a ``LIKE 'prefix%'`` range
+scan per kind over the covering ``(kind, normalized)`` index, ranked by
+listing count, so its cost depends on the terms sharing the prefix, not on
+the number of listings. One and two character prefixes share their terms
+with thousands of others; their answers are cached for
+``SUGGEST_CACHE_TIMEOUT`` seconds instead of ranked on every keystroke.
+
+Listing saves and deletes adjust the counts (``marketplace.signals``), bulk
+writes call ``terms_changed`` themselves, in the transaction writing the
+listings (``Textbook.save`` and ``delete()`` run in one), so a rebuild sees
+a listing and its count change together. Terms whose count drops to zero are
+not suggested and are dropped by ``rebuild_suggestions``
+(``python manage.py rebuild_suggestions``), which also repairs any drift.
+"""
+import hashlib
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, connections, router, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+
+from .cache import get_cache
+from .models import Suggestion, Textbook
+
+TERM_MAX_LENGTH = Suggestion._meta.get_field('normalized').max_length
+# Prefixes this short match a large share of all terms, ranking them is what
+# costs most, while their top terms barely move.
+CACHED_PREFIX_LENGTH = 2
+SENTINEL = 'suggestprefix0'
+SENTINEL_PATTERN = f'{SENTINEL}%'
+
+
+def normalize(value):
+    return ' '.join(value.split()).casefold()[:TERM_MAX_LENGTH]
+
+
+def _count_terms(counts, terms, values, delta):
+    for kind in Suggestion.KINDS:
+        value = values.get(kind)
+        if value and value.strip():
+            key = (kind, normalize(value))
+            counts[key] += delta
+            terms.setdefault(key, ' '.join(value.split())[:TERM_MAX_LENGTH])
+
+
+def terms_changed(added=(), removed=()):
+    """
+    Count the terms of listings that were ``added`` and take out those of
+    listings that were ``removed``, both mappings of ``title``, ``author`` and
+    ``publisher`` (missing ones are skipped). An updated listing is removed
+    with its old values and added with its new ones.
+    """
+    counts, terms = Counter(), {}
+    for values in added:
+        _count_terms(counts, terms, values, 1)
+    for values in removed:
+        _count_terms(counts, terms, values, -1)
+
+    new = [key for key, delta in counts.items() if delta > 0]
+    if new:
+        Suggestion.objects.bulk_create(
+            [Suggestion(kind=kind, normalized=normalized, term=terms[kind, normalized]) for kind, normalized in new],
+            ignore_conflicts=True,
+        )
+    # One UPDATE per count change, a single save needs at most two.
+    groups = {}
+    for (kind, normalized), delta in counts.items():
+        if delta:
+            groups.setdefault(delta, {}).setdefault(kind, []).append(normalized)
+    for delta, kinds in sorted(groups.items()):
+        condition = Q()
+        for kind, normalized in kinds.items():
+            condition |= Q(kind=kind, normalized__in=normalized)
+        Suggestion.objects.filter(condition).update(
+            # Never below zero, if a term was missed it's off by one until a rebuild.
+            listing_count=F('listing_count') + delta if delta > 0 else Greatest(F('listing_count') + delta, Value(0)),
+        )
+
+
+def suggest(query, limit):
+    """The ``limit`` most listed titles, authors and publishers starting with ``query``."""
+    prefix = normalize(query)
+    if len(prefix) > CACHED_PREFIX_LENGTH or not settings.CATALOG_CACHE_ENABLED:
+        return _suggest(prefix, limit)
+    key = f'suggest:{limit}:{hashlib.md5(prefix.encode("utf-8")).hexdigest()}'
+    suggestions = get_cache().get(key)
+    if suggestions is None:
+        suggestions = _suggest(prefix, limit)
+        get_cache().set(key, suggestions, settings.SUGGEST_CACHE_TIMEOUT)
+    return suggestions
+
+
+@lru_cache
+def _compile(limit):
+    """
+    SQL and parameters of the lookup for ``limit`` suggestions per kind, the
+    LIKE patterns marked by ``SENTINEL``. Compiling the union takes longer
+    than running it, so it is done once.
+    """
+    querysets = [
+        Suggestion.objects
+        .filter(kind=kind, normalized__startswith=SENTINEL, listing_count__gt=0)
+        .order_by('-listing_count', 'normalized')
+        .values_list('kind', 'term', 'listing_count')[:limit]
+        for kind in Suggestion.KINDS
+    ]
+    return querysets[0].union(*querysets[1:], all=True).query.sql_with_params()
+
+
+def _suggest(prefix, limit):
+    sql, params = _compile(limit)
+    # Per call, replica routing depends on the request.
+    connection = connections[router.db_for_read(Suggestion)]
+    pattern = connection.ops.prep_for_like_query(prefix) + '%'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [pattern if param == SENTINEL_PATTERN else param for param in params])
+        rows = cursor.fetchall()
+    suggestions = {f'{kind}s': [] for kind in Suggestion.KINDS}
+    for kind, term, count in rows:
+        suggestions[f'{kind}s'].append({'value': term, 'count': count})
+    return suggestions
+
+
+def rebuild_suggestions(batch_size=5000):
+    """Rebuild the suggestions from the listings, returns the number of terms."""
+    with transaction.atomic():
+        # Listing writes update the suggestions before they commit, so this
+        # holds back those still running until the rebuilt counts are
+        # committed, and the scan doesn't see their rows; it sees those of the
+        # writes that committed, whose updates the rebuild replaces.
+        table = connection.ops.quote_name(Suggestion._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+        counts, terms = Counter(), {}
+        for values in Textbook.objects.order_by().values(*Suggestion.KINDS).iterator(chunk_size=10_000):
+            _count_terms(counts, terms, values, 1)
+        Suggestion.objects.all().delete()
+        Suggestion.objects.bulk_create(
+            (
+                Suggestion(kind=kind, normalized=normalized, term=terms[kind, normalized], listing_count=count)
+                for (kind, normalized), count in counts.items()
+            ),
+            batch_size=batch_size,
+        )
+    return len(counts)
@@ -0,0 +1,26 @@
+import io
+from decimal import Decimal
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+
+from marketplace.models import Textbook, User
+
+
+def create_user(username='seller', **kwargs):
+    return User.objects.create_user(username, **kwargs)
+
+
+def create_textbook(seller, **kwargs):
+    values = {
+        'title': 'Algebra', 'author': 'Author', 'school_class': '7', 'publisher': 'Publisher',
+        'price': Decimal('10.00'), 'condition': 'New',
+    }
+    values.update(kwargs)
+    return Textbook.objects.create(seller=seller, **values)
+
+
+def image_file(name='cover.png', color='red', size=(8, 8)):
+    content = io.BytesIO()
+    Image.new('RGB', size, color).save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
@@ -0,0 +1,63 @@
+import tempfile
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import path
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from marketplace.async_views import AsyncTextbookListView
+from marketplace.models import Textbook
+
+from .factories import create_textbook, create_user, image_file
+
+# marketplace.urls picks the views when it is imported, so ASYNC_VIEWS routes
+# are set up here.
+urlpatterns = [
+    path('api/textbooks/', AsyncTextbookListView.as_view(), name='textbook-list'),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, ASYNC_VIEWS=True, RENDITION_WARM_ON_SAVE=False)
+class AsyncTextbookListViewTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.seller = create_user()
+        self.client = APIClient(HTTP_HOST='localhost')
+
+    def test_post_creates_a_listing(self):
+        response = self.client.post('/api/textbooks/', {
+            'title': 'Algebra', 'author': 'Author', 'school_class': '7', 'publisher': 'Publisher',
+            'price': '10.00', 'condition': 'New', 'image': image_file(),
+        }, format='multipart', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.seller)}')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['seller'], self.seller.username)
+        self.assertTrue(Textbook.objects.filter(pk=response.json()['id'], seller=self.seller).exists())
+
+    def test_post_validates(self):
+        response = self.client.post('/api/textbooks/', {'title': 'Algebra'}, format='json',
+                                    HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.seller)}')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('price', response.json())
+        self.assertFalse(Textbook.objects.exists())
+
+    def test_post_with_a_token_skips_csrf(self):
+        client = APIClient(HTTP_HOST='localhost', enforce_csrf_checks=True)
+        response = client.post('/api/textbooks/', {'title': 'Algebra'}, format='json',
+                               HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.seller)}')
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn('price', response.json())
+
+    def test_post_needs_a_user(self):
+        response = self.client.post('/api/textbooks/', {'title': 'Algebra'}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_get_lists_the_new_listing(self):
+        textbook = create_textbook(self.seller)
+        response = self.client.get('/api/textbooks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], [textbook.pk])
@@ -0,0 +1,91 @@
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from marketplace.authentication import CachedJWTAuthentication, local_user_cache
+from marketplace.serializers import UserTokenObtainPairSerializer
+
+from .factories import create_user
+
+
+class AuthenticationTestMixin:
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        local_user_cache.clear()
+        self.addCleanup(local_user_cache.clear)
+        self.user = create_user()
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CachedJWTAuthentication().authenticate(request)
+
+
+class UserCacheTestMixin(AuthenticationTestMixin):
+    def test_user_is_cached(self):
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(token)[0], self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token)[0], self.user)
+
+    def test_saved_user_is_reloaded(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        self.user.email = 'new@example.com'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(token)[0].email, 'new@example.com')
+
+    def test_deactivated_user_is_refused(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_deleted_user_is_refused(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+
+@override_settings(JWT_USER_CACHE='shared')
+class SharedUserCacheTests(UserCacheTestMixin, TestCase):
+    pass
+
+
+@override_settings(JWT_USER_CACHE='local')
+class LocalUserCacheTests(UserCacheTestMixin, TestCase):
+    pass
+
+
+@override_settings(JWT_USER_CACHE='stateless')
+class StatelessTests(AuthenticationTestMixin, TestCase):
+    def test_user_is_built_from_the_claims(self):
+        token = UserTokenObtainPairSerializer.get_token(self.user).access_token
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(token)
+        self.assertEqual((user.pk, user.username, user.is_active), (self.user.pk, self.user.username, True))
+        self.assertIn('email', user.get_deferred_fields())
+
+    def test_token_without_the_claims_loads_the_user(self):
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(token)[0], self.user)
+        # And keeps it like the local cache.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token)[0], self.user)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
@@ -0,0 +1,99 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from .factories import create_textbook, create_user
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True, RENDITION_WARM_ON_SAVE=False)
+class ConditionalListTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.seller = create_user()
+        self.client = APIClient(HTTP_HOST='localhost')
+
+    def test_list_has_no_last_modified(self):
+        create_textbook(self.seller)
+        response = self.client.get(reverse('textbook-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_deleting_a_row_changes_the_list(self):
+        kept = create_textbook(self.seller)
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted = create_textbook(self.seller)
+        first = self.client.get(reverse('textbook-list'))
+        self.assertEqual(self.client.get(reverse('textbook-list'), HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+        response = self.client.get(
+            reverse('textbook-list'), HTTP_IF_NONE_MATCH=first['ETag'], HTTP_IF_MODIFIED_SINCE=http_date(),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], [kept.pk])
+
+    def test_detail_has_last_modified(self):
+        textbook = create_textbook(self.seller)
+        response = self.client.get(reverse('textbook-detail', args=[textbook.pk]))
+        self.assertEqual(response['Last-Modified'], http_date(int(textbook.updated_at.timestamp())))
+        response = self.client.get(
+            reverse('textbook-detail', args=[textbook.pk]), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True, RENDITION_WARM_ON_SAVE=False)
+class ListCacheKeyTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.seller = create_user()
+
+    def test_seller_list_is_invalidated(self):
+        client = APIClient(HTTP_HOST='localhost')
+        with self.captureOnCommitCallbacks(execute=True):
+            first = create_textbook(self.seller)
+        url = reverse('textbook-list') + '?username=seller'
+        self.assertEqual([row['id'] for row in client.get(url).json()['results']], [first.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            second = create_textbook(self.seller)
+        self.assertEqual([row['id'] for row in client.get(url).json()['results']], [second.pk, first.pk])
+
+    def test_user_taking_a_deleted_sellers_name(self):
+        client = APIClient(HTTP_HOST='localhost')
+        url = reverse('textbook-list') + '?username=seller'
+        with self.captureOnCommitCallbacks(execute=True):
+            create_textbook(self.seller)
+        client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            textbook = create_textbook(create_user())
+        self.assertEqual([row['id'] for row in client.get(url).json()['results']], [textbook.pk])
+
+    def test_deleting_a_seller_does_not_load_it_per_listing(self):
+        def user_queries(listings):
+            seller = create_user(f'seller{listings}')
+            for _ in range(listings):
+                create_textbook(seller)
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    seller.delete()
+            return [query['sql'] for query in queries if 'FROM "marketplace_user"' in query['sql']]
+
+        self.assertEqual(len(user_queries(5)), len(user_queries(1)))
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_lists_are_cached_per_host(self):
+        for _ in range(3):
+            create_textbook(self.seller)
+        for host in ('a.example', 'b.example', 'a.example'):
+            response = APIClient(HTTP_HOST=host).get(reverse('textbook-list'), {'page_size': 1})
+            self.assertTrue(response.json()['next'].startswith(f'http://{host}/'), response.json()['next'])
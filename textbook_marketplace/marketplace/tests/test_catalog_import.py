@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from marketplace.catalog_import import CatalogImporter, read_rows
+from marketplace.models import Textbook
+from marketplace.storage import textbook_image_storage
+
+from .factories import create_textbook, create_user, image_file
+
+ROW = {
+    'title': 'Physics', 'author': 'Author', 'school_class': '9', 'publisher': 'Publisher',
+    'price': '8.00', 'condition': 'New',
+}
+
+
+def stored_images():
+    directory = os.path.join(settings.MEDIA_ROOT, textbook_image_storage.directory)
+    return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+
+@override_settings(RENDITION_WARM_ON_SAVE=False)
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.seller = create_user()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.seller)}')
+
+    def import_file(self, name, content, images=None):
+        data = {'file': SimpleUploadedFile(name, content)}
+        if images is not None:
+            data['images'] = SimpleUploadedFile('images.zip', images)
+        response = self.client.post('/api/textbooks/import/', data, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_edited_export_round_trip(self):
+        repriced = create_textbook(self.seller, title='Algebra')
+        kept = create_textbook(self.seller, title='Geometry', price=Decimal('12.00'))
+        others = create_textbook(create_user('other'), title='Chemistry')
+
+        response = self.client.get('/api/textbooks/export.csv', {'seller': self.seller.username})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual([row['title'] for row in rows], ['Algebra', 'Geometry'])
+        rows[0]['price'] = '11.50'
+        rows.append({**rows[0], **ROW, 'id': ''})
+        rows.append({**rows[0], 'id': str(others.pk)})
+        rows.append({**rows[0], 'id': '', 'price': 'cheap'})
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+        report = self.import_file('listings.csv', output.getvalue().encode('utf-8'))
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), (1, 1, 1))
+        self.assertEqual([(error['row'], list(error['errors'])) for error in report['errors']],
+                         [(5, ['price']), (4, ['id'])])
+        repriced.refresh_from_db()
+        kept_updated_at = kept.updated_at
+        kept.refresh_from_db()
+        self.assertEqual(repriced.price, Decimal('11.50'))
+        self.assertEqual(kept.updated_at, kept_updated_at)
+        self.assertTrue(Textbook.objects.filter(seller=self.seller, title='Physics').exists())
+        self.assertEqual(Textbook.objects.get(pk=others.pk).seller.username, 'other')
+
+    def test_images_archive(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as images:
+            images.writestr('covers/cover.png', image_file().read())
+            images.writestr('orphan.png', image_file(color='blue').read())
+            images.writestr('broken.png', b'not an image')
+        rows = [
+            {**ROW, 'image': 'covers/cover.png'},
+            # Its image is stored before the unknown id is found.
+            {**ROW, 'id': 999999, 'image': 'orphan.png'},
+            {**ROW, 'image': 'missing.png'},
+            {**ROW, 'image': 'broken.png'},
+        ]
+        content = ''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8')
+
+        report = self.import_file('listings.ndjson', content, images=archive.getvalue())
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(sorted((error['row'], list(error['errors'])) for error in report['errors']),
+                         [(2, ['id']), (3, ['image']), (4, ['image'])])
+        textbook = Textbook.objects.get(seller=self.seller)
+        self.assertTrue(textbook_image_storage.is_content_addressed(textbook.image.name))
+        # The rejected row's image was released.
+        self.assertEqual(stored_images(), [os.path.basename(textbook.image.name)])
+
+    def test_failed_batch_releases_its_images(self):
+        content = (json.dumps({**ROW, 'image': 'cover.png'}) + '\n').encode('utf-8')
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as images:
+            images.writestr('cover.png', image_file().read())
+        importer = CatalogImporter(self.seller, images=archive)
+        with mock.patch.object(Textbook.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                importer.run(read_rows(io.BytesIO(content), 'ndjson'))
+        self.assertEqual(stored_images(), [])
+        self.assertEqual(importer.images, set())
+        name = textbook_image_storage.get_content_name('cover.png', ContentFile(image_file().read()))
+        self.assertFalse(textbook_image_storage.exists(name))
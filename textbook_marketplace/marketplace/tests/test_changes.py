@@ -0,0 +1,105 @@
+import threading
+
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from marketplace.changes import decode_token
+
+from .factories import create_textbook, create_user
+
+
+# Transaction ids order the feed, every write has to commit on its own.
+@override_settings(RENDITION_WARM_ON_SAVE=False)
+class ChangesFeedTests(TransactionTestCase):
+    # With DB_REPLICAS set, the feed reads from the replicas.
+    databases = '__all__'
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.seller = create_user()
+        self.client = APIClient(HTTP_HOST='localhost')
+
+    def page(self, since=None, limit=100):
+        params = {'limit': limit, **({'since': since} if since else {})}
+        response = self.client.get('/api/textbooks/changes/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def read_all(self, since=None, limit=100):
+        """``(saved ids, deleted ids, next token)`` of every page after ``since``."""
+        saved, deleted = [], []
+        while True:
+            page = self.page(since, limit)
+            saved += [row['id'] for row in page['results']]
+            deleted += page['deleted']
+            since = page['next']
+            if not page['has_more']:
+                return saved, deleted, since
+
+    def test_pages_through_the_changes(self):
+        textbooks = [create_textbook(self.seller, title=f'Algebra {number}') for number in range(5)]
+        pks = [textbook.pk for textbook in textbooks]
+        first = self.page(limit=2)
+        self.assertEqual(([row['id'] for row in first['results']], first['has_more']), (pks[:2], True))
+        saved, deleted, token = self.read_all(first['next'], limit=2)
+        self.assertEqual((saved, deleted), (pks[2:], []))
+
+        # Nothing new: an empty page that keeps the token.
+        self.assertEqual(self.page(token), {'next': token, 'has_more': False, 'results': [], 'deleted': []})
+
+        # A listing saved twice since the last poll comes once, after the others.
+        textbooks[3].price += 1
+        textbooks[3].save()
+        textbooks[1].price += 1
+        textbooks[1].save()
+        textbooks[3].save()
+        saved, _, next_token = self.read_all(token)
+        self.assertEqual(saved, [pks[1], pks[3]])
+        self.assertGreater(decode_token(next_token), decode_token(token))
+
+    def test_deletions_are_tombstones(self):
+        kept = create_textbook(self.seller)
+        deleted = create_textbook(self.seller)
+        _, _, token = self.read_all()
+        deleted_pk = deleted.pk
+        deleted.delete()
+        self.assertEqual(self.read_all(token)[:2], ([], [deleted_pk]))
+        # From the start, the catalog without the deleted listing.
+        self.assertEqual(self.read_all()[:2], ([kept.pk], [deleted_pk]))
+
+    def test_invalid_token(self):
+        response = self.client.get('/api/textbooks/changes/', {'since': 'not-a-token'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json())
+
+    def test_stops_below_running_transactions(self):
+        _, _, token = self.read_all()
+        written, commit = threading.Event(), threading.Event()
+        slow = {}
+
+        def write_slowly():
+            # Takes a transaction id first, commits after the other write.
+            try:
+                with transaction.atomic():
+                    slow['pk'] = create_textbook(self.seller, title='Slow').pk
+                    written.set()
+                    commit.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=write_slowly)
+        thread.start()
+        try:
+            self.assertTrue(written.wait(5))
+            # Another seller and other terms, or it would wait for the slow
+            # transaction's locks on their statistics and suggestions.
+            fast = create_textbook(create_user('other'), title='Fast', author='Other', publisher='Other')
+            # Reading past the committed change would skip the slow one.
+            self.assertEqual(self.page(token)['results'], [])
+        finally:
+            commit.set()
+            thread.join()
+        self.assertEqual(self.read_all(token)[0], [slow['pk'], fast.pk])
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from marketplace.export import COLUMNS
+from marketplace.models import Textbook
+
+from .factories import create_textbook, create_user, image_file
+
+JANUARY = datetime(2025, 1, 10, 12, 30, tzinfo=timezone.utc)
+
+
+@override_settings(RENDITION_WARM_ON_SAVE=False)
+class ExportTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.seller = create_user()
+        self.illustrated = create_textbook(self.seller, title='Algebra', image=image_file())
+        self.plain = create_textbook(create_user('other'), title='Geometry, "2nd" edition')
+        # Exported in updated_at order.
+        Textbook.objects.filter(pk=self.illustrated.pk).update(updated_at=JANUARY)
+        Textbook.objects.filter(pk=self.plain.pk).update(updated_at=JANUARY + timedelta(days=1))
+
+    def export(self, export_format, **params):
+        response = self.client.get(f'/api/textbooks/export.{export_format}', params, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        response, content = self.export('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([list(row) for row in rows], [COLUMNS, COLUMNS])
+        first, second = rows
+        self.assertEqual((first['id'], second['id']), (self.illustrated.pk, self.plain.pk))
+        self.assertEqual(first['seller'], 'seller')
+        self.assertEqual(first['price'], '10.00')
+        self.assertEqual(first['updated_at'], '2025-01-10T12:30:00Z')
+        self.assertEqual(
+            datetime.fromisoformat(first['created_at']), Textbook.objects.get(pk=self.illustrated.pk).created_at,
+        )
+        self.assertEqual(first['image'], f'http://localhost/media/{self.illustrated.image.name}')
+        self.assertIsNone(second['image'])
+        self.assertIsNone(second['phone_contact'])
+
+    def test_csv(self):
+        response, content = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="textbooks.csv"')
+        header, *rows = csv.reader(io.StringIO(content))
+        self.assertEqual(header, COLUMNS)
+        first, second = (dict(zip(header, row)) for row in rows)
+        self.assertEqual(first['image'], f'http://localhost/media/{self.illustrated.image.name}')
+        self.assertEqual(first['updated_at'], '2025-01-10T12:30:00Z')
+        self.assertEqual(second['title'], 'Geometry, "2nd" edition')
+        self.assertEqual((second['image'], second['phone_contact']), ('', ''))
+
+    def test_filters(self):
+        _, content = self.export('ndjson', seller='other')
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [self.plain.pk])
+        _, content = self.export('ndjson', updated_since='2025-01-11T00:00:00Z')
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [self.plain.pk])
+        _, content = self.export('csv', updated_before='2025-01-11T00:00:00Z')
+        self.assertEqual([row[0] for row in csv.reader(io.StringIO(content))][1:], [str(self.illustrated.pk)])
+
+    def test_invalid_filter(self):
+        response = self.client.get('/api/textbooks/export.csv', {'updated_since': 'yesterday'}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('updated_since', response.json())
+
+    @override_settings(ASYNC_VIEWS=True, EXPORT_CHUNK_SIZE=1)
+    async def test_asgi_streams_chunks(self):
+        response = await self.async_client.get('/api/textbooks/export.ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        # A chunk per row.
+        self.assertEqual(
+            [json.loads(chunk)['id'] for chunk in chunks], [self.illustrated.pk, self.plain.pk],
+        )
+        self.assertEqual(json.loads(chunks[0])['image'], f'http://testserver/media/{self.illustrated.image.name}')
@@ -0,0 +1,180 @@
+import datetime
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import caches
+from django.db.models.fields.files import FieldFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from marketplace.fast_serializers import RowSerializer, get_row_serializer
+from marketplace.fieldsets import load_only
+from marketplace.models import Order, Textbook, User
+from marketplace.renderers import FastJSONRenderer
+from marketplace.serializers import OrderSerializer, TextbookCardSerializer, TextbookSerializer
+
+from .factories import create_textbook, create_user
+
+# Values that are easy to get wrong: URL quoting, the spaces renditions drop,
+# names without an extension, JSON escapes, empty and null columns.
+EDGE_IMAGES = [
+    'textbook_images/ab/cover.jpg',
+    'textbook_images/ab/my cover.JPG',
+    'textbook_images/обкладинка #1.webp',
+    'textbook_images/no_extension',
+    'some dir/a+b&c%20d.tar.png',
+    '',
+    None,
+]
+EDGE_TEXTS = [
+    'Алгебра 7 клас', 'quote " backslash \\ slash /', 'line\nbreak\ttab\x00\x1f\x7f',
+    'emoji 😀', 'separators \u2028 \u2029', '</script>', '',
+]
+EDGE_TIMEZONES = ['UTC', 'Europe/Kyiv', 'America/St_Johns']
+
+
+def values_row(instance, lookups):
+    """The ``values()`` row of ``instance``, without a query."""
+    row = {}
+    for lookup in lookups:
+        value = instance
+        *path, name = lookup.split('__')
+        for attr in path:
+            value = getattr(value, attr)
+        value = getattr(value, value._meta.get_field(name).attname)
+        row[lookup] = value.name if isinstance(value, FieldFile) else value
+    return row
+
+
+def edge_textbooks(images=EDGE_IMAGES, texts=EDGE_TEXTS):
+    seller = User(id=1, username='seller "1"')
+    created_at = datetime.datetime(2024, 3, 31, 0, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+    textbooks = []
+    for number, image in enumerate(images):
+        for text in texts:
+            textbooks.append(Textbook(
+                id=len(textbooks) + 1, seller=seller, image=image, title=text, author=text,
+                school_class='7', publisher=text, price=Decimal(['0.00', '12.50', '9999.99'][number % 3]),
+                description=text, whatsapp_contact=text or None, viber_contact=None, telegram_contact=text,
+                phone_contact=None, condition='Used - Good',
+                created_at=created_at, updated_at=created_at + datetime.timedelta(microseconds=number),
+            ))
+    return textbooks
+
+
+def fieldsets(serializer_class):
+    """All fields, every field alone and all but every field."""
+    yield None
+    names = list(serializer_class().fields)
+    for name in names:
+        yield [name]
+        yield [other for other in names if other != name]
+
+
+# Fast rows don't create renditions, neither do the compared DRF rows.
+@mock.patch('versatileimagefield.mixins.VERSATILEIMAGEFIELD_CREATE_ON_DEMAND', False)
+class RowSerializerTests(TestCase):
+    def assertSameJSON(self, serializer_class, instances, rows=None, **kwargs):
+        """
+        The row serializer's output of ``rows`` (the ``values()`` rows of
+        ``instances`` by default), rendered by either renderer, is the DRF
+        serializer's output of ``instances`` rendered by ``JSONRenderer``.
+        """
+        row_serializer = RowSerializer(serializer_class(**kwargs))
+        if rows is None:
+            rows = [values_row(instance, row_serializer.lookups) for instance in instances]
+        expected_data = serializer_class(instances, many=True, **kwargs).data
+        data = row_serializer.serialize(rows)
+        expected = JSONRenderer().render(expected_data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        self.assertEqual(JSONRenderer().render(data), expected)
+        self.assertEqual(FastJSONRenderer().render(expected_data), expected)
+
+    def test_url_quoting(self):
+        self.assertSameJSON(TextbookSerializer, edge_textbooks(images=[
+            'textbook_images/ab/my cover.JPG', 'textbook_images/обкладинка #1.webp', 'some dir/a+b&c%20d.tar.png',
+        ], texts=['title']))
+
+    def test_names_without_extension(self):
+        self.assertSameJSON(TextbookSerializer, edge_textbooks(images=['textbook_images/no_extension'], texts=['title']))
+
+    def test_empty_and_null_images(self):
+        self.assertSameJSON(TextbookSerializer, edge_textbooks(images=['', None], texts=['title']))
+
+    def test_json_escapes(self):
+        self.assertSameJSON(TextbookSerializer, edge_textbooks(images=[None]))
+
+    def test_time_zones(self):
+        for zone in EDGE_TIMEZONES:
+            with self.subTest(zone=zone), timezone.override(zone):
+                self.assertSameJSON(TextbookSerializer, edge_textbooks())
+
+    def test_every_fieldset(self):
+        for serializer_class in (TextbookSerializer, TextbookCardSerializer):
+            for fields in fieldsets(serializer_class):
+                kwargs = {'fields': fields} if fields is not None else {}
+                with self.subTest(serializer=serializer_class.__name__, fields=fields):
+                    self.assertSameJSON(serializer_class, edge_textbooks(), **kwargs)
+
+    def test_card_representation(self):
+        for zone in EDGE_TIMEZONES:
+            with self.subTest(zone=zone), timezone.override(zone):
+                self.assertSameJSON(TextbookCardSerializer, edge_textbooks())
+
+    def test_database_rows(self):
+        seller = create_user('seller "1"')
+        for number, image in enumerate(EDGE_IMAGES):
+            # Postgres text columns can't hold NUL.
+            text = EDGE_TEXTS[number % len(EDGE_TEXTS)].replace('\x00', '')
+            create_textbook(
+                seller, image=image, title=text, author=text, publisher=text, description=text,
+                price=Decimal('9999.99'), whatsapp_contact=text or None, telegram_contact=text,
+            )
+        for serializer_class, queryset in (
+            (TextbookSerializer, Textbook.objects.select_related('seller')),
+            (TextbookCardSerializer, Textbook.objects.all()),
+        ):
+            with self.subTest(serializer=serializer_class.__name__):
+                row_serializer = RowSerializer(serializer_class())
+                instances = list(load_only(queryset, serializer_class(), keep=['id']).order_by('id'))
+                rows = list(row_serializer.values(queryset).order_by('id'))
+                self.assertEqual(len(rows), len(EDGE_IMAGES))
+                self.assertSameJSON(serializer_class, instances, rows)
+
+    def test_order_serializer(self):
+        buyer = create_user('buyer "2"')
+        textbook = create_textbook(create_user(), title='Алгебра </script>')
+        for quantity in (1, 3):
+            Order.objects.create(textbook=textbook, buyer=buyer, quantity=quantity)
+        queryset = Order.objects.select_related('textbook', 'buyer')
+        row_serializer = RowSerializer(OrderSerializer())
+        for zone in EDGE_TIMEZONES:
+            with self.subTest(zone=zone), timezone.override(zone):
+                instances = list(queryset.order_by('id'))
+                rows = list(row_serializer.values(queryset).order_by('id'))
+                self.assertSameJSON(OrderSerializer, instances, rows)
+
+
+class FastSerializersSettingTests(TestCase):
+    def test_off_unless_set(self):
+        with override_settings(FAST_SERIALIZERS=False):
+            self.assertIsNone(get_row_serializer(TextbookSerializer))
+        with override_settings(FAST_SERIALIZERS=True):
+            self.assertIsInstance(get_row_serializer(TextbookSerializer), RowSerializer)
+
+    @override_settings(CATALOG_CACHE_ENABLED=False)
+    def test_list_pages_are_the_same(self):
+        seller = create_user()
+        for number in range(3):
+            create_textbook(seller, title=f'Algebra {number}', price=Decimal(number))
+        client = APIClient(HTTP_HOST='localhost')
+        pages = []
+        for fast in (False, True):
+            with override_settings(FAST_SERIALIZERS=fast):
+                for cache in caches.all():
+                    cache.clear()
+                pages.append(client.get(reverse('textbook-list'), {'ordering': 'price'}).content)
+        self.assertEqual(pages[0], pages[1])
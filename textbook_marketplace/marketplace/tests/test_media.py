@@ -0,0 +1,117 @@
+import os
+import tempfile
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from marketplace.media import IMMUTABLE, REVALIDATE, RangeNotSatisfiable, byte_range
+
+CONTENT = b'0123456789'
+CONTENT_NAME = 'textbook_images/ab/ab' + 'c' * 62 + '.jpg'
+
+
+class ByteRangeTests(SimpleTestCase):
+    def byte_range(self, header, size=len(CONTENT), **headers):
+        request = RequestFactory().get('/media/cover.jpg', HTTP_RANGE=header, **headers)
+        return byte_range(request, size, '"etag"', 1000)
+
+    def test_ranges(self):
+        self.assertEqual(self.byte_range('bytes=2-5'), (2, 5))
+        self.assertEqual(self.byte_range('bytes=2-'), (2, 9))
+        self.assertEqual(self.byte_range('bytes=2-100'), (2, 9))
+        self.assertEqual(self.byte_range('bytes=-3'), (7, 9))
+        self.assertEqual(self.byte_range('bytes=-100'), (0, 9))
+
+    def test_whole_file(self):
+        for header in ('bytes=5-2', 'bytes=-', 'bytes=0-1,4-5', 'items=0-1'):
+            with self.subTest(header=header):
+                self.assertIsNone(self.byte_range(header))
+
+    def test_not_satisfiable(self):
+        for header, size in (('bytes=10-', 10), ('bytes=-0', 10), ('bytes=0-', 0), ('bytes=-5', 0)):
+            with self.subTest(header=header, size=size), self.assertRaises(RangeNotSatisfiable):
+                self.byte_range(header, size)
+
+    def test_if_range(self):
+        self.assertEqual(self.byte_range('bytes=2-5', HTTP_IF_RANGE='"etag"'), (2, 5))
+        self.assertIsNone(self.byte_range('bytes=2-5', HTTP_IF_RANGE='"other"'))
+
+
+class ServeMediaTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root, MEDIA_DELIVERY='django'))
+        for name, content in (('covers/old cover.jpg', CONTENT), (CONTENT_NAME, CONTENT), ('empty.jpg', b'')):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(content)
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', HTTP_HOST='localhost', **headers)
+
+    def test_whole_file(self):
+        response = self.get('covers/old%20cover.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], REVALIDATE)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_content_addressed_files_are_immutable(self):
+        self.assertEqual(self.get(CONTENT_NAME)['Cache-Control'], IMMUTABLE)
+
+    def test_range(self):
+        response = self.get(CONTENT_NAME, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+
+    def test_if_range(self):
+        etag = self.get(CONTENT_NAME)['ETag']
+        self.assertEqual(self.get(CONTENT_NAME, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=etag).status_code, 206)
+        response = self.get(CONTENT_NAME, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"changed"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+
+    def test_range_not_satisfiable(self):
+        for name, header, size in ((CONTENT_NAME, 'bytes=10-', 10), ('empty.jpg', 'bytes=-5', 0)):
+            with self.subTest(name=name):
+                response = self.get(name, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+    def test_not_modified(self):
+        response = self.get(CONTENT_NAME)
+        for headers in ({'HTTP_IF_NONE_MATCH': response['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}):
+            with self.subTest(headers=headers):
+                not_modified = self.get(CONTENT_NAME, **headers)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified['ETag'], response['ETag'])
+                self.assertEqual(not_modified['Cache-Control'], IMMUTABLE)
+
+    def test_missing_files(self):
+        for name in ('missing.jpg', 'covers/', '../settings.py'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 404)
+
+    @override_settings(MEDIA_DELIVERY='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_x_accel_redirect(self):
+        response = self.get('covers/old%20cover.jpg', HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/covers/old%20cover.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], REVALIDATE)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.get(CONTENT_NAME)['Cache-Control'], IMMUTABLE)
+
+    @override_settings(MEDIA_DELIVERY='x-sendfile')
+    def test_x_sendfile(self):
+        response = self.get(CONTENT_NAME)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, CONTENT_NAME))
+        self.assertEqual(response.content, b'')
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import threading
+
+from django.test import SimpleTestCase, override_settings
+
+from marketplace.metrics import Registry
+
+THREADS = 8
+REQUESTS = 200
+
+
+class RegistryTests(SimpleTestCase):
+    def setUp(self):
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        # Every request is due to flush.
+        self.enterContext(override_settings(METRICS_DIR=metrics_dir.name, METRICS_FLUSH_INTERVAL=0))
+        self.registry = Registry()
+        # Nothing left for its exit handler to write.
+        self.addCleanup(lambda: self.registry.samples.clear())
+
+    def test_concurrent_requests_and_scrapes(self):
+        labels = ('textbook-list', 'GET', '200')
+        start = threading.Barrier(THREADS + 1)
+        errors = []
+
+        def observe():
+            start.wait()
+            try:
+                for _ in range(REQUESTS):
+                    self.registry.observe_request(labels, {'http_request_db_queries': 1})
+            except Exception as exc:
+                errors.append(exc)
+
+        def scrape():
+            start.wait()
+            try:
+                while any(thread.is_alive() for thread in threads):
+                    self.registry.collect()
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=observe) for _ in range(THREADS)]
+        scraper = threading.Thread(target=scrape)
+        for thread in threads:
+            thread.start()
+        scraper.start()
+        for thread in threads + [scraper]:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        sample = self.registry.collect()[('http_request_db_queries', labels)]
+        self.assertEqual(sum(sample[:-1]), THREADS * REQUESTS)
+        self.assertEqual(sample[-1], THREADS * REQUESTS)
+        self.assertEqual([name for name in os.listdir(os.path.dirname(self.registry.path))
+                          if not name.endswith('.json')], [])
+
+    def test_snapshot_is_a_copy(self):
+        labels = ('textbook-list', 'GET', '200')
+        self.registry.observe_request(labels, {'http_request_db_queries': 1})
+        with self.registry.lock:
+            _, _, samples = self.registry._snapshot()
+        self.registry.observe_request(labels, {'http_request_db_queries': 1})
+        self.assertEqual(samples[0][2][-1], 1)
@@ -0,0 +1,99 @@
+import threading
+from collections import Counter
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from marketplace.models import Order, Textbook
+from marketplace.orders import OutOfStock, place_orders
+
+from .factories import create_textbook, create_user
+
+
+# Warming renditions on commit would run in other threads, outside the test.
+@override_settings(RENDITION_WARM_ON_SAVE=False)
+class ConcurrentOrderTests(TransactionTestCase):
+    buyers = 8
+
+    def test_last_copies_are_not_oversold(self):
+        initial_stock = 3
+        textbook = create_textbook(create_user(), stock=initial_stock)
+        buyers = [create_user(f'buyer{number}') for number in range(self.buyers)]
+        start = threading.Barrier(len(buyers))
+        outcomes, outcomes_lock = Counter(), threading.Lock()
+
+        def order(buyer):
+            try:
+                start.wait()
+                place_orders(buyer, [(textbook.pk, 1)])
+                outcome = 'placed'
+            except OutOfStock:
+                outcome = 'out of stock'
+            finally:
+                connection.close()
+            with outcomes_lock:
+                outcomes[outcome] += 1
+
+        threads = [threading.Thread(target=order, args=(buyer,)) for buyer in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        textbook.refresh_from_db()
+        sold = sum(Order.objects.filter(textbook=textbook).values_list('quantity', flat=True))
+        self.assertEqual(sold + textbook.stock, initial_stock)
+        self.assertEqual(outcomes, {'placed': initial_stock, 'out of stock': len(buyers) - initial_stock})
+
+
+@override_settings(RENDITION_WARM_ON_SAVE=False)
+class PlaceOrdersTests(TestCase):
+    def setUp(self):
+        self.seller = create_user()
+        self.buyer = create_user('buyer')
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.buyer)
+
+    def test_out_of_stock_rolls_back_the_cart(self):
+        in_stock = create_textbook(self.seller, stock=5)
+        short = create_textbook(self.seller, stock=1)
+        with self.assertRaises(OutOfStock):
+            place_orders(self.buyer, [(in_stock.pk, 2), (short.pk, 2)])
+        self.assertEqual(Textbook.objects.get(pk=in_stock.pk).stock, 5)
+        self.assertEqual(Textbook.objects.get(pk=short.pk).stock, 1)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_out_of_stock_is_a_conflict(self):
+        in_stock = create_textbook(self.seller, stock=5)
+        short = create_textbook(self.seller, stock=1)
+        response = self.client.post(reverse('order-checkout'), {'items': [
+            {'textbook': in_stock.pk, 'quantity': 2}, {'textbook': short.pk, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Textbook.objects.get(pk=in_stock.pk).stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_idempotency_key_replay(self):
+        textbook = create_textbook(self.seller, stock=5)
+        items = {'items': [{'textbook': textbook.pk, 'quantity': 2}]}
+        first = self.client.post(reverse('order-checkout'), items, format='json', HTTP_IDEMPOTENCY_KEY='cart-1')
+        retry = self.client.post(reverse('order-checkout'), items, format='json', HTTP_IDEMPOTENCY_KEY='cart-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Textbook.objects.get(pk=textbook.pk).stock, 3)
+
+    def test_idempotency_key_reused_for_other_items(self):
+        textbook = create_textbook(self.seller, stock=5)
+        first = self.client.post(reverse('order-list'), {'textbook': textbook.pk, 'quantity': 1},
+                                 format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        reused = self.client.post(reverse('order-list'), {'textbook': textbook.pk, 'quantity': 2},
+                                  format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(reused.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Textbook.objects.get(pk=textbook.pk).stock, 4)
@@ -0,0 +1,105 @@
+import json
+from base64 import b64decode, b64encode
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from marketplace.models import Textbook
+
+from .factories import create_textbook, create_user
+
+DAY = datetime(2025, 1, 10, tzinfo=timezone.utc)
+# (days after DAY, price) of the listings: ties on both, to be broken by id.
+LISTINGS = [(0, '10.00'), (1, '10.00'), (0, '12.00'), (1, '8.00'), (0, '10.00'), (2, '12.00'), (1, '10.00')]
+
+
+def cursor_of(link):
+    return parse_qs(urlparse(link).query)['cursor'][0]
+
+
+@override_settings(RENDITION_WARM_ON_SAVE=False)
+class KeysetPaginationTests(TestCase):
+    page_size = 3
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.seller = create_user()
+        self.textbooks = []
+        for days, price in LISTINGS:
+            textbook = create_textbook(self.seller, price=Decimal(price))
+            Textbook.objects.filter(pk=textbook.pk).update(created_at=DAY + timedelta(days=days))
+            textbook.refresh_from_db()
+            self.textbooks.append(textbook)
+        self.client = APIClient(HTTP_HOST='localhost')
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def expected(self, ordering):
+        field = ordering.lstrip('-')
+        ordered = sorted(self.textbooks, key=lambda textbook: (getattr(textbook, field), textbook.pk))
+        if ordering.startswith('-'):
+            ordered.reverse()
+        return [textbook.pk for textbook in ordered]
+
+    def walk(self, ordering, **params):
+        """The pages following ``next`` from the first, then ``previous`` back."""
+        page = self.get('/api/textbooks/', {'ordering': ordering, 'page_size': self.page_size, **params})
+        self.assertIsNone(page['previous'])
+        pages = [page]
+        while page['next']:
+            page = self.get(page['next'])
+            pages.append(page)
+        backwards = [pages[-1]]
+        while backwards[-1]['previous']:
+            backwards.append(self.get(backwards[-1]['previous']))
+        return pages, backwards[::-1]
+
+    def ids(self, pages):
+        return [[row['id'] for row in page['results']] for page in pages]
+
+    def test_next_and_previous_with_ties(self):
+        for ordering in ('-created_at', 'created_at', 'price', '-price'):
+            with self.subTest(ordering=ordering):
+                pages, backwards = self.walk(ordering)
+                expected = self.expected(ordering)
+                starts = range(0, len(expected), self.page_size)
+                self.assertEqual(self.ids(pages), [expected[start:start + self.page_size] for start in starts])
+                self.assertEqual(self.ids(backwards), self.ids(pages))
+                self.assertIsNone(pages[-1]['next'])
+
+    def test_cursor_of_another_ordering(self):
+        page = self.get('/api/textbooks/', {'ordering': 'price', 'page_size': self.page_size})
+        response = self.client.get('/api/textbooks/', {'ordering': '-created_at', 'cursor': cursor_of(page['next'])})
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor(self):
+        page = self.get('/api/textbooks/', {'ordering': 'price', 'page_size': self.page_size})
+        payload = json.loads(b64decode(cursor_of(page['next'])))
+        for cursor in (
+            cursor_of(page['next'])[:-4],
+            b64encode(json.dumps({**payload, 'v': 'cheap'}).encode()).decode(),
+            b64encode(json.dumps({**payload, 'id': None}).encode()).decode(),
+            'not base64!',
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/textbooks/', {'ordering': 'price', 'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_username(self):
+        other = create_textbook(create_user('other'))
+        pages, backwards = self.walk('-created_at', username='seller')
+        self.assertEqual(sum(self.ids(pages), []), self.expected('-created_at'))
+        self.assertNotIn(other.pk, sum(self.ids(pages), []))
+        self.assertEqual(self.ids(backwards), self.ids(pages))
+        # The seller's statistics come with the first page only.
+        self.assertEqual(pages[0]['seller']['listing_count'], len(LISTINGS))
+        self.assertNotIn('seller', pages[1])
+        self.assertIn('username=seller', pages[0]['next'])
@@ -0,0 +1,78 @@
+from django.contrib.auth.models import Group
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from marketplace.models import Order
+from marketplace.query_budget import assert_queries_do_not_grow
+from marketplace.views import UserViewSet
+
+from .factories import create_textbook, create_user
+
+GROWN_ROWS = 10
+
+
+# Every request reaches the database, instead of the cached response.
+@override_settings(CATALOG_CACHE_ENABLED=False, RENDITION_WARM_ON_SAVE=False)
+class QueriesDoNotGrowTests(TestCase):
+    def setUp(self):
+        self.buyer = create_user('buyer')
+        self.sellers = [create_user(f'seller{number}') for number in range(GROWN_ROWS)]
+        self.textbook = create_textbook(self.sellers[0])
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.buyer)
+
+    def fetch(self, url, **params):
+        def fetch():
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+        return fetch
+
+    def add_textbooks(self):
+        # A seller each, one user lookup per row would show.
+        for seller in self.sellers[1:]:
+            create_textbook(seller)
+
+    def test_list(self):
+        assert_queries_do_not_grow(self.fetch(reverse('textbook-list')), self.add_textbooks)
+
+    def test_list_card_representation(self):
+        assert_queries_do_not_grow(self.fetch(reverse('textbook-list'), representation='card'), self.add_textbooks)
+
+    def test_search(self):
+        assert_queries_do_not_grow(self.fetch(reverse('textbook-search'), q='algebra'), self.add_textbooks)
+
+    def test_detail(self):
+        assert_queries_do_not_grow(
+            self.fetch(reverse('textbook-detail', args=[self.textbook.pk])), self.add_textbooks,
+        )
+
+    def test_order_list(self):
+        Order.objects.create(textbook=self.textbook, buyer=self.buyer, quantity=1)
+
+        def add_orders():
+            for seller in self.sellers[1:]:
+                Order.objects.create(textbook=create_textbook(seller), buyer=self.buyer, quantity=1)
+
+        assert_queries_do_not_grow(self.fetch(reverse('order-list')), add_orders)
+
+    def test_current_user(self):
+        def add_groups():
+            self.buyer.groups.add(*(Group.objects.create(name=f'group{number}') for number in range(GROWN_ROWS)))
+
+        assert_queries_do_not_grow(self.fetch(reverse('user-detail')), add_groups)
+
+    def test_users(self):
+        view = UserViewSet.as_view({'get': 'list'})
+        groups = [Group.objects.create(name=f'group{number}') for number in range(GROWN_ROWS)]
+
+        def fetch():
+            request = APIRequestFactory().get('/users/', HTTP_HOST='localhost')
+            force_authenticate(request, self.buyer)
+            self.assertEqual(view(request).status_code, 200)
+
+        def add_users():
+            for number in range(GROWN_ROWS):
+                create_user(f'member{number}').groups.add(*groups)
+
+        assert_queries_do_not_grow(fetch, add_users)
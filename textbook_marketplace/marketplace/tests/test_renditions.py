@@ -0,0 +1,48 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from marketplace.renditions import rendition_size_keys, warm_image
+
+from .factories import create_user, image_file
+
+
+def rendition_files():
+    sized = os.path.join(settings.MEDIA_ROOT, '__sized__')
+    return sorted(name for _, _, names in os.walk(sized) for name in names)
+
+
+@override_settings(RENDITION_WARM_ON_SAVE=True)
+class WarmOnSaveTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.seller = create_user()
+        self.client = APIClient(HTTP_HOST='localhost')
+
+    def test_create_leaves_the_renditions_to_the_warm_job(self):
+        with mock.patch('marketplace.signals.schedule_warm_renditions') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/textbooks/', {
+                    'title': 'Algebra', 'author': 'Author', 'school_class': '7', 'publisher': 'Publisher',
+                    'price': '10.00', 'condition': 'New', 'image': image_file(),
+                }, format='multipart', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.seller)}')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(rendition_files(), [])
+        name = schedule.call_args.args[0]
+
+        # The URLs of the response are the ones the warm job creates.
+        self.assertEqual(warm_image(name, rendition_size_keys()), (2, 0, 0))
+        image = response.json()['image']
+        self.assertEqual(
+            sorted(os.path.basename(image[key]) for key in ('preview', 'detail')), rendition_files(),
+        )
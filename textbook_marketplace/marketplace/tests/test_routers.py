@@ -0,0 +1,102 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, router, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from marketplace.metrics import Registry
+from marketplace.models import Textbook
+from marketplace.routers import STICKY_COOKIE, read_alias
+
+from .factories import create_user, image_file
+
+REPLICA = 'replica1'
+
+
+# DB_REPLICAS configures the replica, e.g. DB_REPLICAS=replica; under test it
+# mirrors the primary's test database. Rows are committed, for the replica's
+# connection to see them, and TestCase's transaction would route every read
+# to the primary.
+@unittest.skipUnless(REPLICA in settings.DATABASES, 'DB_REPLICAS is not set')
+@override_settings(CATALOG_CACHE_ENABLED=False, RENDITION_WARM_ON_SAVE=False)
+class ReplicaRoutingTests(TransactionTestCase):
+    # Only the configured ones, the runner sets up every alias listed.
+    databases = {'default', REPLICA} & set(settings.DATABASES)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        self.enterContext(override_settings(
+            METRICS_DIR=metrics_dir.name,
+            MIDDLEWARE=['marketplace.middleware.MetricsMiddleware', *settings.MIDDLEWARE],
+        ))
+        self.registry = Registry()
+        self.enterContext(mock.patch('marketplace.middleware.registry', self.registry))
+        self.addCleanup(lambda: self.registry.samples.clear())
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.seller = create_user()
+        self.token = f'Bearer {AccessToken.for_user(self.seller)}'
+
+    def get(self, client, **extra):
+        """The aliases ``GET /api/textbooks/`` ran queries on."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = client.get('/api/textbooks/', **extra)
+        self.assertEqual(response.status_code, 200)
+        return {alias for alias, queries in (('default', primary), (REPLICA, replica)) if queries}
+
+    def post(self, client):
+        response = client.post('/api/textbooks/', {
+            'title': 'Algebra', 'author': 'Author', 'school_class': '7', 'publisher': 'Publisher',
+            'price': '10.00', 'condition': 'New', 'image': image_file(),
+        }, format='multipart', HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, 201, response.content)
+        return response
+
+    def test_get_reads_from_the_replica(self):
+        self.assertEqual(self.get(APIClient(HTTP_HOST='localhost')), {REPLICA})
+
+    def test_cookie_pins_a_writer_to_the_primary(self):
+        client = APIClient(HTTP_HOST='localhost')
+        response = self.post(client)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.get(client), {'default'})
+
+    def test_token_pins_a_writer_to_the_primary(self):
+        self.post(APIClient(HTTP_HOST='localhost'))
+        # Another client without the cookie, with the same user's token.
+        self.assertEqual(self.get(APIClient(HTTP_HOST='localhost'), HTTP_AUTHORIZATION=self.token), {'default'})
+        # Other users still read from the replica.
+        other = f'Bearer {AccessToken.for_user(create_user("buyer"))}'
+        self.assertEqual(self.get(APIClient(HTTP_HOST='localhost'), HTTP_AUTHORIZATION=other), {REPLICA})
+
+    def test_transactions_read_from_the_primary(self):
+        token = read_alias.set(REPLICA)
+        try:
+            self.assertEqual(router.db_for_read(Textbook), REPLICA)
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Textbook), 'default')
+        finally:
+            read_alias.reset(token)
+
+    def test_queries_are_counted_per_alias(self):
+        client = APIClient(HTTP_HOST='localhost')
+        self.get(client)
+        replica_queries = self.registry.samples[('db_queries_total', (REPLICA,))][0]
+        self.assertGreater(replica_queries, 0)
+        self.assertNotIn(('db_queries_total', ('default',)), self.registry.samples)
+
+        self.post(client)
+        self.get(client)
+        self.assertGreater(self.registry.samples[('db_queries_total', ('default',))][0], 0)
+        self.assertEqual(self.registry.samples[('db_queries_total', (REPLICA,))][0], replica_queries)
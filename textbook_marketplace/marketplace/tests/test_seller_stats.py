@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from marketplace.models import SellerStats, Textbook
+from marketplace.seller_stats import STATS_FIELDS, recompute_seller_stats
+
+from .factories import create_textbook, create_user
+
+
+def stats_values(seller):
+    return SellerStats.objects.filter(pk=seller.pk).values(*STATS_FIELDS).get()
+
+
+@override_settings(RENDITION_WARM_ON_SAVE=False)
+class SellerStatsTests(TestCase):
+    def setUp(self):
+        self.seller = create_user()
+
+    def assertMatchesRecompute(self):
+        incremental = stats_values(self.seller)
+        recompute_seller_stats([self.seller.pk])
+        self.assertEqual(incremental, stats_values(self.seller))
+        return incremental
+
+    def test_signals_keep_the_row_equal_to_a_recompute(self):
+        cheapest = create_textbook(self.seller, price=Decimal('5.00'))
+        repriced = create_textbook(self.seller, price=Decimal('10.00'))
+        latest = create_textbook(self.seller, price=Decimal('20.00'))
+        self.assertEqual(self.assertMatchesRecompute()['listing_count'], 3)
+
+        # The highest price moves down, to be looked up again.
+        latest = Textbook.objects.get(pk=latest.pk)
+        latest.price = Decimal('15.00')
+        latest.save()
+        repriced = Textbook.objects.get(pk=repriced.pk)
+        repriced.price = Decimal('12.50')
+        repriced.save(update_fields=['price'])
+        self.assertEqual(self.assertMatchesRecompute()['max_price'], Decimal('15.00'))
+
+        # The lowest price and the latest listing go.
+        Textbook.objects.get(pk=cheapest.pk).delete()
+        Textbook.objects.get(pk=latest.pk).delete()
+        values = self.assertMatchesRecompute()
+        self.assertEqual(
+            (values['listing_count'], values['price_sum'], values['min_price'], values['max_price']),
+            (1, Decimal('12.50'), Decimal('12.50'), Decimal('12.50')),
+        )
+        self.assertEqual(values['last_listed_at'], repriced.created_at)
+
+        Textbook.objects.get(pk=repriced.pk).delete()
+        self.assertEqual(self.assertMatchesRecompute(), {
+            'listing_count': 0, 'price_sum': Decimal('0.00'), 'min_price': None, 'max_price': None,
+            'last_listed_at': None,
+        })
+
+    def test_recompute_repairs_a_drifted_empty_row(self):
+        SellerStats.objects.create(
+            seller=self.seller, listing_count=0, price_sum=Decimal('3.00'), min_price=Decimal('3.00'),
+            max_price=Decimal('3.00'), last_listed_at=timezone.now(),
+        )
+        self.assertEqual(recompute_seller_stats(), 0)
+        self.assertEqual(stats_values(self.seller), {
+            'listing_count': 0, 'price_sum': Decimal('0.00'), 'min_price': None, 'max_price': None,
+            'last_listed_at': None,
+        })
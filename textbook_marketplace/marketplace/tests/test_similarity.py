@@ -0,0 +1,52 @@
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from marketplace import similarity
+from marketplace.similarity import SimilarityIndex, build_index, get_similarity_index
+
+from .factories import create_textbook, create_user
+
+
+class GetSimilarityIndexTests(TestCase):
+    def setUp(self):
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        self.enterContext(override_settings(SIMILARITY_INDEX_DIR=index_dir.name, SIMILARITY_REFRESH_SECONDS=0))
+        self.enterContext(mock.patch.dict(
+            similarity._state, {'index': None, 'build': None, 'checked_at': None, 'refreshing': False},
+        ))
+        self.seller = create_user()
+        self.built = create_textbook(self.seller, title='Algebra for beginners')
+        build_index(index_dir.name)
+
+    def test_refreshes_new_listings(self):
+        created = create_textbook(self.seller, title='Algebra for experts')
+        index = get_similarity_index()
+        self.assertEqual(index.search(self.built, 10), [created.pk])
+
+    def test_searches_while_refreshing(self):
+        index = get_similarity_index()
+        refreshing, release = threading.Event(), threading.Event()
+        found, refreshes = [], []
+
+        def slow_refresh(self):
+            refreshing.set()
+            refreshes.append(release.wait(5))
+
+        def search():
+            refreshing.wait(5)
+            # Neither waits for the refresh under way nor starts another.
+            found.append(get_similarity_index())
+            release.set()
+
+        with mock.patch.object(SimilarityIndex, 'refresh', slow_refresh):
+            thread = threading.Thread(target=search)
+            thread.start()
+            self.assertIs(get_similarity_index(), index)
+            thread.join()
+        self.assertEqual(found, [index])
+        self.assertEqual(refreshes, [True])
+        self.assertFalse(similarity._state['refreshing'])
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from marketplace.models import Textbook
+from marketplace.storage import textbook_image_storage
+
+from .factories import create_textbook, create_user, image_file
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name, RENDITION_WARM_ON_SAVE=False))
+
+
+class SharedImageTests(MediaRootMixin, TestCase):
+    def test_identical_images_share_a_file(self):
+        seller = create_user()
+        first = create_textbook(seller, image=image_file('first.png'))
+        second = create_textbook(seller, image=image_file('second.PNG'))
+        other = create_textbook(seller, image=image_file('other.png', color='blue'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertTrue(textbook_image_storage.is_content_addressed(first.image.name))
+
+    def test_file_is_deleted_with_its_last_listing(self):
+        seller = create_user()
+        first = create_textbook(seller, image=image_file())
+        second = create_textbook(seller, image=image_file())
+        name = first.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(textbook_image_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(textbook_image_storage.exists(name))
+
+    def test_rendering_twice_keeps_one_rendition(self):
+        name = '__sized__/textbook_images/ab/' + 'ab' * 32 + '-crop-c0-5__0-5-324x420-90.jpg'
+        self.assertEqual(textbook_image_storage.save(name, ContentFile(b'first')), name)
+        self.assertEqual(textbook_image_storage.save(name, ContentFile(b'second')), name)
+        directory = os.path.dirname(textbook_image_storage.path(name))
+        self.assertEqual(os.listdir(directory), [os.path.basename(name)])
+        with textbook_image_storage.open(name) as file:
+            self.assertEqual(file.read(), b'second')
+
+
+class ReleaseRaceTests(MediaRootMixin, TransactionTestCase):
+    def test_release_waits_for_a_save_of_the_same_bytes(self):
+        seller = create_user()
+        deleted = create_textbook(seller, image=image_file())
+        name = deleted.image.name
+        stored, write_row = threading.Event(), threading.Event()
+
+        def save():
+            # A listing uploading the same cover: the file is found in
+            # storage, the row referencing it is written later.
+            try:
+                with transaction.atomic():
+                    self.assertEqual(textbook_image_storage.save('cover.png', image_file()), name)
+                    stored.set()
+                    write_row.wait()
+                    create_textbook(seller, image=name)
+            finally:
+                stored.set()
+                connection.close()
+
+        def delete():
+            try:
+                # Releases the image once the deletion commits.
+                Textbook.objects.filter(pk=deleted.pk).delete()
+            finally:
+                connection.close()
+
+        saver = threading.Thread(target=save)
+        saver.start()
+        stored.wait()
+        deleter = threading.Thread(target=delete)
+        deleter.start()
+        # Let the release reach the lock before the row is written.
+        time.sleep(0.2)
+        write_row.set()
+        saver.join()
+        deleter.join()
+
+        self.assertEqual(list(Textbook.objects.values_list('image', flat=True)), [name])
+        self.assertTrue(textbook_image_storage.exists(name))
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from marketplace.models import Suggestion
+from marketplace.suggest import rebuild_suggestions
+
+from .factories import create_textbook, create_user
+
+
+def title_count(title):
+    return Suggestion.objects.filter(kind='title', normalized=title.casefold()).values_list(
+        'listing_count', flat=True,
+    ).first()
+
+
+@override_settings(RENDITION_WARM_ON_SAVE=False)
+class SuggestionCountTests(TestCase):
+    def test_saves_and_deletes_keep_counts(self):
+        seller = create_user()
+        first = create_textbook(seller, title='Algebra')
+        create_textbook(seller, title='  algebra ')
+        self.assertEqual(title_count('Algebra'), 2)
+        first.title = 'Geometry'
+        first.save()
+        self.assertEqual((title_count('Algebra'), title_count('Geometry')), (1, 1))
+        first.delete()
+        self.assertEqual(title_count('Geometry'), 0)
+
+    def test_rebuild_drops_unused_terms(self):
+        seller = create_user()
+        create_textbook(seller, title='Algebra').delete()
+        create_textbook(seller, title='Geometry')
+        self.assertEqual(rebuild_suggestions(), 3)
+        self.assertIsNone(title_count('Algebra'))
+        self.assertEqual(title_count('Geometry'), 1)
+
+
+@override_settings(RENDITION_WARM_ON_SAVE=False)
+class RebuildRaceTests(TransactionTestCase):
+    def test_save_during_a_rebuild_is_counted_once(self):
+        seller = create_user()
+        create_textbook(seller, title='Algebra')
+        locked, scan = threading.Event(), threading.Event()
+
+        def pause_after_lock(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if sql.startswith('LOCK TABLE'):
+                locked.set()
+                scan.wait()
+            return result
+
+        def rebuild():
+            try:
+                with connection.execute_wrapper(pause_after_lock):
+                    rebuild_suggestions()
+            finally:
+                locked.set()
+                connection.close()
+
+        def save():
+            try:
+                create_textbook(seller, title='Geometry')
+            finally:
+                connection.close()
+
+        rebuilder = threading.Thread(target=rebuild)
+        rebuilder.start()
+        locked.wait()
+        saver = threading.Thread(target=save)
+        saver.start()
+        # Let the save write its row and wait for the suggestions lock.
+        time.sleep(0.3)
+        scan.set()
+        rebuilder.join()
+        saver.join()
+
+        self.assertEqual((title_count('Algebra'), title_count('Geometry')), (1, 1))
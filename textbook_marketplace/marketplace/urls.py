@@ -1,23 +1,53 @@
 # backend/textbook_marketplace/marketplace/urls.py
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 from rest_framework.routers import DefaultRouter
-from . import views
-from .views import ProtectedView, SignupView, CustomTokenObtainPairView, TextbookViewSet, UserViewSet, OrderViewSet, UserDetailView
+from . import async_views, views
+from .views import ProtectedView, SignupView, CustomTokenObtainPairView, TextbookViewSet, UserViewSet, OrderViewSet
 
 from rest_framework_simplejwt.views import (
     TokenRefreshView,
     TokenVerifyView,
 )
 
+# Under ASGI the read heavy endpoints are served by their async variants.
+if settings.ASYNC_VIEWS:
+    TextbookListView = async_views.AsyncTextbookListView
+    TextbookDetailView = async_views.AsyncTextbookDetailView
+    TextbookImageView = async_views.AsyncTextbookImageView
+    SellerDetailView = async_views.AsyncSellerDetailView
+    UserDetailView = async_views.AsyncUserDetailView
+else:
+    TextbookListView = views.TextbookListView
+    TextbookDetailView = views.TextbookDetailView
+    TextbookImageView = views.TextbookImageView
+    SellerDetailView = views.SellerDetailView
+    UserDetailView = views.UserDetailView
+
 urlpatterns = [
-    path('textbooks/', views.TextbookListView.as_view(), name='textbook-list'),
-    path('textbook/<int:pk>/', views.TextbookDetailView.as_view(), name='textbook-detail'),
-    path('textbook/<int:pk>/image/', views.TextbookImageView.as_view()),
+    path('textbooks/', TextbookListView.as_view(), name='textbook-list'),
+    path('textbooks/search/', views.TextbookSearchView.as_view(), name='textbook-search'),
+    path('textbooks/suggest/', views.TextbookSuggestView.as_view(), name='textbook-suggest'),
+    path('textbooks/changes/', views.TextbookChangesView.as_view(), name='textbook-changes'),
+    re_path(r'^textbooks/export\.(?P<export_format>ndjson|csv)$', views.TextbookExportView.as_view(),
+            name='textbook-export'),
+    path('textbooks/import/', views.TextbookImportView.as_view(), name='textbook-import'),
+    path('textbook/<int:pk>/', TextbookDetailView.as_view(), name='textbook-detail'),
+    path('textbook/<int:pk>/similar/', views.SimilarTextbooksView.as_view(), name='textbook-similar'),
+    path('textbook/<int:pk>/image/', TextbookImageView.as_view(), name='textbook-image'),
     path('textbook/create/', TextbookViewSet.as_view({'post': 'create'}), name='textbook_create'),
+    path('sellers/<str:username>/', SellerDetailView.as_view(), name='seller-detail'),
+    path('orders/', OrderViewSet.as_view({'get': 'list', 'post': 'create'}), name='order-list'),
+    path('orders/checkout/', OrderViewSet.as_view({'post': 'checkout'}), name='order-checkout'),
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('token/verify/', TokenVerifyView.as_view(), name='token_verify'),
+    path('cache/stats/', views.CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
     path('protected/', ProtectedView.as_view(), name='protected'),
     path('signup/', SignupView.as_view(), name='signup'),
     path('users/me/', UserDetailView.as_view(), name='user-detail'),
 ]
+
+# An event stream holds a sync worker for as long as it is open.
+if settings.ASYNC_VIEWS:
+    urlpatterns.append(path('textbooks/live/', async_views.AsyncTextbookLiveView.as_view(), name='textbook-live'))
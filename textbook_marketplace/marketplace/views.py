@@ -1,3 +1,5 @@
+import zipfile
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, viewsets, permissions
@@ -9,15 +11,46 @@ from rest_framework.permissions import (
     BasePermission,
     SAFE_METHODS,
 )
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.parsers import MultiPartParser
 
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
+from .cache import (
+    cache_catalog_response,
+    cache_stats,
+    detail_cache_key,
+    image_cache_key,
+    list_cache_key,
+    not_modified,
+    textbook_etag,
+)
+from .catalog_import import FORMATS, CatalogImporter, import_format, read_rows
+from .changes import changes_since, decode_token, encode_token
+from .export import CONTENT_TYPES, aiter_export, iter_export
+from .metrics import PROMETHEUS_CONTENT_TYPE, registry, timer
 from .models import Textbook, User, Order
+from .fieldsets import LIST_COLUMNS, get_fieldset, list_rows, row_value
+from .filters import TextbookExportFilter, TextbookFilter, facet_counts
+from .orders import IDEMPOTENCY_KEY_MAX_LENGTH, place_orders
+from .pagination import KeysetPagination, OrderPagination
+from .renditions import schedule_warm_renditions
+from .search import search_textbooks
+from .seller_stats import get_seller_stats
+from .similarity import FIELDS as SIMILARITY_FIELDS, get_similarity_index
+from .suggest import suggest
 from .serializers import (
     TextbookSerializer,
     SignupSerializer,
     UserSerializer,
+    UserTokenObtainPairSerializer,
     OrderSerializer,
+    OrderItemSerializer,
+    CheckoutSerializer,
+    SellerStatsSerializer,
 )
 
 
@@ -29,36 +62,253 @@ class IsAuthenticatedOrReadOnly(BasePermission):
     
 
 class TextbookListView(APIView):
+    pagination_class = KeysetPagination
+    filterset_class = TextbookFilter
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    query_budget = 5
+
+    @cache_catalog_response(list_cache_key)
     def get(self, request):
-        username = request.query_params.get('username', None)
-        if username:
-            textbooks = Textbook.objects.filter(seller__username=username)
-        else:
-            textbooks = Textbook.objects.all()
-            
-        serializer = TextbookSerializer(textbooks, many=True)
-        return Response(serializer.data)
+        serializer_class, fields = get_fieldset(request)
+        queryset = Textbook.objects.select_related('seller')
+        filterset = self.filterset_class(request.query_params, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        textbooks = filterset.qs
+
+        paginator = self.pagination_class()
+        rows, serialize = list_rows(textbooks, serializer_class, fields, keep=LIST_COLUMNS)
+        page = paginator.paginate_queryset(rows, request, view=self)
+        with timer('serialize'):
+            data = serialize(page)
+        response = paginator.get_paginated_response(data)
+        # Facets don't change while paging through one filter set, so they are
+        # only computed for the first page.
+        if paginator.cursor is None:
+            response.data['facets'] = facet_counts(textbooks)
+            username = filterset.form.cleaned_data['username']
+            if username:
+                stats = get_seller_stats(username)
+                response.data['seller'] = SellerStatsSerializer(stats).data if stats is not None else None
+        return response
     
     def post(self, request):
-        serializer = TextbookSerializer(data=request.data)
+        # The serializer takes the seller from the request.
+        serializer = TextbookSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            serializer.save(seller=request.user)
+            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TextbookSearchView(APIView):
+    default_limit = 20
+    max_limit = 100
+    query_budget = 4
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'q': ['This query parameter is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+
+        serializer_class, fields = get_fieldset(request)
+        queryset, serialize = list_rows(Textbook.objects.select_related('seller'), serializer_class, fields, keep=['id'])
+        textbooks, fuzzy = search_textbooks(queryset, query, max(limit, 1))
+        with timer('serialize'):
+            data = serialize(textbooks)
+        return Response({'fuzzy': fuzzy, 'results': data})
+
+
+class TextbookSuggestView(APIView):
+    default_limit = 5
+    max_limit = 20
+    query_budget = 2
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'q': ['This query parameter is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        return Response(suggest(query, max(limit, 1)))
+
+
+class TextbookChangesView(APIView):
+    """
+    Listings saved and deleted since ``?since=``, the ``next`` token of the
+    previous page; without it, the whole catalog.
+    """
+    default_limit = 100
+    max_limit = 1000
+    query_budget = 3
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = decode_token(since)
+            except ValueError:
+                raise ValidationError({'since': ['Invalid token.']})
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        limit = max(limit, 1)
+
+        changes = changes_since(since or None, limit + 1)
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        saved = [change.textbook_id for change in changes if not change.deleted]
+        serializer_class, fields = get_fieldset(request)
+        queryset, serialize = list_rows(Textbook.objects.select_related('seller'), serializer_class, fields, keep=['id'])
+        rows = {row_value(row, 'id'): row for row in queryset.filter(pk__in=saved)} if saved else {}
+        with timer('serialize'):
+            data = serialize([rows[pk] for pk in saved if pk in rows])
+        return Response({
+            'next': encode_token(changes[-1]) if changes else request.query_params.get('since'),
+            'has_more': has_more,
+            'results': data,
+            # Also the listings deleted since their change was read, their
+            # tombstones come in a later page.
+            'deleted': [change.textbook_id for change in changes if change.textbook_id not in rows],
+        })
+
+
 class TextbookDetailView(APIView):
+    query_budget = 3
 
+    @cache_catalog_response(lambda request, pk: detail_cache_key(pk))
     def get(self, request, pk):
-        textbook = get_object_or_404(Textbook, pk=pk)
-        serializer = TextbookSerializer(textbook)
-        return Response(serializer.data)
+        textbook = get_object_or_404(Textbook.objects.select_related('seller'), pk=pk)
+        etag = textbook_etag(textbook)
+        last_modified = int(textbook.updated_at.timestamp())
+        # Unchanged for this client, answer before serializing anything.
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        with timer('serialize'):
+            data = TextbookSerializer(textbook).data
+        response = Response(data, headers={'ETag': etag})
+        response.last_modified = last_modified
+        return response
+
+
+class SimilarTextbooksView(APIView):
+    default_limit = 10
+    max_limit = 50
+    # Neighbours asked for beyond the limit, for listings deleted since the
+    # index was built.
+    spare = 5
+    query_budget = 4
+
+    def get(self, request, pk):
+        textbook = get_object_or_404(Textbook.objects.only(*SIMILARITY_FIELDS), pk=pk)
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        with timer('similarity'):
+            neighbours = get_similarity_index().search(textbook, max(limit, 1) + self.spare)
+
+        serializer_class, fields = get_fieldset(request)
+        queryset, serialize = list_rows(Textbook.objects.select_related('seller'), serializer_class, fields, keep=['id'])
+        rows = {row_value(row, 'id'): row for row in queryset.filter(pk__in=neighbours)}
+        textbooks = [rows[neighbour] for neighbour in neighbours if neighbour in rows][:max(limit, 1)]
+        with timer('serialize'):
+            data = serialize(textbooks)
+        return Response({'results': data})
+
+
+class SellerDetailView(APIView):
+    query_budget = 2
+
+    def get(self, request, username):
+        stats = get_seller_stats(username)
+        if stats is None:
+            raise Http404
+        return Response(SellerStatsSerializer(stats).data)
 
 
 class TextbookImageView(APIView): 
+    query_budget = 2
+
+    @cache_catalog_response(lambda request, pk: image_cache_key(pk))
     def get(self, request, pk):
-        textbook = get_object_or_404(Textbook, pk=pk)
-        return Response({'image': textbook.image.url})
+        # The stored name is all the URL is built from.
+        image = get_object_or_404(Textbook.objects.values_list('image', flat=True), pk=pk)
+        with timer('images'):
+            url = Textbook(image=image).image.url if image else None
+        return Response({'image': url})
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """For views choosing their own content type, ``Accept: text/csv`` must not fail with 406."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class TextbookExportView(APIView):
+    """
+    ``textbooks/export.ndjson`` and ``textbooks/export.csv``: the catalog,
+    filtered by ``TextbookExportFilter``, streamed in constant memory.
+    """
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, export_format):
+        filterset = TextbookExportFilter(request.query_params, queryset=Textbook.objects.all(), request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        queryset = filterset.qs
+        # Rows are read after the view (and the replica routing) has returned,
+        # keep the database chosen for this request.
+        queryset = queryset.using(queryset.db)
+        # ASGI servers would read a sync iterator into memory before sending it.
+        stream = aiter_export if settings.ASYNC_VIEWS else iter_export
+        response = StreamingHttpResponse(
+            stream(queryset, export_format, request=request), content_type=CONTENT_TYPES[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="textbooks.{export_format}"'
+        return response
+
+
+class TextbookImportView(APIView):
+    """
+    Multipart ``file`` (CSV or NDJSON, see ``marketplace.catalog_import``)
+    and optional ``images`` ZIP, imported as listings of the user. Answers
+    with the created and updated counts and the errors of skipped rows.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('format') or import_format(upload.name)
+        if file_format not in FORMATS:
+            return Response(
+                {'format': [f'Upload a .csv or .ndjson file, or set format to one of {", ".join(FORMATS)}.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            importer = CatalogImporter(request.user, images=request.FILES.get('images'))
+        except zipfile.BadZipFile:
+            return Response({'images': ['Not a ZIP archive.']}, status=status.HTTP_400_BAD_REQUEST)
+        report = importer.run(read_rows(upload.file, file_format))
+        if settings.RENDITION_WARM_ON_SAVE:
+            for name in importer.images:
+                schedule_warm_renditions(name)
+        return Response(report)
 
 
 class ProtectedView(APIView):
@@ -88,14 +338,14 @@ class PersonalCabinetView(APIView):
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
-    serializer_class = TokenObtainPairSerializer
+    serializer_class = UserTokenObtainPairSerializer
 
     def get_queryset(self):
         return User.objects.all()
 
 
 class TextbookViewSet(viewsets.ModelViewSet):
-    queryset = Textbook.objects.all()
+    queryset = Textbook.objects.select_related('seller')
     serializer_class = TextbookSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
@@ -109,15 +359,72 @@ class TextbookViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=400)
 
 
+class CatalogCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats())
+
+
+def metrics(request):
+    """Request histograms of all workers for Prometheus to scrape."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.prefetch_related('groups', 'user_permissions')
     serializer_class = UserSerializer
 
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderViewSet(viewsets.GenericViewSet):
+    """
+    The orders of the authenticated buyer. ``create`` orders one textbook,
+    ``checkout`` a cart of them, see marketplace.orders for stock and the
+    ``Idempotency-Key`` header.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderPagination
     serializer_class = OrderSerializer
 
+    def get_queryset(self):
+        return Order.objects.filter(buyer=self.request.user)
+
+    def list(self, request):
+        rows, serialize = list_rows(self.get_queryset(), OrderSerializer, None, keep=['order_date'])
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        with timer('serialize'):
+            data = serialize(page)
+        return paginator.get_paginated_response(data)
+
+    def create(self, request):
+        serializer = OrderItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        orders, created = self.place(request, [serializer.validated_data])
+        return self.placed_response(OrderSerializer(orders[0]).data, created)
+
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        orders, created = self.place(request, serializer.validated_data['items'])
+        return self.placed_response({'orders': OrderSerializer(orders, many=True).data}, created)
+
+    def place(self, request, items):
+        key = request.headers.get('Idempotency-Key')
+        if key is not None and not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise ValidationError({'Idempotency-Key': [
+                f'Must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters long.'
+            ]})
+        return place_orders(request.user, [(item['textbook'], item['quantity']) for item in items], key)
+
+    def placed_response(self, data, created):
+        if created:
+            return Response(data, status=status.HTTP_201_CREATED)
+        return Response(data, headers={'Idempotent-Replayed': 'true'})
+
 
 @api_view(['GET'])
 def get_user_data(request):
@@ -129,8 +436,12 @@ def get_user_data(request):
 
 class UserDetailView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 3
 
     def get(self, request):
         user = request.user
+        if user.get_deferred_fields():
+            # Built from the token claims, the serializer needs the whole row.
+            user = User.objects.get(pk=user.pk)
         serializer = UserSerializer(user)
         return Response(serializer.data)
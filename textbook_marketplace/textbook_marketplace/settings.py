@@ -11,13 +11,16 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import copy
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-from decouple import config
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 
 
 # Quick-start development settings - unsuitable for production
@@ -48,6 +51,7 @@ INSTALLED_APPS = [
     # 'rest_framework.authtoken',
     'rest_framework',
     'rest_framework_simplejwt',
+    'django_filters',
     'corsheaders',
     "marketplace",
     'versatileimagefield',
@@ -100,9 +104,99 @@ DATABASES = {
     }
 }
 
+# How each process (e.g. gunicorn worker) connects to the database:
+#   request     a new connection per request
+#   persistent  connections are reused for DB_CONN_MAX_AGE seconds and checked
+#               before reuse
+#   pool        a psycopg pool of DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE
+#               connections, checked on checkout. Use it under ASGI, where
+#               every request runs its queries on a new thread and can't reuse
+#               a persistent connection.
+DB_CONNECTION_MODE = config('DB_CONNECTION_MODE', default='persistent')
+
+if DB_CONNECTION_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_CONNECTION_MODE == 'pool':
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=4, cast=int),
+            # Seconds a request waits for a free connection before failing.
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+        },
+    }
+elif DB_CONNECTION_MODE != 'request':
+    raise ImproperlyConfigured(f'Unknown DB_CONNECTION_MODE {DB_CONNECTION_MODE!r}')
+
+# Read replicas for safe requests, see marketplace.routers. Comma separated
+# name[@host[:port]] entries connecting like the primary, e.g.
+# "textbooks@replica1,textbooks@replica2:5433". An empty name is the
+# primary's, without a host the primary's server is used (a second local
+# database is enough to try it).
+DB_REPLICAS = config('DB_REPLICAS', default='', cast=Csv())
+# Seconds clients read from the primary after a write.
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+REPLICA_STICKY_CACHE_ALIAS = 'default'
+
+for index, replica in enumerate(DB_REPLICAS, start=1):
+    name, _, location = replica.partition('@')
+    host, _, port = location.partition(':')
+    DATABASES[f'replica{index}'] = {
+        **copy.deepcopy(DATABASES['default']),
+        'NAME': name or DATABASES['default']['NAME'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+        # Tests only create the primary's database.
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['marketplace.routers.PrimaryReplicaRouter']
+
+if DB_REPLICAS:
+    MIDDLEWARE.insert(0, 'marketplace.middleware.ReplicaRoutingMiddleware')
+
 
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='textbook-marketplace'),
+    }
+}
+
+# Response cache of the catalog endpoints, see marketplace.cache.
+CATALOG_CACHE_ENABLED = config('CATALOG_CACHE_ENABLED', default=True, cast=bool)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# How long suggestions for one and two character prefixes are cached, see
+# marketplace.suggest.
+SUGGEST_CACHE_TIMEOUT = config('SUGGEST_CACHE_TIMEOUT', default=60, cast=int)
+
+# Where build_similarity_index writes the similar listings index, and how
+# often workers look for a new build and new listings, see
+# marketplace.similarity.
+SIMILARITY_INDEX_DIR = config('SIMILARITY_INDEX_DIR', default=os.path.join(BASE_DIR, 'similarity_index'))
+SIMILARITY_REFRESH_SECONDS = config('SIMILARITY_REFRESH_SECONDS', default=30, cast=int)
+
+# Rows fetched and encoded at a time by the catalog export, see marketplace.export.
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Rows written per bulk_create/bulk_update by the catalog import, and the
+# largest cover image it accepts, see marketplace.catalog_import.
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=1000, cast=int)
+IMPORT_MAX_IMAGE_SIZE = config('IMPORT_MAX_IMAGE_SIZE', default=10 * 1024 * 1024, cast=int)
+
+# Most textbooks one checkout can order, see marketplace.orders.
+CHECKOUT_MAX_ITEMS = config('CHECKOUT_MAX_ITEMS', default=50, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -146,7 +240,11 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'marketplace.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'marketplace.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
@@ -168,6 +266,12 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # This is the URL that serves the media files
 MEDIA_URL = '/media/'
 
+# Who sends media files, see marketplace.media: 'django' (the worker),
+# 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd).
+MEDIA_DELIVERY = config('MEDIA_DELIVERY', default='django')
+# The nginx `internal` location aliased to MEDIA_ROOT.
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+
 # AUTHENTICATION_BACKENDS = (
 #     'allauth.account.auth_backends.AuthenticationBackend',
 # )
@@ -176,6 +280,45 @@ SITE_ID = 1
 
 AUTH_PASSWORD_VALIDATORS = []
 
+# Debug aid: fail requests that run more queries than their view's
+# query_budget, see marketplace.query_budget. Views without a budget are
+# checked against QUERY_BUDGET_DEFAULT unless it is None.
+QUERY_BUDGET_ENABLED = config('QUERY_BUDGET_ENABLED', default=False, cast=bool)
+QUERY_BUDGET_DEFAULT = None
+
+if QUERY_BUDGET_ENABLED:
+    MIDDLEWARE.insert(0, 'marketplace.middleware.QueryBudgetMiddleware')
+
+# Route the catalog and user views to their async variants, set it when
+# serving textbook_marketplace.asgi with uvicorn, see marketplace.async_views.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+# Live listing updates at /api/textbooks/live/ under ASGI, see
+# marketplace.live: how writes reach every worker's subscribers (empty turns
+# them off), events queued for a subscriber before it is dropped,
+# subscribers per worker, and seconds between keepalives of idle streams.
+LIVE_TRANSPORT = config('LIVE_TRANSPORT', default='marketplace.live.PostgresTransport')
+LIVE_QUEUE_SIZE = config('LIVE_QUEUE_SIZE', default=1000, cast=int)
+LIVE_MAX_SUBSCRIBERS = config('LIVE_MAX_SUBSCRIBERS', default=5000, cast=int)
+LIVE_HEARTBEAT_SECONDS = config('LIVE_HEARTBEAT_SECONDS', default=15, cast=float)
+
+# Server-Timing headers and Prometheus histograms at /metrics, see
+# marketplace.metrics. All workers of a deployment must share METRICS_DIR.
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'textbook_marketplace_metrics'))
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=1.0, cast=float)
+
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'marketplace.middleware.MetricsMiddleware')
+
+# Where CachedJWTAuthentication keeps authenticated users: shared, local,
+# stateless or off, see marketplace.authentication. shared evicts a changed
+# user for every worker sharing CACHE_BACKEND.
+JWT_USER_CACHE = config('JWT_USER_CACHE', default='shared')
+JWT_USER_CACHE_ALIAS = 'default'
+JWT_USER_CACHE_TIMEOUT = config('JWT_USER_CACHE_TIMEOUT', default=60, cast=int)
+JWT_USER_CACHE_SIZE = config('JWT_USER_CACHE_SIZE', default=10_000, cast=int)
+
 SIMPLE_JWT = {
     'USER_MODEL': 'marketplace.User',
 }
@@ -193,3 +336,13 @@ VERSATILEIMAGEFIELD_RENDITION_KEY_SETS = {
 VERSATILEIMAGEFIELD_SETTINGS = {
     'jpeg_resize_quality': 90,
 }
+
+# Create the renditions of a saved textbook's image in the background instead
+# of in the first request that lists it, see marketplace.renditions.
+RENDITION_WARM_ON_SAVE = config('RENDITION_WARM_ON_SAVE', default=True, cast=bool)
+RENDITION_WARM_WORKERS = config('RENDITION_WARM_WORKERS', default=2, cast=int)
+
+# Serialize list pages from values() rows instead of DRF serializers, see
+# marketplace.fast_serializers. Its rendition URLs rely on warmed renditions,
+# run warm_renditions for the stored images before turning it on.
+FAST_SERIALIZERS = config('FAST_SERIALIZERS', default=False, cast=bool)
@@ -1,10 +1,15 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
-from django.conf.urls.static import static
+from django.urls import path, include, re_path
 # from django.conf import settings
 from . import settings
+from marketplace.media import serve_media
+from marketplace.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('marketplace.urls')), 
- ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('metrics', metrics, name='metrics'),
+    re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.*)$', serve_media, name='media'),
+ ]